@@ -0,0 +1,575 @@
+'''
+Offline backtest of compounding policies on the closed deals of a currency bucket
+(account + currency).
+Every closed deal is replayed with the deal size the compounder would have given it, using the
+ratio optimizer maths of main.optimize_bot and optimizer.calc_max_funds_per_deal_batch.
+Policies (compound interval, allocation split, MAD cap) are simulated as numpy arrays,
+sweeps are split over worker processes.
+
+    python backtest.py --export deal_history.json --days 365
+    python backtest.py --deals deal_history.json --bots-json bot_config/bots.json \
+        --intervals 1,6,24,168 --mad-caps bots,1,3,5 --random-splits 50
+
+The model:
+- A deal earns its historical profit per unit of max funds (final_profit / max funds of the
+  settings it ran with), scaled to the max funds per deal the policy gives the bot.
+- The bots are sized from the bucket balance of the last compounding, the balance grows
+  with the simulated profit of the deals that closed.
+- A deal is skipped when the policy gives the bot no allocation, or when the bot already
+  has MAD of its simulated deals open. Skipped deals are not replaced by later deals.
+'''
+
+import argparse
+import json
+import os
+import time
+
+from concurrent.futures import ProcessPoolExecutor
+from dataclasses import dataclass
+from datetime import datetime, timedelta, timezone
+
+import numpy as np
+
+import optimizer
+
+SECONDS_PER_HOUR = 3600
+
+
+def parse_timestamp(value: str) -> float:
+    '''
+    :param value: 3c timestamp, i.e. 2022-02-10T10:00:00.000Z
+    :return: epoch seconds
+    '''
+    return datetime.fromisoformat(value.replace('Z', '+00:00')).timestamp()
+
+
+def deal_currency(deal: dict) -> str:
+    '''
+    Currency the deal spends, same as main.get_currency
+    :param deal: deal from the 3c api
+    :return: currency code
+    '''
+    pair = deal['pair'].split('_')
+    return pair[0] if deal['base_order_volume_type'] == 'quote_currency' else pair[1]
+
+
+def deal_funds(allocated, min_funds, max_active_deals, single):
+    '''
+    Vectorized ratio mode of main.optimize_bot, arguments are broadcast against each other
+    :param allocated: funds allocated to the bot
+    :param min_funds: max funds per deal of the minimal BO:SO settings of the bot
+    :param max_active_deals: MAD cap of multi bots
+    :param single: True for single bots
+    :return: tuple of arrays with (max funds per deal, MAD)
+    '''
+    potential_max_deals = allocated / min_funds
+    floor_max_deals = np.floor(potential_max_deals)
+
+    # Multi bots get MAD deals when the allocation fits more deals, else the deals that fit
+    over_max_deals = potential_max_deals >= max_active_deals
+    funds = np.where(
+        over_max_deals,
+        allocated / max_active_deals,
+        allocated / np.maximum(floor_max_deals, 1)
+    )
+    mad = np.where(over_max_deals, max_active_deals, floor_max_deals)
+
+    # Single bots put the whole allocation in their deal
+    funds = np.where(single, allocated, funds)
+    mad = np.where(single, 1, mad)
+
+    # Not enough funds for 1 deal, the bot keeps the minimal settings
+    not_enough_funds = floor_max_deals < 1
+    funds = np.where(not_enough_funds, min_funds, funds)
+    mad = np.where(not_enough_funds, 1, mad)
+
+    return funds, mad
+
+
+@dataclass
+class History:
+    '''
+    Closed deals of a currency bucket as arrays, deals are sorted by open step
+    '''
+    account_id: int
+    currency: str
+    start: float
+    step_hours: float
+    steps: int
+    # per bot
+    bot_ids: np.ndarray
+    bot_names: list
+    min_funds: np.ndarray
+    single: np.ndarray
+    # bots.json allocation and MAD, NaN if the bot is not in bots.json
+    config_allocation: np.ndarray
+    config_mad: np.ndarray
+    # per deal
+    bot_index: np.ndarray
+    open_step: np.ndarray
+    close_step: np.ndarray
+    # seconds since start
+    opened_at: np.ndarray
+    closed_at: np.ndarray
+    # profit per unit of max funds
+    rate: np.ndarray
+
+    @property
+    def profit_per_bot(self):
+        '''
+        :return: summed profit rate of the deals of every bot
+        '''
+        return np.bincount(self.bot_index, weights=self.rate, minlength=len(self.bot_ids))
+
+
+def _bots_config_entries(bots_json, account_id, currency):
+    '''
+    :return: {bot_id: bots.json bot dict} of the bucket
+    '''
+    if not bots_json:
+        return {}
+    account = bots_json.get('accounts', {}).get(str(account_id), {})
+    return {
+        int(bot_id): bot
+        for bot_id, bot in account.get('currencies', {}).get(currency, {}).items()
+    }
+
+
+def load_history(deals, step_hours=1.0, min_volume=10.0, account_id=None, currency=None,
+                 bots_json=None):
+    '''
+    Builds the history of a single currency bucket
+    :param deals: list of closed deals from the 3c api
+    :param step_hours: hours per simulation step, deals and compounding happen on this grid
+    :param min_volume: minimum order volume the minimal BO:SO settings are based on
+    :param account_id: account of the bucket, defaults to the bucket with the most deals
+    :param currency: currency of the bucket
+    :param bots_json: parsed bots.json, for the allocations, MAD and single/multi bots
+    :return: History
+    '''
+    closed_deals = [
+        deal for deal in deals
+        if deal.get('closed_at') and deal.get('final_profit') is not None
+    ]
+    buckets = {}
+    for deal in closed_deals:
+        buckets.setdefault((int(deal['account_id']), deal_currency(deal)), []).append(deal)
+    if not buckets:
+        raise ValueError('No closed deals in the history')
+
+    if account_id is None:
+        account_id, currency = max(buckets, key=lambda bucket: len(buckets[bucket]))
+    bucket_deals = buckets.get((int(account_id), currency))
+    if not bucket_deals:
+        raise ValueError(f'No closed deals for account {account_id} {currency}')
+
+    opened_at = np.array([parse_timestamp(deal['created_at']) for deal in bucket_deals])
+    closed_at = np.array([parse_timestamp(deal['closed_at']) for deal in bucket_deals])
+    order = np.argsort(opened_at, kind='stable')
+    bucket_deals = [bucket_deals[index] for index in order]
+    opened_at, closed_at = opened_at[order], closed_at[order]
+
+    def deal_array(key, dtype=float):
+        return np.array([deal[key] for deal in bucket_deals], dtype=dtype)
+
+    # Max funds of the settings every deal ran with
+    deal_max_funds = optimizer.calc_max_funds_per_deal_batch(
+        deal_array('base_order_volume'),
+        deal_array('safety_order_volume'),
+        deal_array('max_safety_orders', np.int64),
+        deal_array('safety_order_step_percentage'),
+        deal_array('martingale_volume_coefficient'),
+        deal_array('martingale_step_coefficient')
+    )
+    rate = deal_array('final_profit') / deal_max_funds
+
+    bot_ids, bot_index = np.unique(deal_array('bot_id', np.int64), return_inverse=True)
+
+    # Minimal BO:SO settings of every bot, from its latest deal
+    latest = [np.flatnonzero(bot_index == index)[-1] for index in range(len(bot_ids))]
+    latest_deals = [bucket_deals[index] for index in latest]
+
+    def bot_array(key, dtype=float):
+        return np.array([deal[key] for deal in latest_deals], dtype=dtype)
+
+    boso_ratio = bot_array('base_order_volume') / bot_array('safety_order_volume')
+    buy_order = np.where(boso_ratio <= 1, min_volume, min_volume * boso_ratio)
+    safety_order = np.where(boso_ratio <= 1, buy_order / boso_ratio, min_volume)
+    min_funds = optimizer.calc_max_funds_per_deal_batch(
+        buy_order,
+        safety_order,
+        bot_array('max_safety_orders', np.int64),
+        bot_array('safety_order_step_percentage'),
+        bot_array('martingale_volume_coefficient'),
+        bot_array('martingale_step_coefficient')
+    )
+
+    config_entries = _bots_config_entries(bots_json, account_id, currency)
+    config_bots = [config_entries.get(int(bot_id), {}) for bot_id in bot_ids]
+    config_allocation = np.array([
+        float(bot.get('allocation') or 'nan') for bot in config_bots
+    ])
+    config_mad = np.array([float(bot.get('max_active_deals', 'nan')) for bot in config_bots])
+    # bots.json only has max_active_deals for multi bots
+    single = np.array([bool(bot) and 'max_active_deals' not in bot for bot in config_bots])
+
+    start = opened_at.min()
+    step_seconds = step_hours * SECONDS_PER_HOUR
+    open_step = ((opened_at - start) // step_seconds).astype(np.int64)
+    close_step = ((closed_at - start) // step_seconds).astype(np.int64)
+
+    return History(
+        account_id=int(account_id),
+        currency=currency,
+        start=start,
+        step_hours=step_hours,
+        steps=int(close_step.max()) + 1,
+        bot_ids=bot_ids,
+        bot_names=[deal.get('bot_name', str(deal['bot_id'])) for deal in latest_deals],
+        min_funds=min_funds,
+        single=single,
+        config_allocation=config_allocation,
+        config_mad=config_mad,
+        bot_index=bot_index,
+        open_step=open_step,
+        close_step=close_step,
+        opened_at=opened_at - start,
+        closed_at=closed_at - start,
+        rate=rate,
+    )
+
+
+@dataclass
+class Policies:
+    '''
+    Compounding policies as arrays, one row per policy
+    '''
+    # compounding interval in simulation steps
+    interval_steps: np.ndarray
+    # (policies, bots) allocation of the bucket balance
+    allocation: np.ndarray
+    # (policies, bots) MAD cap of multi bots
+    mad_cap: np.ndarray
+    # description of every policy for the results
+    descriptions: list
+
+    def __len__(self):
+        return len(self.interval_steps)
+
+    def chunk(self, start, end):
+        '''
+        :return: Policies with the rows start:end
+        '''
+        return Policies(
+            self.interval_steps[start:end],
+            self.allocation[start:end],
+            self.mad_cap[start:end],
+            self.descriptions[start:end]
+        )
+
+
+def build_policies(history, intervals, mad_caps, splits, random_splits=0, total_allocation=1.0,
+                   seed=1):
+    '''
+    Grid of every interval, MAD cap and allocation split
+    :param history: History of the bucket
+    :param intervals: compounding intervals in hours
+    :param mad_caps: MAD caps, 'bots' uses max_active_deals of bots.json
+    :param splits: allocation splits: 'bots' (bots.json), 'equal' or 'profit' (historical profit)
+    :param random_splits: amount of extra random allocation splits
+    :param total_allocation: share of the balance allocated over the bots of the bucket
+    :param seed: seed of the random splits
+    :return: Policies
+    '''
+    bot_count = len(history.bot_ids)
+    split_rows = []
+    for split in splits:
+        if split == 'bots':
+            if np.isnan(history.config_allocation).all():
+                raise ValueError('The bots split needs a bots.json with the bots of the bucket')
+            weights = np.nan_to_num(history.config_allocation)
+            split_rows.append(('bots', weights))
+            continue
+        if split == 'equal':
+            weights = np.ones(bot_count)
+        elif split == 'profit':
+            weights = np.clip(history.profit_per_bot, 0, None)
+            if not weights.any():
+                weights = np.ones(bot_count)
+        else:
+            raise ValueError(f'Unknown allocation split {split}, use bots, equal or profit')
+        split_rows.append((split, total_allocation * weights / weights.sum()))
+
+    rng = np.random.default_rng(seed)
+    for index in range(random_splits):
+        split_rows.append((f'random-{index}', total_allocation * rng.dirichlet(np.ones(bot_count))))
+
+    mad_rows = []
+    for mad_cap in mad_caps:
+        if mad_cap == 'bots':
+            mad_rows.append(('bots', np.nan_to_num(history.config_mad, nan=1.0)))
+        else:
+            mad_rows.append((int(mad_cap), np.full(bot_count, float(mad_cap))))
+
+    interval_steps, allocation, mad_cap, descriptions = [], [], [], []
+    for interval in intervals:
+        for mad_name, mad_row in mad_rows:
+            for split_name, split_row in split_rows:
+                interval_steps.append(max(1, round(interval / history.step_hours)))
+                allocation.append(split_row)
+                mad_cap.append(mad_row)
+                descriptions.append({
+                    'interval_hours': interval,
+                    'mad_cap': mad_name,
+                    'split': split_name,
+                    'allocation': [round(float(value), 4) for value in split_row],
+                })
+
+    return Policies(
+        np.array(interval_steps, dtype=np.int64),
+        np.array(allocation),
+        np.array(mad_cap),
+        descriptions
+    )
+
+
+def simulate(history, policies, balance):
+    '''
+    Replays the history for every policy at once, deals are visited one by one in the order
+    they started, the policies are the vectorized dimension
+    :param history: History of the bucket
+    :param policies: Policies to simulate
+    :param balance: starting balance of the bucket
+    :return: dict of arrays with a value per policy
+    '''
+    policy_count = len(policies)
+    policy_rows = np.arange(policy_count)
+    balances = np.full(policy_count, float(balance))
+    sizing_balances = balances.copy()
+    peaks = balances.copy()
+    max_drawdowns = np.zeros(policy_count)
+    deals_taken = np.zeros(policy_count, dtype=np.int64)
+    # (steps, policies) simulated profit by the step it is realized in
+    pending_profit = np.zeros((history.steps, policy_count))
+    # (policies, bots, max MAD) close time of the simulated open deals, -inf for a free slot
+    max_mad = int(max(1, np.nanmax(policies.mad_cap)))
+    open_deals = np.full((policy_count, len(history.bot_ids), max_mad), -np.inf)
+
+    event_steps = np.union1d(history.open_step, history.close_step)
+    # Deals are sorted by open step, deals opening in a step are a slice
+    open_starts = np.searchsorted(history.open_step, event_steps, 'left')
+    open_ends = np.searchsorted(history.open_step, event_steps, 'right')
+
+    previous_step = -1
+    for step, open_start, open_end in zip(event_steps, open_starts, open_ends):
+        # Compound with the balance of the last compounding step since the previous event
+        last_compound = (step // policies.interval_steps) * policies.interval_steps
+        sizing_balances = np.where(last_compound > previous_step, balances, sizing_balances)
+        previous_step = step
+
+        for deal in range(open_start, open_end):
+            bot = history.bot_index[deal]
+            allocation = policies.allocation[:, bot]
+            funds, mad = deal_funds(
+                sizing_balances * allocation,
+                history.min_funds[bot],
+                policies.mad_cap[:, bot],
+                history.single[bot]
+            )
+
+            bot_open_deals = open_deals[:, bot]
+            open_count = (bot_open_deals > history.opened_at[deal]).sum(axis=1)
+            taken = (open_count < mad) & (allocation > 0)
+
+            # The earliest close time is a free slot when the bot is under its MAD
+            free_slots = bot_open_deals.argmin(axis=1)
+            bot_open_deals[policy_rows[taken], free_slots[taken]] = history.closed_at[deal]
+
+            pending_profit[history.close_step[deal]] += np.where(
+                taken, history.rate[deal] * funds, 0.0
+            )
+            deals_taken += taken
+
+        balances += pending_profit[step]
+        peaks = np.maximum(peaks, balances)
+        max_drawdowns = np.maximum(max_drawdowns, (peaks - balances) / peaks)
+
+    return {
+        'final_balance': balances,
+        'profit': balances - balance,
+        'max_drawdown': max_drawdowns,
+        'deals_taken': deals_taken,
+    }
+
+
+def _simulate_chunk(arguments):
+    history, policies, balance = arguments
+    return simulate(history, policies, balance)
+
+
+def run_sweep(history, policies, balance, workers=None):
+    '''
+    Simulates the policies in chunks over worker processes
+    :param history: History of the bucket
+    :param policies: Policies to simulate
+    :param balance: starting balance of the bucket
+    :param workers: amount of processes, defaults to the cpu count. 1 runs in process.
+    :return: dict of arrays with a value per policy
+    '''
+    workers = max(1, min(workers or os.cpu_count() or 1, len(policies)))
+    if workers == 1:
+        return simulate(history, policies, balance)
+
+    bounds = np.linspace(0, len(policies), workers + 1).astype(int)
+    chunks = [
+        (history, policies.chunk(start, end), balance)
+        for start, end in zip(bounds[:-1], bounds[1:]) if end > start
+    ]
+    with ProcessPoolExecutor(max_workers=workers) as executor:
+        results = list(executor.map(_simulate_chunk, chunks))
+
+    return {key: np.concatenate([result[key] for result in results]) for key in results[0]}
+
+
+def export_history(path, days):
+    '''
+    Writes the deals closed in the last days, in all accounts, to a json file
+    :param path: json file to write
+    :param days: amount of days of history
+    '''
+    # pylint: disable=import-outside-toplevel
+    import fetcher
+    import main
+
+    main.cold_start()
+    cutoff = datetime.now(timezone.utc) - timedelta(days=days)
+
+    deals = []
+    for forced_mode in main.FORCED_MODES:
+        finished_deals = fetcher.Paginator(
+            lambda offset, limit, forced_mode=forced_mode: main.p3cw_scheduler.request(
+                entity='deals',
+                action='',
+                payload={
+                    "scope": "finished",
+                    "limit": limit,
+                    "offset": offset,
+                    "order": "closed_at",
+                    "order_direction": "desc"
+                },
+                additional_headers={'Forced-Mode': forced_mode}
+            ),
+            main.deals_page_size,
+            prefetch=main.prefetch_pages
+        )
+        for deal in finished_deals:
+            if deal.get('closed_at') and parse_timestamp(deal['closed_at']) < cutoff.timestamp():
+                break
+            deals.append(deal)
+        if finished_deals.error:
+            raise RuntimeError(f'Could not get the {forced_mode} deals: {finished_deals.error}')
+
+    with open(path, 'w', encoding='UTF-8') as outfile:
+        json.dump(deals, outfile)
+    print(f'{len(deals)} deals written to {path}')
+
+
+def main():
+    '''
+    Exports the deal history or runs a policy sweep on it
+    '''
+    parser = argparse.ArgumentParser(description=__doc__.split('\n')[1])
+    parser.add_argument('--export', help='write the closed deals of the last --days to this file')
+    parser.add_argument('--days', type=float, default=365)
+    parser.add_argument('--deals', default='deal_history.json', help='closed deals json')
+    parser.add_argument('--bots-json', help='bots.json with the current allocations')
+    parser.add_argument('--account-id', type=int, help='defaults to the bucket with most deals')
+    parser.add_argument('--currency')
+    parser.add_argument('--balance', type=float, default=1000, help='starting bucket balance')
+    parser.add_argument('--min-volume', type=float, default=10, help='exchange minimum order')
+    parser.add_argument('--step-hours', type=float, default=1)
+    parser.add_argument('--intervals', default='1,6,24,168', help='compounding intervals (hours)')
+    parser.add_argument('--mad-caps', default='1,3,5', help="MAD caps, 'bots' uses bots.json")
+    parser.add_argument('--splits', default='equal,profit', help='bots, equal and/or profit')
+    parser.add_argument('--random-splits', type=int, default=0)
+    parser.add_argument('--total-allocation', type=float, default=1.0)
+    parser.add_argument('--seed', type=int, default=1)
+    parser.add_argument('--workers', type=int, help='processes, defaults to the cpu count')
+    parser.add_argument('--top', type=int, default=10, help='amount of policies to print')
+    parser.add_argument('--output', default='backtest_results.json')
+    options = parser.parse_args()
+
+    if options.export:
+        export_history(options.export, options.days)
+        return
+
+    with open(options.deals, 'r', encoding='UTF-8') as infile:
+        deals = json.load(infile)
+    bots_json = None
+    if options.bots_json:
+        with open(options.bots_json, 'r', encoding='UTF-8') as infile:
+            bots_json = json.load(infile)
+    if options.account_id is not None and not options.currency:
+        parser.error('--account-id needs --currency')
+
+    history = load_history(
+        deals,
+        step_hours=options.step_hours,
+        min_volume=options.min_volume,
+        account_id=options.account_id,
+        currency=options.currency,
+        bots_json=bots_json
+    )
+    policies = build_policies(
+        history,
+        intervals=[float(interval) for interval in options.intervals.split(',')],
+        mad_caps=options.mad_caps.split(','),
+        splits=[split for split in options.splits.split(',') if split],
+        random_splits=options.random_splits,
+        total_allocation=options.total_allocation,
+        seed=options.seed
+    )
+
+    started_at = time.perf_counter()
+    results = run_sweep(history, policies, options.balance, options.workers)
+    duration = time.perf_counter() - started_at
+
+    print(
+        f'{len(policies)} policies over {len(history.rate)} deals of '
+        f'{len(history.bot_ids)} bots ({history.account_id} {history.currency}, '
+        f'{history.steps * history.step_hours / 24:.0f} days) in {duration:.2f}s'
+    )
+    ranking = np.argsort(-results['final_balance'])
+    for index in ranking[:options.top]:
+        description = policies.descriptions[index]
+        print(
+            f"{results['final_balance'][index]:14.2f} {history.currency} "
+            f"drawdown {results['max_drawdown'][index]:6.2%} "
+            f"deals {results['deals_taken'][index]:6d}  "
+            f"every {description['interval_hours']}h, MAD {description['mad_cap']}, "
+            f"{description['split']} split"
+        )
+
+    with open(options.output, 'w', encoding='UTF-8') as outfile:
+        json.dump({
+            'account_id': history.account_id,
+            'currency': history.currency,
+            'bots': [
+                {'id': int(bot_id), 'name': name}
+                for bot_id, name in zip(history.bot_ids, history.bot_names)
+            ],
+            'balance': options.balance,
+            'duration': duration,
+            'policies': [
+                {
+                    **policies.descriptions[index],
+                    **{key: values[index].item() for key, values in results.items()}
+                }
+                for index in ranking
+            ],
+        }, outfile, indent=4)
+    print(f'Results written to {options.output}')
+
+
+if __name__ == '__main__':
+    main()
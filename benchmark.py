@@ -0,0 +1,213 @@
+'''
+End-to-end benchmark of compounder_start against mock_server.py at increasing fleet sizes.
+Every size runs in its own process with a fresh working directory, the results are written as json.
+
+    python benchmark.py --sizes 10,100,1000,10000 --latency 0.02 --output benchmark_results.json
+'''
+
+import argparse
+import json
+import math
+import os
+import platform
+import subprocess
+import sys
+import tempfile
+import time
+
+from datetime import datetime, timezone
+
+import mock_server
+
+REPO_DIR = os.path.dirname(os.path.abspath(__file__))
+
+
+def write_config(path, options, api_url):
+    '''
+    Writes the config.ini used by the benchmarked compounder
+    :param path: working directory of the run
+    :param options: parsed benchmark arguments
+    :param api_url: url of the mock server
+    '''
+    with open(os.path.join(path, 'config.ini'), 'w', encoding='UTF-8') as outfile:
+        outfile.write(
+            '[run_mode]\n'
+            f'test={options.test_mode}\n\n'
+            '[3commas]\n'
+            'key=benchmark\n'
+            'secret=benchmark\n'
+            f'api_url={api_url}\n\n'
+            '[concurrency]\n'
+            f'max_workers={options.max_workers}\n'
+            f'max_updates_in_flight={options.max_updates_in_flight}\n\n'
+            '[optimizer]\n'
+            f'mode={options.optimizer_mode}\n\n'
+            '[rate_limit]\n'
+            f'requests_per_second={options.requests_per_second}\n'
+            f'burst={options.requests_per_second}\n\n'
+            '[http]\n'
+            f'pool_size={max(options.max_workers, options.max_updates_in_flight)}\n'
+        )
+
+
+def run_compounder(result_path):
+    '''
+    Runs compounder_start once in the current (benchmark working) directory
+    :param result_path: json file to write the measurements to
+    '''
+    # pylint: disable=import-outside-toplevel
+    import main
+
+    timings = {'optimizer': 0.0, 'requests': 0.0}
+
+    def timed(name, func):
+        def wrapper(*args, **kwargs):
+            started_at = time.perf_counter()
+            try:
+                return func(*args, **kwargs)
+            finally:
+                timings[name] += time.perf_counter() - started_at
+        return wrapper
+
+    main.optimize_bot = timed('optimizer', main.optimize_bot)
+    main.p3cw_scheduler.request = timed('requests', main.p3cw_scheduler.request)
+
+    started_at = time.perf_counter()
+    started_cpu = time.process_time()
+    main.compounder_start()
+    wall_time = time.perf_counter() - started_at
+    cpu_time = time.process_time() - started_cpu
+
+    try:
+        import resource
+        # kB on linux
+        peak_memory_mb = resource.getrusage(resource.RUSAGE_SELF).ru_maxrss / 1024
+    except ImportError:
+        peak_memory_mb = None
+
+    with open(result_path, 'w', encoding='UTF-8') as outfile:
+        json.dump({
+            'wall_time': wall_time,
+            'cpu_time': cpu_time,
+            # optimize_bot runs sequentially, this is optimizer cpu time
+            'optimizer_time': timings['optimizer'],
+            # Summed over concurrent requests, can be larger than the wall time
+            'request_time': timings['requests'],
+            'api_calls': dict(main.p3cw_scheduler.endpoint_counts),
+            'retries': dict(main.p3cw_scheduler.retry_counts),
+            'peak_memory_mb': peak_memory_mb,
+        }, outfile)
+
+
+def benchmark_size(bots, options):
+    '''
+    Benchmarks a single fleet size
+    :param bots: amount of bots in the fleet
+    :param options: parsed benchmark arguments
+    :return: dict with the fleet size and measurements
+    '''
+    accounts = max(1, math.ceil(bots / options.bots_per_account))
+    fleet = mock_server.Fleet(
+        accounts=accounts,
+        bots=bots,
+        deals_per_bot=options.deals_per_bot,
+        seed=options.seed
+    )
+    server = mock_server.start(
+        fleet,
+        latency=options.latency,
+        throttle_rate=options.throttle_rate,
+        retry_after=options.retry_after,
+        seed=options.seed
+    )
+
+    try:
+        with tempfile.TemporaryDirectory() as path:
+            os.makedirs(os.path.join(path, 'bot_config'))
+            os.makedirs(os.path.join(path, 'logs'))
+            bots_json_path = os.path.join(path, 'bot_config', 'bots.json')
+            with open(bots_json_path, 'w', encoding='UTF-8') as outfile:
+                json.dump(fleet.bots_json(), outfile)
+            write_config(path, options, server.url)
+
+            result_path = os.path.join(path, 'result.json')
+            env = dict(os.environ, PYTHONPATH=os.pathsep.join(
+                [REPO_DIR] + ([os.environ['PYTHONPATH']] if os.environ.get('PYTHONPATH') else [])
+            ))
+            subprocess.run(
+                [sys.executable, os.path.abspath(__file__), '--run', result_path],
+                cwd=path,
+                env=env,
+                check=True,
+                stdout=None if options.verbose else subprocess.DEVNULL,
+                stderr=None if options.verbose else subprocess.DEVNULL
+            )
+            with open(result_path, 'r', encoding='UTF-8') as infile:
+                result = json.load(infile)
+    finally:
+        server.shutdown()
+        server.server_close()
+
+    return {
+        'bots': bots,
+        'accounts': accounts,
+        'deals': len(fleet.deals),
+        **result,
+        'server_requests': server.stats()['requests'],
+        'server_throttled': server.stats()['throttled'],
+    }
+
+
+def main():
+    '''
+    Runs the benchmark for every size and writes the results
+    '''
+    parser = argparse.ArgumentParser(description=__doc__.split('\n')[1])
+    parser.add_argument('--sizes', default='10,100,1000,10000', help='comma separated bot counts')
+    parser.add_argument('--bots-per-account', type=int, default=50)
+    parser.add_argument('--deals-per-bot', type=int, default=3)
+    parser.add_argument('--seed', type=int, default=1)
+    parser.add_argument('--latency', type=float, default=0.02, help='mock seconds per response')
+    parser.add_argument('--throttle-rate', type=float, default=0.0, help='share of 429 responses')
+    parser.add_argument('--retry-after', type=float, default=0.1)
+    parser.add_argument('--requests-per-second', type=float, default=1000,
+                        help='compounder rate limit, the real 3c limit makes large fleets slow')
+    parser.add_argument('--max-workers', type=int, default=8)
+    parser.add_argument('--max-updates-in-flight', type=int, default=4)
+    parser.add_argument('--optimizer-mode', default='ratio')
+    parser.add_argument('--test-mode', action='store_true', help='only plan, skip bots/update')
+    parser.add_argument('--output', default='benchmark_results.json')
+    parser.add_argument('--verbose', action='store_true', help='show the compounder output')
+    parser.add_argument('--run', help=argparse.SUPPRESS)
+    options = parser.parse_args()
+
+    if options.run:
+        run_compounder(options.run)
+        return
+
+    results = []
+    for bots in (int(size) for size in options.sizes.split(',')):
+        result = benchmark_size(bots, options)
+        results.append(result)
+        print(
+            f"{bots} bots: {result['wall_time']:.2f}s wall, "
+            f"{result['optimizer_time']:.2f}s optimizer, "
+            f"{sum(result['api_calls'].values())} api calls, "
+            f"{result['peak_memory_mb'] or 0:.0f} MB peak"
+        )
+
+    with open(options.output, 'w', encoding='UTF-8') as outfile:
+        json.dump({
+            'created_at': datetime.now(timezone.utc).isoformat(),
+            'python': platform.python_version(),
+            'options': {
+                key: value for key, value in vars(options).items()
+                if key not in ('run', 'verbose', 'output')
+            },
+            'results': results,
+        }, outfile, indent=4)
+    print(f'Results written to {options.output}')
+
+
+if __name__ == '__main__':
+    main()
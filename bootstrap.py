@@ -0,0 +1,92 @@
+'''
+Lazy initialization of everything that needs the network (ssm secrets, s3 files),
+importing the compounder modules has no side effects.
+'''
+
+import threading
+import time
+
+from concurrent.futures import ThreadPoolExecutor
+
+import logger
+import utils
+
+# Measures the cold start, from import until the first 3c request
+IMPORTED_AT = time.perf_counter()
+
+SECRET_PARAMETERS = [
+    "/3commas-compounder/3commas_key",
+    "/3commas-compounder/3commas_secret",
+    "/3commas-compounder/webhook_url",
+]
+
+_secrets = None
+_secrets_lock = threading.Lock()
+_initialized = False
+_initialize_lock = threading.Lock()
+_first_request_reported = False
+
+
+def get_secrets(config=None):
+    '''
+    Gets the secrets once, every secret is fetched in a single ssm call
+    :param config: parsed config.ini when running locally, None to use ssm
+    :return: dict with 3commas_key, 3commas_secret and webhook_url
+    '''
+    global _secrets  # pylint: disable=global-statement
+    with _secrets_lock:
+        if _secrets is None:
+            if config is not None:
+                # Running locally, get secrets from config.ini
+                _secrets = {
+                    "3commas_key": config.get('3commas', 'key'),
+                    "3commas_secret": config.get('3commas', 'secret'),
+                    "webhook_url": config.get('discord', 'webhook_url', fallback='')
+                }
+            else:
+                # Running in AWS Lambda, get secrets from system manager
+                _secrets = utils.get_param_dict_from_ssm(SECRET_PARAMETERS)
+        return _secrets
+
+
+def set_secrets(secrets):
+    '''
+    Uses the given secrets instead of fetching them, i.e. for a tenant worker
+    :param secrets: dict with 3commas_key, 3commas_secret and webhook_url
+    '''
+    global _secrets  # pylint: disable=global-statement
+    with _secrets_lock:
+        _secrets = secrets
+
+
+def initialize(tasks):
+    '''
+    Runs the network initialization tasks in parallel, once per container
+    :param tasks: functions without arguments, i.e. downloading bots.json and fetching secrets
+    :return: True if this was the cold start, False if already initialized
+    '''
+    global _initialized  # pylint: disable=global-statement
+    with _initialize_lock:
+        if _initialized:
+            return False
+        with ThreadPoolExecutor(max_workers=max(1, len(tasks))) as executor:
+            for future in [executor.submit(task) for task in tasks]:
+                # Re-raise initialization errors
+                future.result()
+        _initialized = True
+        return True
+
+
+def report_first_request():
+    '''
+    Logs the time between import and the first 3c request, only once
+    '''
+    global _first_request_reported  # pylint: disable=global-statement
+    if _first_request_reported:
+        return
+    _first_request_reported = True
+    logger.log(
+        'Cold start: %.3fs from import to first 3c request',
+        "INFO",
+        time.perf_counter() - IMPORTED_AT
+    )
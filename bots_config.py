@@ -0,0 +1,217 @@
+'''
+Loads bots.json, the file is validated and compiled into indexes once and kept in memory
+between (warm) runs, it is only compiled again when the file or the s3 object changed
+'''
+
+import hashlib
+import json
+import os
+import threading
+
+from dataclasses import dataclass
+
+import logger
+import utils
+
+# path: (file signature, content hash, compiled config)
+_loaded: dict[str, tuple] = {}
+# (bucket, key): etag of the downloaded object
+_etags: dict[tuple, str] = {}
+_lock = threading.Lock()
+
+
+@dataclass(slots=True)
+class BotEntry:
+    '''
+    Settings of a single bot in bots.json
+    '''
+    account_id: int
+    currency: str
+    bot_name: str
+    allocation: float
+    max_active_deals: int = 1
+    # False when the same pair is not scaled with max_active_deals
+    bot_same_pair_multiple: int | bool = False
+
+
+class BotsConfig:
+    '''
+    Validated bots.json, indexed by bot id
+    '''
+    __slots__ = ('bots', 'ignore_other_bots', 'errors', 'warnings')
+
+    def __init__(self):
+        # bot id: BotEntry, over all accounts
+        self.bots = {}
+        # account ids that only compound the bots in bots.json
+        self.ignore_other_bots = set()
+        # messages of everything that makes the file unusable
+        self.errors = []
+        # (account name, currency, allocation) of currencies allocated over 100%
+        self.warnings = []
+
+
+def _is_number(value):
+    return isinstance(value, (int, float)) and not isinstance(value, bool)
+
+
+def _parse_id(value):
+    try:
+        return int(value)
+    except ValueError:
+        return None
+
+
+def compile_config(user_config):
+    '''
+    Validates the parsed bots.json and builds the bot index
+    :param user_config: parsed bots.json
+    :return: BotsConfig, check its errors before using it
+    '''
+    compiled = BotsConfig()
+    errors = compiled.errors
+
+    accounts = user_config.get('accounts') if isinstance(user_config, dict) else None
+    if not isinstance(accounts, dict):
+        errors.append('bots.json needs an "accounts" object')
+        return compiled
+
+    for account_key, account in accounts.items():
+        account_id = _parse_id(account_key)
+        if account_id is None or not isinstance(account, dict):
+            errors.append(f'bots.json account {account_key} is not a valid account')
+            continue
+        if not isinstance(account.get('currencies'), dict):
+            errors.append(f'bots.json account {account_key} needs a "currencies" object')
+            continue
+
+        account_name = account.get('account_name', account_key)
+        if account.get('ignore_other_bots') is True:
+            compiled.ignore_other_bots.add(account_id)
+
+        for currency, currency_bots in account['currencies'].items():
+            if not isinstance(currency_bots, dict):
+                errors.append(f'bots.json {account_name} {currency} is not an object of bots')
+                continue
+
+            allocation = 0
+            for bot_key, bot in currency_bots.items():
+                bot_id = _parse_id(bot_key)
+                if bot_id is None or not isinstance(bot, dict):
+                    errors.append(f'bots.json {account_name} bot {bot_key} is not a valid bot')
+                    continue
+
+                bot_name = bot.get('bot_name', bot_key)
+                # If a bot doesn't have its allocation defined, the config can't be used
+                if not bot.get('allocation'):
+                    errors.append(
+                        f'{account_name} "{bot_name}" does not have an allocation defined'
+                    )
+                    continue
+                try:
+                    bot_allocation = float(bot['allocation'])
+                except (TypeError, ValueError):
+                    errors.append(f'{account_name} "{bot_name}" has an invalid allocation')
+                    continue
+
+                entry = BotEntry(account_id, currency, bot_name, bot_allocation)
+                if 'max_active_deals' in bot:
+                    if not _is_number(bot['max_active_deals']) or bot['max_active_deals'] < 1:
+                        errors.append(
+                            f'{account_name} "{bot_name}" has an invalid max_active_deals'
+                        )
+                        continue
+                    entry.max_active_deals = bot['max_active_deals']
+                # allow multiple deals with same pair
+                if bot.get('bot_same_pair_multiple'):
+                    if not _is_number(bot['bot_same_pair_multiple']):
+                        errors.append(
+                            f'{account_name} "{bot_name}" has an invalid bot_same_pair_multiple'
+                        )
+                        continue
+                    entry.bot_same_pair_multiple = bot['bot_same_pair_multiple']
+
+                if bot_id in compiled.bots:
+                    errors.append(f'bots.json has bot {bot_id} more than once')
+                    continue
+                compiled.bots[bot_id] = entry
+                allocation += bot_allocation
+
+            # Warn if risk is greater than 100%
+            if allocation > 1:
+                compiled.warnings.append((account_name, currency, allocation))
+
+    return compiled
+
+
+def _file_signature(path):
+    stat = os.stat(path)
+    return (stat.st_mtime_ns, stat.st_size)
+
+
+def _store(path, signature, body):
+    '''
+    Compiles the file content, unless it has the same hash as the cached config
+    :return: BotsConfig
+    '''
+    digest = hashlib.sha256(body).hexdigest()
+    with _lock:
+        loaded = _loaded.get(path)
+
+    if loaded is not None and loaded[1] == digest:
+        # Touched or re-downloaded without changes
+        compiled = loaded[2]
+    else:
+        try:
+            compiled = compile_config(json.loads(body))
+        except ValueError as error:
+            compiled = BotsConfig()
+            compiled.errors.append(f'bots.json is not valid json: {error}')
+
+    with _lock:
+        _loaded[path] = (signature, digest, compiled)
+    return compiled
+
+
+def load(path):
+    '''
+    Loads the compiled bots.json, only reading it again when the file changed.
+    The returned config is shared between runs, treat it as read only.
+    :param path: location of bots.json
+    :return: BotsConfig, None if the file does not exist
+    '''
+    if not os.path.exists(path):
+        return None
+
+    signature = _file_signature(path)
+    with _lock:
+        loaded = _loaded.get(path)
+        if loaded is not None and loaded[0] == signature:
+            return loaded[2]
+
+    with open(path, "rb") as infile:
+        body = infile.read()
+
+    return _store(path, signature, body)
+
+
+def refresh_from_s3(bucket, key, path):
+    '''
+    Revalidates bots.json with s3 (If-None-Match), only downloads it when the object changed
+    :param bucket: s3 bucket name
+    :param key: s3 object key
+    :param path: location to write bots.json to
+    '''
+    etag, body = utils.get_s3_object_if_changed(bucket, key, _etags.get((bucket, key)))
+
+    if body is None:
+        logger.log('bots.json did not change', "INFO")
+        return
+
+    logger.log('Downloaded updated bots.json', "INFO")
+    with open(path, 'wb') as outfile:
+        outfile.write(body)
+
+    _store(path, _file_signature(path), body)
+    with _lock:
+        _etags[(bucket, key)] = etag
@@ -0,0 +1,166 @@
+'''
+Small key/value caches for 3commas data that rarely changes between runs
+'''
+
+import json
+import os
+import threading
+import time
+
+from collections import OrderedDict
+
+
+def _cache_key(key) -> str:
+    '''
+    Joins tuple keys so they can be used as json object keys
+    :param key: tuple or single value
+    :return: string key
+    '''
+    if isinstance(key, tuple):
+        return '|'.join(str(part) for part in key)
+    return str(key)
+
+
+class _Flight:
+    '''
+    A fetch in progress that other threads asking for the same key wait on
+    '''
+    def __init__(self):
+        self.done = threading.Event()
+        self.value = None
+
+
+class TTLCache:
+    '''
+    Thread safe LRU cache with a time to live per entry.
+    When a path is given the entries are persisted as json, so warm lambda
+    containers (/tmp) and local runs can reuse them.
+    '''
+
+    def __init__(self, path=None, ttl=None, max_size=None):
+        '''
+        :param path: json file to persist the cache to, None keeps it in memory only
+        :param ttl: seconds an entry stays valid, None never expires
+        :param max_size: max amount of entries, least recently used are evicted first
+        '''
+        self.path = path
+        self.ttl = ttl
+        self.max_size = max_size
+        self._entries = OrderedDict()
+        self._in_flight = {}
+        self._lock = threading.Lock()
+
+    def _is_expired(self, stored_at: float, now: float) -> bool:
+        return self.ttl is not None and now - stored_at > self.ttl
+
+    def _get(self, cache_key: str):
+        # Needs to be called while holding the lock
+        entry = self._entries.get(cache_key)
+        if entry is None:
+            return None
+        stored_at, value = entry
+        if self._is_expired(stored_at, time.time()):
+            del self._entries[cache_key]
+            return None
+        self._entries.move_to_end(cache_key)
+        return value
+
+    def _evict(self):
+        # Needs to be called while holding the lock
+        if self.max_size is None:
+            return
+        while len(self._entries) > self.max_size:
+            self._entries.popitem(last=False)
+
+    def get(self, key):
+        '''
+        :param key: cache key
+        :return: cached value, None if missing or expired
+        '''
+        with self._lock:
+            return self._get(_cache_key(key))
+
+    def set(self, key, value):
+        '''
+        :param key: cache key
+        :param value: json serializable value
+        '''
+        cache_key = _cache_key(key)
+        with self._lock:
+            self._entries[cache_key] = (time.time(), value)
+            self._entries.move_to_end(cache_key)
+            self._evict()
+
+    def get_or_fetch(self, key, fetch):
+        '''
+        Gets the cached value or fetches it on a miss.
+        Concurrent misses for the same key are merged into a single fetch.
+        :param key: cache key
+        :param fetch: function without arguments returning the value, None results are not cached
+        :return: cached or fetched value
+        '''
+        cache_key = _cache_key(key)
+        with self._lock:
+            value = self._get(cache_key)
+            if value is not None:
+                return value
+
+            flight = self._in_flight.get(cache_key)
+            is_leader = flight is None
+            if is_leader:
+                flight = self._in_flight[cache_key] = _Flight()
+
+        if not is_leader:
+            flight.done.wait()
+            return flight.value
+
+        try:
+            flight.value = fetch()
+            if flight.value is not None:
+                self.set(key, flight.value)
+        finally:
+            with self._lock:
+                del self._in_flight[cache_key]
+            flight.done.set()
+
+        return flight.value
+
+    def load(self):
+        '''
+        Resets the cache to what is persisted on disk, dropping expired entries.
+        Without a path this clears the cache.
+        '''
+        entries = {}
+        if self.path and os.path.exists(self.path):
+            try:
+                with open(self.path, 'r', encoding='UTF-8') as infile:
+                    entries = {
+                        key: (stored_at, value)
+                        for key, (stored_at, value) in json.load(infile).items()
+                    }
+            except (ValueError, TypeError, OSError):
+                # Corrupt or unreadable cache file, start from scratch
+                entries = {}
+
+        now = time.time()
+        with self._lock:
+            self._entries = OrderedDict(
+                (key, entry) for key, entry in entries.items()
+                if not self._is_expired(entry[0], now)
+            )
+            self._evict()
+
+    def save(self):
+        '''
+        Persists the cache to disk if a path is configured
+        '''
+        if not self.path:
+            return
+
+        with self._lock:
+            entries = {key: list(entry) for key, entry in self._entries.items()}
+
+        tmp_path = f'{self.path}.tmp'
+        with open(tmp_path, 'w', encoding='UTF-8') as outfile:
+            json.dump(entries, outfile, separators=(',', ':'))
+        os.replace(tmp_path, self.path)
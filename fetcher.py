@@ -0,0 +1,93 @@
+'''
+Concurrent fetch helpers, fans out 3commas api requests over a thread pool
+'''
+
+from concurrent.futures import ThreadPoolExecutor
+
+# Default amount of 3c requests allowed in flight at the same time
+DEFAULT_MAX_WORKERS = 8
+
+max_workers = DEFAULT_MAX_WORKERS
+
+
+def set_max_workers(_max_workers: int):
+    '''
+    Sets the concurrency limit used by fan_out
+    :param _max_workers: max amount of requests in flight, 1 disables concurrency
+    '''
+    global max_workers  # pylint: disable=global-statement
+    max_workers = max(1, int(_max_workers))
+
+
+def fan_out(func, items, limit=None):
+    '''
+    Calls func for every item concurrently, bounded by max_workers
+    :param func: function taking a single item, usually wrapping a p3cw.request
+    :param items: iterable of items to call func with
+    :param limit: overrides max_workers for this call
+    :return: list of results in the same order as items
+    '''
+    items = list(items)
+    workers = max(1, int(limit or max_workers))
+
+    if workers == 1 or len(items) <= 1:
+        return [func(item) for item in items]
+
+    with ThreadPoolExecutor(max_workers=min(workers, len(items))) as executor:
+        return list(executor.map(func, items))
+
+
+class Paginator:
+    '''
+    Streams the records of a paginated 3c endpoint. The next page is requested in the
+    background while the consumer works through the current page, so at most 2 pages are
+    held in memory. A page shorter than page_size is the last page.
+
+    Errors are not raised, iteration stops and the error is kept in .error:
+        deals = Paginator(fetch_deals_page, 1000)
+        for deal in deals:
+            ...
+        if deals.error:
+            ...
+    '''
+    def __init__(self, fetch_page, page_size: int, prefetch: bool = True):
+        '''
+        :param fetch_page: function taking (offset, limit),
+            returns (error, records) like p3cw.request
+        :param page_size: amount of records to request per page
+        :param prefetch: request the next page while the current page is consumed
+        '''
+        self.fetch_page = fetch_page
+        self.page_size = max(1, int(page_size))
+        self.prefetch = prefetch
+        # error of the last iteration, empty if all pages were fetched
+        self.error: dict = {}
+
+    def _request(self, executor, offset):
+        if executor is None:
+            return self.fetch_page(offset, self.page_size)
+        return executor.submit(self.fetch_page, offset, self.page_size)
+
+    def __iter__(self):
+        self.error = {}
+        executor = ThreadPoolExecutor(max_workers=1) if self.prefetch else None
+        offset = 0
+        try:
+            next_page = self._request(executor, offset)
+            while next_page is not None:
+                error, records = next_page.result() if executor else next_page
+                if error:
+                    self.error = error
+                    return
+                records = records or []
+
+                # Only a full page can be followed by another page
+                offset += self.page_size
+                next_page = self._request(executor, offset) \
+                    if len(records) >= self.page_size else None
+
+                yield from records
+        finally:
+            if executor is not None:
+                # Don't wait for a prefetched page when the consumer stopped early
+                executor.shutdown(wait=False, cancel_futures=True)
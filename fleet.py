@@ -0,0 +1,148 @@
+'''
+Typed model of the live 3commas fleet: accounts, their bots and the balance per currency
+'''
+
+from dataclasses import dataclass, field
+from typing import Optional
+
+
+@dataclass(slots=True)
+class Bot:
+    '''
+    Settings of a compoundable 3c bot, the short names match bots.json and the optimizer
+    '''
+    id: int
+    account_id: int
+    name: str
+    type: str
+    strategy: str
+    pairs: list
+    # Currency the bot spends, the currency bucket it gets its allocation from
+    currency: str
+    bo: str
+    so: str
+    os: str
+    ss: str
+    sos: str
+    mstc: int
+    mad: int
+    adosp: int
+    tp: str
+    active_safety_orders_count: int
+    take_profit_type: str
+    strategy_list: list
+    market_code: Optional[str] = None
+
+    @classmethod
+    def from_api(cls, bot: dict, currency: str):
+        '''
+        :param bot: bot json from the 3c api
+        :param currency: currency the bot spends
+        :return: Bot
+        '''
+        return cls(
+            id=bot['id'],
+            account_id=bot['account_id'],
+            name=bot['name'],
+            type=bot['type'],
+            strategy=bot['strategy'],
+            pairs=bot['pairs'],
+            currency=currency,
+            bo=bot['base_order_volume'],
+            so=bot['safety_order_volume'],
+            os=bot['martingale_volume_coefficient'],
+            ss=bot['martingale_step_coefficient'],
+            sos=bot['safety_order_step_percentage'],
+            mstc=bot['max_safety_orders'],
+            mad=bot['max_active_deals'],
+            adosp=bot['allowed_deals_on_same_pair'],
+            tp=bot['take_profit'],
+            active_safety_orders_count=bot['active_safety_orders_count'],
+            take_profit_type=bot['take_profit_type'],
+            strategy_list=bot['strategy_list'],
+        )
+
+    def apply(self, settings: dict):
+        '''
+        Updates the settings after they got written to 3c
+        :param settings: dict with the new bo, so, mad and adosp
+        '''
+        self.bo = f"{settings['bo']}"
+        self.so = f"{settings['so']}"
+        self.mad = settings['mad']
+        self.adosp = settings['adosp']
+
+
+@dataclass(slots=True)
+class CurrencyBucket:
+    '''
+    Balance of a currency on an account and the bots compounding it
+    '''
+    currency: str
+    balance: float = 0.0
+    bots: list = field(default_factory=list)
+
+
+@dataclass(slots=True)
+class Account:
+    '''
+    3c exchange account with its compoundable bots, indexed by id and by currency
+    '''
+    id: int
+    name: str
+    forced_mode: str
+    bots: dict = field(default_factory=dict)
+    currencies: dict = field(default_factory=dict)
+    # bot id: coin sold by the bot (short) or None (long) of every enabled bot on the account.
+    # Deals of short bots that can't be compounded still reduce the balance of the sold coin.
+    enabled_bots: dict = field(default_factory=dict)
+
+    def add_bot(self, bot: Bot):
+        '''
+        :param bot: bot on this account
+        '''
+        self.bots[bot.id] = bot
+        bucket = self.currencies.get(bot.currency)
+        if bucket is None:
+            bucket = self.currencies[bot.currency] = CurrencyBucket(bot.currency)
+        bucket.bots.append(bot)
+
+    def balance(self, currency: str) -> float:
+        '''
+        :param currency: currency code
+        :return: balance available for compounding, 0 if no bot uses the currency
+        '''
+        bucket = self.currencies.get(currency)
+        return bucket.balance if bucket else 0.0
+
+
+class Fleet:
+    '''
+    All accounts and bots of a run, accounts are kept in the order they were first seen
+    '''
+    __slots__ = ('accounts', 'unbalanced_accounts')
+
+    def __init__(self):
+        # account id: Account
+        self.accounts = {}
+        # account ids without a complete balance (table data or active deals errored)
+        self.unbalanced_accounts = set()
+
+    def add_account(self, account_id: int, name: str, forced_mode: str) -> Account:
+        '''
+        Gets the account, adding it if it is not in the fleet yet
+        :param account_id: 3c account id
+        :param name: account name
+        :param forced_mode: 'real' or 'paper' trading.
+        :return: Account
+        '''
+        account = self.accounts.get(account_id)
+        if account is None:
+            account = self.accounts[account_id] = Account(account_id, name, forced_mode)
+        return account
+
+    def add_bot(self, bot: Bot):
+        '''
+        :param bot: bot to add to its (already added) account
+        '''
+        self.accounts[bot.account_id].add_bot(bot)
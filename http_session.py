@@ -0,0 +1,41 @@
+'''
+Shared keep-alive http session for the 3commas client and discord webhook.
+The session lives at module level so warm lambda containers reuse its connections.
+'''
+
+import threading
+
+import requests
+from requests.adapters import HTTPAdapter
+
+DEFAULT_POOL_SIZE = 10
+
+_session = None
+_session_lock = threading.Lock()
+
+
+def create_session(pool_size: int = DEFAULT_POOL_SIZE) -> requests.Session:
+    '''
+    Creates a session with a connection pool per host
+    :param pool_size: max connections kept alive per host, should be >= concurrent requests
+    :return: requests session
+    '''
+    session = requests.Session()
+    # Retries are handled by the request scheduler
+    adapter = HTTPAdapter(pool_connections=4, pool_maxsize=pool_size, max_retries=0)
+    session.mount('https://', adapter)
+    session.mount('http://', adapter)
+    return session
+
+
+def get_session(pool_size: int = DEFAULT_POOL_SIZE) -> requests.Session:
+    '''
+    Gets the shared session, creating it on first use
+    :param pool_size: pool size used when the session gets created
+    :return: requests session
+    '''
+    global _session  # pylint: disable=global-statement
+    with _session_lock:
+        if _session is None:
+            _session = create_session(pool_size)
+        return _session
@@ -1,38 +1,116 @@
 """
-Log messages based on severity
+Log messages based on severity.
+Messages are only formatted when their level is enabled, locally the file and console
+output is written by a background thread.
 """
 
+import atexit
 import logging
+import queue
+
+from logging.handlers import QueueHandler, QueueListener
+
+# Payloads longer than this are cut off by summarize
+SUMMARY_MAX_LENGTH = 300
+
+MESSAGE_TYPE_LEVELS = {
+    'DEBUG': logging.DEBUG,
+    'INFO': logging.INFO,
+    'WARNING': logging.WARNING,
+    'ERROR': logging.ERROR
+}
+
+
+class _DeferredQueueHandler(QueueHandler):
+    '''
+    Queue handler that leaves formatting to the listener thread
+    '''
+    def prepare(self, record):
+        # The record stays in process, no need to format or pickle it on the calling thread
+        return record
+
+
+_listener = None
 
 if len(logging.getLogger().handlers) > 0:
     # The Lambda environment pre-configures a handler logging to stderr.
     # If a handler is already configured,
     # `.basicConfig` does not execute. Thus we set the level directly.
+    # Lambda freezes background threads after returning, so logging stays synchronous.
     logging.getLogger().setLevel(logging.INFO)
 else:
-    logger = logging.getLogger(__name__)
+    formatter = logging.Formatter(
+        fmt=(
+            '%(asctime)s.%(msecs)03d '
+            '%(levelname)s %(module)s - '
+            '%(funcName)s: %(message)s'
+        ),
+        datefmt='%d-%m-%Y %H:%M:%S'
+    )
     # Write to logfile
-    logging.basicConfig(level=logging.INFO,
-                        filename='logs/3commas_compounder.log',
-                        filemode='a',
-                        format=(
-                            '%(asctime)s.%(msecs)03d '
-                            '%(levelname)s %(module)s - '
-                            '%(funcName)s: %(message)s'
-                        ),
-                        datefmt='%d-%m-%Y %H:%M:%S'
-                        )
+    file_handler = logging.FileHandler('logs/3commas_compounder.log', mode='a')
+    file_handler.setFormatter(formatter)
     # Also print in console
-    logging.getLogger().addHandler(logging.StreamHandler())
+    stream_handler = logging.StreamHandler()
+
+    log_queue: queue.SimpleQueue[logging.LogRecord] = queue.SimpleQueue()
+    logging.getLogger().addHandler(_DeferredQueueHandler(log_queue))
+    logging.getLogger().setLevel(logging.INFO)
+
+    _listener = QueueListener(log_queue, file_handler, stream_handler)
+    _listener.start()
+    # Write everything still queued before the interpreter exits
+    atexit.register(_listener.stop)
+
+
+def set_level(message_type: str):
+    '''
+    Messages below this level are dropped before they are formatted
+    :param message_type: DEBUG, INFO, WARNING or ERROR
+    '''
+    logging.getLogger().setLevel(MESSAGE_TYPE_LEVELS[message_type.upper()])
+
+
+class _Summary:
+    '''
+    Payload that is only turned into a string when the message is written
+    '''
+    __slots__ = ('payload', 'max_length')
+
+    def __init__(self, payload, max_length: int = SUMMARY_MAX_LENGTH):
+        self.payload = payload
+        self.max_length = max_length
+
+    def __str__(self):
+        text = str(self.payload)
+
+        if len(text) <= self.max_length:
+            return text
+        size = f' ({len(self.payload)} keys)' if isinstance(self.payload, dict) else ''
+        return f'{text[:self.max_length]}...{size}'
+
+
+def summarize(payload, max_length: int = SUMMARY_MAX_LENGTH):
+    '''
+    Wraps a large payload (i.e. an api response) to log it cut off at max_length
+    :param payload: dict or other object to log
+    :param max_length: max amount of characters logged
+    :return: object to pass as log argument
+    '''
+    return _Summary(payload, max_length)
 
-MESSAGE_TYPE_LOGGING = {
-    'INFO': logging.info,
-    'WARNING': logging.warning,
-    'ERROR': logging.error
-}
 
-def log(message: str, message_type: str):
+def log(message: str, message_type: str, *args):
     '''
     Logs the message to file according to type
+    :param message: message, %-style format string when args are given
+    :param message_type: DEBUG, INFO, WARNING or ERROR
+    :param args: format arguments, only formatted when the message type is enabled.
+        Formatting happens later on the logging thread, don't pass objects that still change.
     '''
-    MESSAGE_TYPE_LOGGING[message_type](message)
+    level = MESSAGE_TYPE_LEVELS[message_type]
+    root_logger = logging.getLogger()
+    if not root_logger.isEnabledFor(level):
+        return
+    # stacklevel=2 logs the function calling logger.log instead of log itself
+    root_logger.log(level, message, *args, stacklevel=2)
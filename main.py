@@ -2,21 +2,30 @@
 3commas deal compounder, grabs only the active deals that are either single or multibot.
 '''
 
+import argparse
 import math
 import json
+import os
+import time
 import configparser
 
-from os.path import exists
-
-# AWS
-import boto3
 
 # Misc
+import py3cw.request
 from py3cw.request import Py3CW
 
 # Local packages
+import bootstrap
+import bots_config
+import cache
+import fetcher
+import fleet
+import http_session
 import logger
-import utils
+import metrics
+import optimizer
+import scheduler
+import state_store
 import webhook
 
 
@@ -40,53 +49,172 @@ except configparser.NoSectionError:
     config.read('config.lambda.ini')
     test_mode = config.get('run_mode', 'test')
     BOTS_CONFIG_LOCATION = '/tmp/bots.json'
-    with open(BOTS_CONFIG_LOCATION, 'wb') as f:
-        boto3.client('s3').download_fileobj('3commas-compounder-data-bucket', 'bots.json', f)
     LOCAL = 'False'
 
+BOTS_CONFIG_BUCKET = '3commas-compounder-data-bucket'
+BOTS_CONFIG_KEY = 'bots.json'
+
+# 'ratio' scales the minimal BO:SO to the allocation,
+# 'search' searches BO:SO:MAD on the volume step (priceStep) grid of the pair
+optimizer_mode = config.get('optimizer', 'mode', fallback='ratio')
+
+# Messages below this level are dropped before they get formatted
+logger.set_level(config.get('logging', 'level', fallback='INFO'))
+
+# Phase timings and 3c request metrics as CloudWatch embedded metric format
+metrics.configure(
+    config.getboolean('metrics', 'enabled', fallback=False),
+    config.get('metrics', 'namespace', fallback=metrics.DEFAULT_NAMESPACE),
+    config.get('metrics', 'path', fallback='') or None
+)
+
+# Amount of 3c requests allowed in flight at the same time
+fetcher.set_max_workers(
+    config.getint('concurrency', 'max_workers', fallback=fetcher.DEFAULT_MAX_WORKERS)
+)
+# Amount of bots/update requests allowed in flight at the same time
+max_updates_in_flight = config.getint('concurrency', 'max_updates_in_flight', fallback=4)
+
+# 3c returns at most 100 bots and 1000 deals per page
+bots_page_size = config.getint('pagination', 'bots_page_size', fallback=100)
+deals_page_size = config.getint('pagination', 'deals_page_size', fallback=1000)
+# Request the next page while the current page is processed
+prefetch_pages = config.getboolean('pagination', 'prefetch', fallback=True)
+
+# Daemon mode (main.py --daemon), seconds between polls for closed deals
+daemon_poll_interval = config.getfloat('daemon', 'poll_interval', fallback=15)
+# Seconds between full runs, picks up new bots and settings changed on 3c
+daemon_full_refresh_interval = config.getfloat('daemon', 'full_refresh_interval', fallback=3600)
+finished_deals_page_size = config.getint('daemon', 'finished_deals_page_size', fallback=50)
+
+# Account info (market code etc.) keyed by (account_id, forced_mode).
+# Fetched once per run, optionally persisted so warm containers can skip the requests.
+account_info_cache = cache.TTLCache(
+    path=config.get('cache', 'account_info_path', fallback='') or None,
+    ttl=config.getfloat('cache', 'account_info_ttl', fallback=86400)
+)
+
+# currency_rates limits keyed by (market_code, pair), persisted between runs
+market_limits_cache = cache.TTLCache(
+    path=config.get('cache', 'market_limits_path', fallback='') or None,
+    ttl=config.getfloat('cache', 'market_limits_ttl', fallback=86400),
+    max_size=config.getint('cache', 'market_limits_max_size', fallback=5000)
+)
+market_limits_cache.load()
+
+# Inputs of the last run per bot, bots whose inputs did not change are skipped
+compounding_state = state_store.StateStore(
+    path=config.get('state', 'path', fallback='') or None,
+    balance_tolerance=config.getfloat('state', 'balance_tolerance', fallback=0.0)
+)
+
+def get_secrets():
+    '''
+    Secrets from config.ini locally, from system manager in AWS Lambda
+    :return: dict with 3commas_key, 3commas_secret and webhook_url
+    '''
+    return bootstrap.get_secrets(config if LOCAL == 'True' else None)
 
-# Check if local or AWS
-if LOCAL == 'True':
-    # Running locally, get secrets from config.ini
-    secrets_dict = {
-        "3commas_key": config.get('3commas', 'key'),
-        "3commas_secret": config.get('3commas', 'secret'),
-        "webhook_url": config.get('discord', 'webhook_url')
-    }
-else:
-    # Running in AWS Lambda, get secrets from system manager
-    boto_client = boto3.client("ssm")
-    secret_parameters = [
-        "/3commas-compounder/3commas_key",
-        "/3commas-compounder/3commas_secret",
-    ]
-
-    secret_parameters_result = boto_client.get_parameters(
-        Names=secret_parameters,
-        WithDecryption=True,
-    )
-    secrets_dict = utils.parameter_dict_getter(secret_parameters_result)
+
+# Relative caches and state of the tenants are kept in this directory
+TENANT_DATA_DIRECTORY = 'tenant_data'
+
+def tenant_path(path, tenant_name):
+    '''
+    :param path: file location
+    :param tenant_name: name of the tenant
+    :return: same file name in a directory of the tenant, i.e. bot_config/<tenant>/bots.json
+    '''
+    directory = os.path.join(os.path.dirname(path), tenant_name)
+    os.makedirs(directory, exist_ok=True)
+    return os.path.join(directory, os.path.basename(path))
+
+
+def use_tenant(tenant_name, secrets):
+    '''
+    Points this process at a tenant, every tenant has its own secrets, bots.json,
+    caches and state. Called by tenants.py in a fresh worker process before compounder_start.
+    :param tenant_name: name of the tenant
+    :param secrets: dict with 3commas_key, 3commas_secret and webhook_url
+    '''
+    global BOTS_CONFIG_LOCATION, BOTS_CONFIG_KEY  # pylint: disable=global-statement
+    bootstrap.set_secrets(secrets)
+    BOTS_CONFIG_LOCATION = tenant_path(BOTS_CONFIG_LOCATION, tenant_name)
+    BOTS_CONFIG_KEY = f'{tenant_name}/{BOTS_CONFIG_KEY}'
+
+    for store in (account_info_cache, market_limits_cache, compounding_state):
+        if store.path:
+            if not os.path.isabs(store.path):
+                store.path = os.path.join(TENANT_DATA_DIRECTORY, store.path)
+            store.path = tenant_path(store.path, tenant_name)
+    market_limits_cache.load()
+
+
+def refresh_bots_config():
+    '''
+    Downloads bots.json from s3 to BOTS_CONFIG_LOCATION if it changed since the last run
+    '''
+    bots_config.refresh_from_s3(BOTS_CONFIG_BUCKET, BOTS_CONFIG_KEY, BOTS_CONFIG_LOCATION)
+
+
+def cold_start():
+    '''
+    Network initialization, secrets and (in lambda) bots.json are fetched in parallel
+    once per container. Warm lambda invocations only revalidate bots.json.
+    '''
+    if LOCAL == 'True':
+        bootstrap.initialize([get_secrets])
+    elif not bootstrap.initialize([get_secrets, refresh_bots_config]):
+        refresh_bots_config()
 
 
 # connect 3commas python wrapper
+# Retries are handled by the request scheduler
 py3cw_request_options = {
         'request_timeout': 10,
-        'nr_of_retries': 1,
-        'retry_status_codes': [502]
+        'nr_of_retries': 0,
+        'retry_status_codes': []
     }
-p3cw = Py3CW(
-        key=secrets_dict["3commas_key"],
-        secret=secrets_dict["3commas_secret"],
-        request_options=py3cw_request_options
-    )
 
+def create_p3cw():
+    '''
+    Creates the 3commas client, called by the request scheduler on the first request
+    :return: Py3CW client
+    '''
+    secrets_dict = get_secrets()
+    # Point py3cw at another 3c api, i.e. the local mock_server.py
+    api_url = config.get('3commas', 'api_url', fallback='')
+    if api_url:
+        py3cw.request.API_URL = api_url
+    p3cw = Py3CW(
+            key=secrets_dict["3commas_key"],
+            secret=secrets_dict["3commas_secret"],
+            request_options=py3cw_request_options
+        )
+    # Share the keep-alive connection pool with the webhook
+    p3cw.session = http_session.get_session(
+        config.getint('http', 'pool_size', fallback=http_session.DEFAULT_POOL_SIZE)
+    )
+    bootstrap.report_first_request()
+    return p3cw
+
+# Every 3c request goes through the shared rate limiter/retry scheduler
+p3cw_scheduler = scheduler.RequestScheduler(
+    create_p3cw,
+    requests_per_second=config.getfloat('rate_limit', 'requests_per_second', fallback=10),
+    burst=config.getint('rate_limit', 'burst', fallback=20),
+    max_concurrency=fetcher.max_workers,
+    max_retries=config.getint('rate_limit', 'max_retries', fallback=3)
+)
+
+@metrics.timed('refresh_balances')
 def refresh_balances(account_id, forced_mode):
     '''
     Refresh the balance 3c has for the given exchange
     :param account_id: id of exchange account on 3c
     :return:
     '''
-    error, _ = p3cw.request(
+    error, _ = p3cw_scheduler.request(
         entity='accounts',
         action='load_balances',
         action_id=str(account_id),
@@ -96,135 +224,185 @@ def refresh_balances(account_id, forced_mode):
     if error:
         webhook.notify_webhook(error, 'ERROR')
 
+DEFAULT_VOLUME_STEP = 0.00000001
+
 currency_limit_adjuster = {
     "BTC": 0.00015,
     "BUSD": 11,
     "USDT": 11
 }
 
-def get_3c_currency_limit(bot_json):
+# Only keep the currency_rates fields we use, keeps the cache file compact
+PAIR_LIMIT_KEYS = ('minTotal', 'minLotSize', 'lotStep', 'priceStep')
+
+@metrics.timed('fetch_pair_limits')
+def fetch_pair_limits(market_code, pair):
     '''
-    Helper function to get minimum BO amount for provided pair for DCA bot on 3c
+    Gets the exchange limits for the pair from 3c
+    :param market_code: market code of the exchange
     :param pair: pair we are looking up
-    :return: tuple with (min BO, min price step size).
-        Uses lotStep instead of priceStep
-        this ensures we are using multiples the coin can also be sold at
+    :return: dict with PAIR_LIMIT_KEYS, None on error
     '''
-
-    error, pair_limits = p3cw.request(
+    error, pair_limits = p3cw_scheduler.request(
         entity='accounts',
         action='currency_rates',
         action_id='',
         payload={
-            "market_code": bot_json['market_code'],
-            "pair": bot_json['pairs'][0]
+            "market_code": market_code,
+            "pair": pair
         },
         additional_headers=additional_headers
     )
 
     if error:
         webhook.notify_webhook(error, 'ERROR')
+        return None
+
+    return {key: pair_limits[key] for key in PAIR_LIMIT_KEYS if key in pair_limits}
+
+def get_pair_limits(market_code, pair):
+    '''
+    Gets the exchange limits for the pair from the market limits cache,
+    concurrent lookups for the same pair are merged into one request
+    :param market_code: market code of the exchange
+    :param pair: pair we are looking up
+    :return: dict with PAIR_LIMIT_KEYS, None on error
+    '''
+    return market_limits_cache.get_or_fetch(
+        (market_code, pair),
+        lambda: fetch_pair_limits(market_code, pair)
+    )
+
+def get_3c_currency_limit(bot):
+    '''
+    Helper function to get minimum BO amount for provided pair for DCA bot on 3c
+    :param bot: fleet bot with the pair we are looking up
+    :return: tuple with (min BO, volume step).
+        BO and SO are volumes in the currency of the bot (the quote coin),
+        the volume step is the priceStep of the pair, lotStep is a step of the base coin
+    :raises LookupError: if 3c has no limits for the pair, the 3c error was already notified
+    '''
+
+    pair_limits = get_pair_limits(bot.market_code, bot.pairs[0])
 
-    # This 3c Endpoint will not work when using short bots
-    # because those pairs (i.e ETH_USD) may not exist on the exchange
-    # Workaround to start very small.
+    # Short bot pairs (i.e ETH_USD) may not exist on the exchange,
+    # short bots fall back to a min volume of .001 and a step of .0001.
     # TODO: Check if this is working for short bots.
     # Could potentially lead to a sell amount that is not allowed on the exchange
-    # since we dont have lotStep to reference
     # If so, may need to disable short bots from this script
-    coins = bot_json['pairs'][0].split('_')
-    if bot_json['currency'] != coins[0]:
+    coins = bot.pairs[0].split('_')
+    if bot.currency != coins[0]:
         return (.001, .0001)
 
+    if not pair_limits or 'minTotal' not in pair_limits:
+        raise LookupError(f'No exchange limits for {bot.pairs[0]} on {bot.market_code}')
 
     min_total = float(pair_limits['minTotal'])
+    # Fall back to the 8 decimals 3c accepts when the exchange has no priceStep
+    volume_step = float(pair_limits.get('priceStep', DEFAULT_VOLUME_STEP))
 
-    logger.log(f"bot_json['pairs'] {bot_json['pairs']}", "INFO")
-    logger.log(f"min_total {min_total}", "INFO")
+    logger.log("bot.pairs %s", "DEBUG", bot.pairs)
+    logger.log("min_total %s", "DEBUG", min_total)
 
     if coins[0] in currency_limit_adjuster:
         currency_minimal = currency_limit_adjuster[coins[0]]
         if min_total < currency_minimal:
-            return currency_minimal
+            return (currency_minimal, volume_step)
 
-    return min_total
+    return (min_total, volume_step)
 
 
-def update_bot(bot_id, valid_bo, valid_so, valid_mad, valid_adosp, bot_json, forced_mode):
+@metrics.timed('update_bot')
+def update_bot(bot, valid_bo, valid_so, valid_mad, valid_adosp, forced_mode):
     '''
     Helper function to hit the 3c api and update the bot's bo and so
-    :param account_id: account id the bot is on
-    :param bot_id: id of the bot
+    :param bot: fleet bot to update
     :param valid_bo: auto generated BO
     :param valid_so: auto generated SO
-    :param bot_json: other required params we are not modifying but are required by 3c endpoint
-    :return:
+    :return: error, empty if the bot got updated
     '''
-
-    if test_mode == 'True':
-        logger.log("Test Run Completed!", "INFO")
+    error, updated_bot = p3cw_scheduler.request(
+        entity='bots',
+        action='update',
+        action_id=str(bot.id),
+        payload={
+            'name': bot.name,
+            'pairs': bot.pairs,
+            # this is auto calculated value that we're changing
+            'base_order_volume': f'{valid_bo}',
+            'take_profit': bot.tp,
+            # this is auto calculated value that we're changing
+            'safety_order_volume': f'{valid_so}',
+            'martingale_volume_coefficient': bot.os,
+            'martingale_step_coefficient': bot.ss,
+            'max_safety_orders': bot.mstc,
+            'active_safety_orders_count': bot.active_safety_orders_count,
+            'safety_order_step_percentage': bot.sos,
+            'take_profit_type': bot.take_profit_type,
+            'strategy_list': bot.strategy_list,
+            'bot_id': bot.id,
+            'max_active_deals': valid_mad,
+            'allowed_deals_on_same_pair': valid_adosp,
+        },
+        additional_headers={'Forced-Mode': forced_mode}
+    )
+    if error == {}:
+        logger.log("%s Updated!", "INFO", bot.name)
+        # The response is the whole bot, only log a summary
+        logger.log("%s", "DEBUG", logger.summarize(updated_bot))
     else:
-        error, updated_bot = p3cw.request(
-            entity='bots',
-            action='update',
-            action_id=str(bot_id),
-            payload={
-                'name': bot_json['name'],
-                'pairs': bot_json['pairs'],
-                # this is auto calculated value that we're changing
-                'base_order_volume': f'{valid_bo}',
-                'take_profit': bot_json['tp'],
-                # this is auto calculated value that we're changing
-                'safety_order_volume': f'{valid_so}',
-                'martingale_volume_coefficient': bot_json['os'],
-                'martingale_step_coefficient': bot_json['ss'],
-                'max_safety_orders': bot_json['mstc'],
-                'active_safety_orders_count': bot_json['active_safety_orders_count'],
-                'safety_order_step_percentage': bot_json['sos'],
-                'take_profit_type': bot_json['take_profit_type'],
-                'strategy_list': bot_json['strategy_list'],
-                'bot_id': bot_id,
-                'max_active_deals': valid_mad,
-                'allowed_deals_on_same_pair': valid_adosp,
-            },
-            additional_headers={'Forced-Mode': forced_mode}
-        )
-        if error == {}:
-            info_message = f"{bot_json['name']} Updated!"
-            logger.log(info_message, "INFO")
-            debug_updated_bot = f"{updated_bot}"
-            logger.log(debug_updated_bot, "INFO")
-        else:
-            webhook.notify_webhook(f"{bot_json['name']} NOT completed:\n{error['msg']}", 'ERROR')
-
-
-def calc_max_funds_per_deal(
-        bo: float,
-        so: float,
-        mstc: int,
-        sos: float,
-        os: float,
-        ss: float
-    ) -> float:
-    '''
-    Helper function to optimize allocations on
-    :param bo: Base Order
-    :param so: Safety Order
-    :param mstc: Max Safety Trade Count
-    :param sos: Safety Order Step
-    :param os: (Safety) Order Scale
-    :param ss: (Safety Order) Step Scale
-    :return: max funds the bot can use
-    '''
-    max_total = bo
-    drawdown = .0
-    # stc indexed from 0
-    for stc in range(0, mstc):
-        drawdown += sos * ss ** stc
-        if drawdown >= 100:  # TODO: Validate that using 100 here instead of 1 is correct
-            return max_total
-        max_total += so * os ** stc
-    return max_total
+        webhook.notify_webhook(f"{bot.name} NOT completed:\n{error['msg']}", 'ERROR')
+
+    return error
+
+
+@metrics.timed('apply_update_plan')
+def apply_update_plan(update_plan):
+    '''
+    Writer stage, applies the update plan to 3c concurrently
+    :param update_plan: list of bot updates created by optimize_bot
+    :return: list with the result of every bot update
+    '''
+    errors = fetcher.fan_out(
+        lambda bot_update: update_bot(
+            bot_update['bot'],
+            bot_update['new']['bo'],
+            bot_update['new']['so'],
+            bot_update['new']['mad'],
+            bot_update['new']['adosp'],
+            forced_mode=bot_update['forced_mode']
+        ),
+        update_plan,
+        limit=max_updates_in_flight
+    )
+
+    update_results = []
+    for bot_update, error in zip(update_plan, errors):
+        update_results.append({
+            'bot_id': bot_update['bot_id'],
+            'bot_name': bot_update['bot_name'],
+            'updated': error == {},
+            'error': None if error == {} else error.get('msg')
+        })
+
+    updated_count = sum(1 for update_result in update_results if update_result['updated'])
+    logger.log('Updated %s/%s bots', "INFO", updated_count, len(update_results))
+
+    return update_results
+
+
+def update_plan_to_json(update_plan):
+    '''
+    :param update_plan: list of bot updates created by optimize_bot
+    :return: the update plan as json, without the full bot settings
+    '''
+    return json.dumps(
+        [
+            {key: value for key, value in bot_update.items() if key != 'bot'}
+            for bot_update in update_plan
+        ],
+        indent=4
+    )
 
 
 def get_currency(pair, strategy, volume_type):
@@ -242,211 +420,340 @@ def get_currency(pair, strategy, volume_type):
     #     return _pair[1] if volume_type == 'quote_currency' else _pair[0]
     return _pair[0] if volume_type == 'quote_currency' else _pair[1]
 
-def fetch_bots_for_accounts(account_config_dict, forced_mode):
+def is_supported_bot(bot):
     '''
-    Function to gather all bots for accounts.
-    :param account_config_dict: config dict to carry all account/bot data
-    :param forced_mode: 'real' or 'paper' trading.
+    Only support long bots that buy in quote and short bots that sell in base
+    :param bot: bot json from the 3c api
+    :return: True if the bot can be compounded
     '''
-    logger.log('Pulling bot info...', "INFO")
-    ## Get list of all enabled bots to find out which accounts/currencies are needed to be optimized
-    # infinite bots while loop
-    bot_offset = 0
-    bot_limit = 100
+    if bot['strategy'] == 'long':
+        return (
+            bot['base_order_volume_type'] == 'quote_currency' and
+            bot['safety_order_volume_type'] == 'quote_currency'
+        )
+    if bot['strategy'] == 'short':
+        return (
+            bot['base_order_volume_type'] == 'base_currency' and
+            bot['safety_order_volume_type'] == 'base_currency'
+        )
+    return True
 
-    keep_fetching_bots = True
 
-    while keep_fetching_bots:
-        error, bots = p3cw.request(
+@metrics.timed('fetch_enabled_bots')
+def fetch_enabled_bots(forced_mode):
+    '''
+    Pages through all enabled bots for the given mode
+    :param forced_mode: 'real' or 'paper' trading.
+    :return: list of all enabled bots, supported or not
+    '''
+    ## Get list of all enabled bots to find out which accounts/currencies are needed to be optimized
+    enabled_bots = fetcher.Paginator(
+        lambda offset, limit: p3cw_scheduler.request(
             entity='bots',
             action='',
             payload={
                 "scope": "enabled",
-                "limit": f"{bot_limit}",
-                "offset":f"{bot_offset}"
+                "limit": f"{limit}",
+                "offset": f"{offset}"
             },
             additional_headers={'Forced-Mode': forced_mode}
+        ),
+        bots_page_size,
+        prefetch=prefetch_pages
+    )
+    bots = list(enabled_bots)
+
+    if enabled_bots.error:
+        webhook.notify_webhook(enabled_bots.error, 'ERROR')
+
+    return bots
+
+
+def fetch_account_info(account_id, account_name, forced_mode):
+    '''
+    Gets the account info (market code etc.) for the given account
+    :param account_id: id of exchange account on 3c
+    :param account_name: name of the account, used for error messages
+    :param forced_mode: 'real' or 'paper' trading.
+    :return: account info json
+    '''
+    error, account_info = p3cw_scheduler.request(
+        entity='accounts',
+        action='account_info',
+        action_id=str(account_id),
+        additional_headers={'Forced-Mode': forced_mode}
+    )
+    if error:
+        webhook.notify_webhook(
+            (
+                f'Error getting account info for [{account_name}]'
+                f'(https://3commas.io/accounts/{account_id})'
+            ),
+            'ERROR'
         )
 
-        if error:
-            webhook.notify_webhook(error, 'ERROR')
+    return account_info
 
-        # No more bots or less than needed for an additional loop.
-        if len(bots) == 0 or len(bots) < 100:
-            keep_fetching_bots = False
-        else:
-            # Potentially more bots avaialable.
-            bot_offset += bot_limit
 
-        for bot in bots:
-            # Only support long bots that buy in quote and short bots that sell in base
-            if (
-                bot['strategy'] == 'long' and
-                (
-                    bot['base_order_volume_type'] != 'quote_currency' or
-                    bot['safety_order_volume_type'] != 'quote_currency'
-                )
-            ) or (
-                bot['strategy'] == 'short' and
-                (
-                    bot['base_order_volume_type'] != 'base_currency' or
-                    bot['safety_order_volume_type'] != 'base_currency'
-                )
-            ):
-                bot_support_warning = (
-                    'Only Long Quote and Short Base bots are supported. '
-                    f'Skipping {bot["name"]}')
-                logger.log(bot_support_warning, "WARNING")
-                continue
+def get_account_info(account_id, forced_mode, account_name=None):
+    '''
+    Gets the account info from the account cache, only hits the 3c api on a cache miss
+    :param account_id: id of exchange account on 3c
+    :param forced_mode: 'real' or 'paper' trading.
+    :param account_name: name of the account, used for error messages
+    :return: account info json
+    '''
+    account_info = account_info_cache.get((account_id, forced_mode))
+    if account_info is None:
+        account_info = fetch_account_info(account_id, account_name, forced_mode)
+        # Don't cache failed lookups
+        if account_info:
+            account_info_cache.set((account_id, forced_mode), account_info)
+
+    return account_info
 
-            # If account not already in config_dict, add it
-            account_id = bot['account_id']
-
-            if account_id not in account_config_dict['accounts']:
-                account_config_dict['accounts'][account_id] = {}
-                account_config_dict['accounts'][account_id]['forced_mode'] = forced_mode
-                account_config_dict['accounts'][account_id]['account_name'] = bot['account_name']
-                account_config_dict['accounts'][account_id]['balances'] = {}
-                account_config_dict['accounts'][account_id]['bots'] = {}
-
-            bot_id = bot['id']
-
-            account_config_dict['accounts'][account_id]['bots'][bot_id] = {}
-
-            # readibility short-cut
-            bot_config_dict = account_config_dict['accounts'][account_id]['bots'][bot_id]
-            # Add 3c settings
-            bot_config_dict['name'] = bot['name']
-            bot_config_dict['bo'] = bot['base_order_volume']
-            bot_config_dict['so'] = bot['safety_order_volume']
-            bot_config_dict['os'] = bot['martingale_volume_coefficient']
-            bot_config_dict['ss'] = bot['martingale_step_coefficient']
-            bot_config_dict['mad'] = bot['max_active_deals']
-            bot_config_dict['adosp'] = bot['allowed_deals_on_same_pair']
-            bot_config_dict['sos'] = bot['safety_order_step_percentage']
-            bot_config_dict['mstc'] = bot['max_safety_orders']
-            bot_config_dict['pairs'] = bot['pairs']
-            bot_config_dict['type'] = bot['type']
-            bot_config_dict['active_safety_orders_count'] = bot['active_safety_orders_count']
-            bot_config_dict['take_profit_type'] = bot['take_profit_type']
-            bot_config_dict['tp'] = bot['take_profit']
-            bot_config_dict['strategy_list'] = bot['strategy_list']
-
-            # Get the currency used for the deal
-            currency = get_currency(bot['pairs'][0], bot['strategy'], bot['base_order_volume_type'])
-            account_config_dict['accounts'][account_id]['bots'][bot_id]['currency'] = currency
-
-            # If currency not already in the account, add it
-            account_config_dict['accounts'][account_id]['balances'][currency] = 0.0
-
-            # Add market code so we can look up currency limits for that exchange later
-            error, account_info = p3cw.request(
-                entity='accounts',
-                action='account_info',
-                action_id=str(account_id),
-                additional_headers={'Forced-Mode': forced_mode}
+
+@metrics.timed('fetch_bots_for_accounts')
+def fetch_bots_for_accounts(bot_fleet, forced_mode, bots=None):
+    '''
+    Function to gather all bots for accounts.
+    :param bot_fleet: fleet to add the accounts and bots to
+    :param forced_mode: 'real' or 'paper' trading.
+    :param bots: already fetched enabled bots, fetched from 3c if not given
+    '''
+    if bots is None:
+        logger.log('Pulling bot info...', "INFO")
+        bots = fetch_enabled_bots(forced_mode)
+
+    supported_bots = []
+    for bot in bots:
+        if not is_supported_bot(bot):
+            logger.log(
+                'Only Long Quote and Short Base bots are supported. Skipping %s',
+                "WARNING",
+                bot["name"]
             )
-            if error:
-                webhook.notify_webhook(
-                    (
-                        f'Error getting account info for [{bot["account_name"]}]'
-                        f'(https://3commas.io/accounts/{bot["account_id"]})'
-                    ),
-                    'ERROR'
-                )
+            continue
+
+        supported_bots.append(bot)
+    bots = supported_bots
+
+    # Add market code so we can look up currency limits for that exchange later,
+    # account info is only looked up once per account
+    account_names = {}
+    for bot in bots:
+        account_names.setdefault(bot['account_id'], bot['account_name'])
+
+    account_infos = dict(zip(
+        account_names,
+        fetcher.fan_out(
+            lambda account_id: get_account_info(account_id, forced_mode, account_names[account_id]),
+            account_names
+        )
+    ))
 
-            bot_config_dict['market_code'] = account_info['market_code']
+    for bot in bots:
+        account = bot_fleet.add_account(bot['account_id'], bot['account_name'], forced_mode)
 
-def get_active_bot_deals(bot_id: int):
-    """Gets active bot deals"""
-    error, deals_data = p3cw.request(
-        entity="deals",
-        action="",
-        payload={
-            "scope": "active",
-            "limit": 1000,
-            "bot_id": str(bot_id),
-        },
+        # Get the currency used for the deal
+        currency = get_currency(bot['pairs'][0], bot['strategy'], bot['base_order_volume_type'])
+        fleet_bot = fleet.Bot.from_api(bot, currency)
+        fleet_bot.market_code = account_infos[account.id]['market_code']
+        bot_fleet.add_bot(fleet_bot)
+
+def fetch_active_deals(account_id, forced_mode):
+    '''
+    Streams all active deals of the given account, page by page
+    :param account_id: id of exchange account on 3c
+    :param forced_mode: 'real' or 'paper' trading.
+    :return: paginator of the active deals, check its error after iterating
+    '''
+    return fetcher.Paginator(
+        lambda offset, limit: p3cw_scheduler.request(
+            entity='deals',
+            action='',
+            payload={
+                "account_id": account_id,
+                "scope": "active",
+                "limit": limit,
+                "offset": offset,
+                "order": "created_at",
+                "order_direction": "asc"
+            },
+            additional_headers={'Forced-Mode': forced_mode}
+        ),
+        deals_page_size,
+        prefetch=prefetch_pages
     )
-    return deals_data
-
-def get_sold_volume_for_bot(bot_id):
-    """Calculates sold volume for all bot deals"""
-    sold_volume: float = 0
-    deals_data = get_active_bot_deals(bot_id=bot_id)
-    for deal in deals_data:
-        sold_volume += float(deal['sold_volume'])
-
-    return sold_volume
-
-def get_short_bots_and_remove_sold_volume_from_account_config(config_dict):
-    """Remove sold volume from config_dict_account_balances"""
-    for account_id in config_dict['accounts']:
-        forced_mode = config_dict['accounts'][account_id]['forced_mode']
-        bot_offset = 0
-        bot_limit = 100
-
-        keep_fetching_bots = True
-        while keep_fetching_bots:
-            error, bots = p3cw.request(
-                entity='bots',
-                action='',
-                payload={
-                    "scope": "enabled",
-                    "limit": bot_limit,
-                    "offset": bot_offset,
-                    "strategy": "short",
-                    "account_id": str(account_id)
-                },
-                additional_headers={'Forced-Mode': forced_mode}
+
+# Deal field with the amount of the currency in the deal
+DEAL_VOLUME_KEYS = {
+    'long': 'bought_volume',
+    'short': 'sold_amount'
+}
+
+def build_deals_index(deals):
+    '''
+    Sums the deals per bot while they stream in, the deals themselves are not kept
+    :param deals: iterable of deals from the 3c api
+    :return: {bot_id: {'volumes': {currency: amount in deals}, 'sold_volume': sold volume}}
+    '''
+    deals_index = {}
+    for deal in deals:
+        currency_code = get_currency(
+            deal['pair'],
+            deal['strategy'],
+            deal['base_order_volume_type']
+        )
+        bot_deals = deals_index.get(deal['bot_id'])
+        if bot_deals is None:
+            bot_deals = deals_index[deal['bot_id']] = {'volumes': {}, 'sold_volume': 0.0}
+
+        volumes = bot_deals['volumes']
+        volumes[currency_code] = \
+            volumes.get(currency_code, 0.0) + float(deal[DEAL_VOLUME_KEYS[deal['strategy']]])
+        bot_deals['sold_volume'] += float(deal['sold_volume'])
+
+    return deals_index
+
+@metrics.timed('fetch_active_deals')
+def fetch_account_deals_index(account):
+    '''
+    :param account: fleet account
+    :return: (error, deals index of the account)
+    '''
+    active_deals = fetch_active_deals(account.id, account.forced_mode)
+    account_deals_index = build_deals_index(active_deals)
+    return active_deals.error, account_deals_index
+
+@metrics.timed('fetch_deals_index')
+def fetch_deals_index(accounts):
+    '''
+    Bulk ingests the active deals for every given account
+    :param accounts: list of fleet accounts to get the deals for
+    :return: {account_id: deals index}, accounts that errored are left out
+    '''
+    deals_index_per_account = fetcher.fan_out(fetch_account_deals_index, accounts)
+
+    deals_index = {}
+    for account, (error, account_deals_index) in zip(accounts, deals_index_per_account):
+        account_id = account.id
+        forced_mode = account.forced_mode
+
+        if error:
+            logger.log("%s", "ERROR", error)
+            if LOCAL == 'False' and forced_mode == 'paper':
+                continue
+
+            webhook.notify_webhook(
+                (
+                    'Error getting active deals for:\n'
+                    f'Account: [{account_id}](https://3commas.io/accounts/{account_id})\n'
+                    f'Error code: [{error.get("status_code")}]\n'
+                    f'Forced Mode: {forced_mode}'
+                ),
+                'ERROR'
             )
+            continue
 
-            if error:
-                webhook.notify_webhook(error, 'ERROR')
+        deals_index[account_id] = account_deals_index
 
-            # No more bots or less than needed for an additional loop.
-            if len(bots) == 0 or len(bots) < 100:
-                keep_fetching_bots = False
-            else:
-                # Potentially more bots avaialable.
-                bot_offset += bot_limit
+    return deals_index
 
-            for bot in bots:
-                sold_volume = get_sold_volume_for_bot(bot_id = bot['id'])
-                config_dict_account_balances = \
-                    config_dict['accounts'][account_id]['balances']
-                currency_code = bot['pairs'][0].split("_")[0]
-                if currency_code in config_dict_account_balances:
-                    config_dict_account_balances[currency_code] -= sold_volume
+@metrics.timed('aggregate_account_balances')
+def aggregate_account_balances(account, account_table, account_deals_index):
+    '''
+    Single pass over the account equity, bots and active deals to get the
+    balance available per currency for compounding
+    :param account: fleet account, the balances of its currency buckets get updated
+    :param account_table: account table data (equity per currency) from 3c
+    :param account_deals_index: deals index of the account
+    '''
+    balances = account.currencies
+
+    # Update balances we have bots using for the given account
+    for pair in account_table:
+        if pair['currency_code'] in balances:
+            balances[pair['currency_code']].balance += float(pair['equity'])
+
+    for bot_id, sold_currency_code in account.enabled_bots.items():
+        bot_deals = account_deals_index.get(bot_id)
+        if bot_deals is None:
+            continue
+
+        # Add in deal balances for bots that can get compounded
+        if bot_id in account.bots:
+            for currency_code, volume in bot_deals['volumes'].items():
+                if currency_code in balances:
+                    balances[currency_code].balance += volume
+
+        # Remove sold volume of short bots
+        if sold_currency_code in balances:
+            balances[sold_currency_code].balance -= bot_deals['sold_volume']
+
+@metrics.timed('fetch_account_balances')
+def fetch_account_balances(account_id, forced_mode):
+    '''
+    Refreshes and gets the balances 3c has for the given account
+    :param account_id: id of exchange account on 3c
+    :param forced_mode: 'real' or 'paper' trading.
+    :return: (error, account table data)
+    '''
+    # Refresh the balance 3c has for the exchange
+    refresh_balances(account_id, forced_mode=forced_mode)
+
+    return p3cw_scheduler.request(
+        entity='accounts',
+        action='account_table_data',
+        action_id=str(account_id),
+        payload={
+            "account_id": account_id
+        },
+        additional_headers={'Forced-Mode': forced_mode}
+    )
 
+FORCED_MODES = ('real', 'paper')
+
+@metrics.timed('get_config')
 def get_config():
     '''
     Pulls necessary information from 3c api to generate config files
-    :return:
+    Requests are fanned out concurrently,
+    results are applied in the same order as they are requested
+    :return: fleet with the compoundable bots and balances per account,
+        accounts with errors are in unbalanced_accounts
     '''
-    config_dict = {"accounts": {}}
-    fetch_bots_for_accounts(account_config_dict=config_dict, forced_mode='real')
-    fetch_bots_for_accounts(account_config_dict=config_dict, forced_mode='paper')
+    bot_fleet = fleet.Fleet()
+
+    # Start the run with only the persisted (non expired) account info
+    account_info_cache.load()
+
+    logger.log('Pulling bot info...', "INFO")
+    bots_per_mode = fetcher.fan_out(fetch_enabled_bots, FORCED_MODES)
+    for forced_mode, bots in zip(FORCED_MODES, bots_per_mode):
+        fetch_bots_for_accounts(bot_fleet=bot_fleet, forced_mode=forced_mode, bots=bots)
 
     logger.log('Pulling account balances...', "INFO")
 
     # Get balance for every currency for each account
-    for account_id, account in config_dict['accounts'].items():
-        # Refresh the balance 3c has for the exchange
-        forced_mode = account['forced_mode']
+    accounts = list(bot_fleet.accounts.values())
+    balances_per_account = fetcher.fan_out(
+        lambda account: fetch_account_balances(account.id, forced_mode=account.forced_mode),
+        accounts
+    )
 
-        refresh_balances(account_id, forced_mode=forced_mode)
+    # Active deals of every account, summed per bot and currency
+    deals_index = fetch_deals_index(accounts)
 
-        error, account_balances = p3cw.request(
-            entity='accounts',
-            action='account_table_data',
-            action_id=str(account_id),
-            payload={
-                "account_id": account_id
-            },
-            additional_headers={'Forced-Mode': forced_mode}
-        )
+    for bots in bots_per_mode:
+        for bot in bots:
+            account = bot_fleet.accounts.get(bot['account_id'])
+            if account is not None:
+                account.enabled_bots[bot['id']] = \
+                    bot['pairs'][0].split("_")[0] if bot['strategy'] == 'short' else None
 
+    for account, (error, account_balances) in zip(accounts, balances_per_account):
+        account_id = account.id
         if error:
             # print(error)
             webhook.notify_webhook(
@@ -457,124 +764,70 @@ def get_config():
                 'ERROR'
             )
 
-        # Update balances we have bots using for the given account
-        for pair in account_balances:
-            config_dict_account_balances = config_dict['accounts'][account_id]['balances']
-            if pair['currency_code'] in config_dict_account_balances:
-                config_dict_account_balances[pair['currency_code']] += float(pair['equity'])
-
-
-    # Add in deal balances for bots that can get compounded
-    for account_id in config_dict['accounts']:
-        for bot_id in config_dict['accounts'][account_id]['bots']:
-
-            forced_mode = config_dict['accounts'][account_id]['forced_mode']
-
-            error, active_deals = p3cw.request(
-                entity='deals',
-                action='',
-                payload={
-                    "account_id": account_id,
-                    "scope": "active",
-                    "bot_id": bot_id
-                },
-            )
-            if error:
-                logger.log(str(error), "ERROR")
-                if LOCAL == 'False' and forced_mode == 'paper':
-                    continue
-
-                webhook.notify_webhook(
-                    (
-                        'Error getting active deals for:\n'
-                        f'Account: [{account_id}](https://3commas.io/accounts/{account_id})\n'
-                        f'Bot: [{bot_id}](https://3commas.io/bots/{bot_id})\n'
-                        f'Error code: [{error["status_code"]}]\n'
-                        f'Forced Mode: {forced_mode}'
-                    ),
-                    'ERROR'
-                )
-                continue
+        if error or account_id not in deals_index:
+            # Don't compound with a partial balance, the bots would shrink
+            bot_fleet.unbalanced_accounts.add(account_id)
+            continue
 
-            # Check for each active deal the currency amount 
-            for deal in active_deals:
-                currency_code = get_currency(
-                    deal['pair'],
-                    deal['strategy'],
-                    deal['base_order_volume_type']
-                )
-                config_dict_account_balances = config_dict['accounts'][account_id]['balances']
-                if currency_code in config_dict_account_balances:
-                    currency_amount = {
-                        'long': 'bought_volume',
-                        'short': 'sold_amount'
-                    }
-                    strat_key = currency_amount[deal['strategy']]
-                    config_dict_account_balances[currency_code] += float(deal[strat_key])
+        # Equity, active deal volumes and short sold volumes in one pass
+        aggregate_account_balances(account, account_balances, deals_index[account_id])
 
-    get_short_bots_and_remove_sold_volume_from_account_config(config_dict)
+    account_info_cache.save()
 
-    return config_dict
+    return bot_fleet
 
-def create_user_config(auto_config):
+def create_user_config(bot_fleet):
     '''
     Creates bots.json file for user to input allocations
-    :param auto_config:
+    :param bot_fleet: fleet from get_config
     :return:
     '''
-    user_conf = auto_config
-    for account_id in user_conf['accounts'].keys():
-        user_conf['accounts'][account_id]['currencies'] = {}
-        # Make a group for each currency and
-        for currency in user_conf['accounts'][account_id]['balances'].keys():
-            user_conf['accounts'][account_id]['currencies'][currency] = {}
-        # clean up unneeded balances
-        del user_conf['accounts'][account_id]['balances']
-        # Add the bots to their respective groups
-        for bot_id in user_conf['accounts'][account_id]['bots']:
-            # Get the currency of the bot
-            config_bot = user_conf['accounts'][account_id]['bots'][bot_id]
-            _currency = config_bot['currency']
-            # Create a dict in the currency dict for the bot
-            user_conf['accounts'][account_id]['currencies'][_currency][bot_id] = {}
-            user_conf_bot_dict = user_conf['accounts'][account_id]['currencies'][_currency][bot_id]
-            # Add name of the bot and key for % allocation
-            user_conf_bot_dict['bot_name'] = \
-                config_bot['name']
-            # add % allocation key for user to input
-            user_conf_bot_dict['allocation'] = None
-            # add max active deals key for user to input
-            if config_bot['type'] == "Bot::MultiBot":
-                user_conf_bot_dict['max_active_deals'] = config_bot['mad']
-
-
-        # clean up uneeded bots key
-        del user_conf['accounts'][account_id]['bots']
-
-        # Autofill with 100% if only 1 bot for the currency on the account
-        currencies = user_conf['accounts'][account_id]['currencies']
-        for currency in currencies:
-            bot_ids = list(currencies[currency].keys())
-            if len(bot_ids) == 1:
-                currencies[currency][bot_ids[0]]['allocation'] = 1.0
+    user_conf = {'accounts': {}}
+    for account in bot_fleet.accounts.values():
+        currencies = {}
+        # Make a group for each currency and add the bots to their respective groups
+        for currency, bucket in account.currencies.items():
+            currencies[currency] = {}
+            for bot in bucket.bots:
+                # Add name of the bot and key for % allocation for user to input
+                user_conf_bot_dict = {'bot_name': bot.name, 'allocation': None}
+                # add max active deals key for user to input
+                if bot.type == "Bot::MultiBot":
+                    user_conf_bot_dict['max_active_deals'] = bot.mad
+                currencies[currency][str(bot.id)] = user_conf_bot_dict
+
+            # Autofill with 100% if only 1 bot for the currency on the account
+            if len(bucket.bots) == 1:
+                currencies[currency][str(bucket.bots[0].id)]['allocation'] = 1.0
+
+        user_conf['accounts'][str(account.id)] = {
+            'forced_mode': account.forced_mode,
+            'account_name': account.name,
+            'currencies': currencies
+        }
 
     # Write config to file
     with open(BOTS_CONFIG_LOCATION, "w", encoding='UTF-8') as outfile:
         json.dump(user_conf, outfile, indent=4)
 
 
-def check_user_config(bot_user_config):
+# Amount of bots.json errors that get sent to the webhook
+MAX_NOTIFIED_CONFIG_ERRORS = 10
+
+@metrics.timed('check_user_config')
+def check_user_config(bot_fleet):
     '''
     Checks that the bots.json file is configured and has all necessary data for script to run
-    :return: valid user config
+    :param bot_fleet: fleet from get_config
+    :return: compiled bots.json, False if it can't be used
     '''
 
     # Check if the bots.json file exists, if not create it and prompt user
-    file_exists = exists(BOTS_CONFIG_LOCATION)
+    user_config = bots_config.load(BOTS_CONFIG_LOCATION)
 
-    if not file_exists:
+    if user_config is None:
         if LOCAL == 'True':
-            create_user_config(bot_user_config)
+            create_user_config(bot_fleet)
             webhook.notify_webhook(
                 (
                     f'Could not find a `bots.json` in {BOTS_CONFIG_LOCATION}, '
@@ -591,102 +844,85 @@ def check_user_config(bot_user_config):
                 'ERROR'
             )
         return False
-    # if bots.json file DOES exist,
-    # make sure it has all of the bot ids and all allocations are defined
-    with open(BOTS_CONFIG_LOCATION, "r", encoding='UTF-8') as infile:
-        user_config = json.load(infile)
-        bot_ids = []
-        for account_id in user_config['accounts']:
-            user_config_account = user_config['accounts'][account_id]
-            account_name = user_config_account['account_name']
-            for currency in user_config_account['currencies']:
-                allocation = 0
-                for bot_id in user_config['accounts'][account_id]['currencies'][currency]:
-                    bot_ids.append(int(bot_id))
-                    # If a bot doesn't have its allocation defined, break
-                    bot_allocation = user_config_account['currencies'][currency][bot_id][
-                        'allocation']
-                    bot_name = user_config_account['currencies'][currency][bot_id]['bot_name']
-                    if not bot_allocation:
-                        webhook.notify_webhook(
-                            (
-                                f'{account_name} "{bot_name}" does not have an allocation defined'
-                            ),
-                            'ERROR'
-                        )
-                        return False
-                    allocation += float(bot_allocation)
-                # Throw warning if risk is greater than 100%
-                if allocation > 1:
-                    risk_factor_warning = (
-                        f'{account_name} {currency} has a '
-                        f'risk factor of {allocation * 100}'
-                    )
-                    logger.log(risk_factor_warning, "WARNING")
+    # if bots.json file DOES exist, make sure all allocations are defined
+    if user_config.errors:
+        # The full list can be long after bots.json got (re)generated, only notify the first ones
+        logger.log('bots.json errors:\n%s', "ERROR", '\n'.join(user_config.errors))
+        webhook.notify_webhook(
+            '\n'.join(
+                [f'bots.json has {len(user_config.errors)} errors, the full list is in the log:'] +
+                user_config.errors[:MAX_NOTIFIED_CONFIG_ERRORS]
+            ),
+            'ERROR'
+        )
+        return False
 
-        # if there is a live bot that does not have a config in bots.json, break
-        # print("bot_user_config['accounts']",bot_user_config['accounts'])
-        for account_id in bot_user_config['accounts']:
-            # If ingore other bots is active dont worry about checking other bots.
-            # just use the bots that are there.
+    # Throw warning if risk is greater than 100%
+    for account_name, currency, allocation in user_config.warnings:
+        logger.log(
+            '%s %s has a risk factor of %s',
+            "WARNING",
+            account_name, currency, allocation * 100
+        )
 
-            if "ignore_other_bots" in user_config['accounts'][str(account_id)] and \
-                user_config['accounts'][str(account_id)]["ignore_other_bots"] is True:
-                continue
+    # if there is a live bot that does not have a config in bots.json, break
+    for account in bot_fleet.accounts.values():
+        # If ingore other bots is active dont worry about checking other bots.
+        # just use the bots that are there.
+        if account.id in user_config.ignore_other_bots:
+            continue
 
-            for bot_id in bot_user_config['accounts'][account_id]['bots']:
-                if bot_id not in bot_ids:
-                    webhook.notify_webhook(
-                        (
-                            "bots.json is missing new bots. "
-                            f"[{bot_id}](https://3commas.io/bots/{bot_id}) \n"
-                            "Please delete the file and re-run this script"
-                        ),
-                        'ERROR'
-                    )
-                    return False
+        for bot_id in account.bots:
+            if bot_id not in user_config.bots:
+                webhook.notify_webhook(
+                    (
+                        "bots.json is missing new bots. "
+                        f"[{bot_id}](https://3commas.io/bots/{bot_id}) \n"
+                        "Please delete the file and re-run this script"
+                    ),
+                    'ERROR'
+                )
+                return False
     return user_config
 
 
+@metrics.timed('optimize_bot')
 def optimize_bot(
-        bot_id,
-        bot_json,
+        bot,
         max_currency_allocated,
         bot_max_active_deals,
         bot_same_pair_multiple,
         forced_mode
     ):
     '''
-    Helper function to find optimal bot settings and update 3c via api
-    :param bot_id: 3c ID of the bot
-    :param bot_json: bot settings to give to calc_max_funds_per_deal
+    Helper function to find optimal bot settings
+    :param bot: fleet bot with the settings to give to calc_max_funds_per_deal
     :param max_currency_allocated: total amount of funds we are allocating to the bot
-    :return:
+    :return: bot update for the update plan, None if the settings did not change
     '''
-    max_currency_allocation_info = f'max_currency_allocated: {max_currency_allocated}'
-    logger.log(max_currency_allocation_info, "INFO")
+    logger.log('max_currency_allocated: %s', "DEBUG", max_currency_allocated)
 
 
     # Get min BO and price step for currency on given exchange
-    min_volume = get_3c_currency_limit(bot_json)
+    min_volume, volume_step = get_3c_currency_limit(bot)
 
-    logger.log(f"min_volume {min_volume}", "INFO")
+    logger.log("min_volume %s", "DEBUG", min_volume)
 
 
     # Get ratio of BO:SO from bot settings
-    boso_ratio = float(bot_json['bo']) / float(bot_json['so'])
+    boso_ratio = float(bot.bo) / float(bot.so)
 
     buy_order = min_volume if boso_ratio <= 1 else min_volume * boso_ratio
     # Maintain ratio user has in their settings
     safety_order = buy_order / boso_ratio if boso_ratio <= 1 else min_volume
 
     # Get minimum max_funds for bot settings to use as starting point
-    mstc = int(bot_json['mstc']) # Max Safety Trades Count
-    sos = float(bot_json['sos']) # Safety Order Scale
-    order_scale = float(bot_json['os']) # Order Scale
-    safety_scale = float(bot_json['ss']) # Safety Scale
+    mstc = int(bot.mstc) # Max Safety Trades Count
+    sos = float(bot.sos) # Safety Order Scale
+    order_scale = float(bot.os) # Order Scale
+    safety_scale = float(bot.ss) # Safety Scale
 
-    max_funds_per_deal = calc_max_funds_per_deal(
+    max_funds_per_deal = optimizer.calc_max_funds_per_deal(
         bo=buy_order,
         so=safety_order,
         mstc=mstc,
@@ -701,18 +937,45 @@ def optimize_bot(
     valid_adosp = 1
 
     ### 09-02-2022 SanCoca BO SO MAD optimiser
-    bot_type = bot_json["type"]
-    bot_name = bot_json["name"]
+    bot_type = bot.type
+    bot_name = bot.name
     potential_max_deals = max_currency_allocated / max_funds_per_deal
     floor_max_deals = math.floor(potential_max_deals)
 
-    bot_type_info = f'bot_type: {bot_type}'
-    logger.log(bot_type_info, "INFO")
-    floor_max_deals_info = f'floor_max_deals: {floor_max_deals}'
-    logger.log(floor_max_deals_info, "INFO")
+    logger.log('bot_type: %s', "DEBUG", bot_type)
+    logger.log('floor_max_deals: %s', "DEBUG", floor_max_deals)
+
+    search_settings = None
+    if (
+        floor_max_deals >= 1 and
+        optimizer_mode == 'search' and
+        bot_type in ("Bot::MultiBot", "Bot::SingleBot")
+    ):
+        # Search BO:SO:MAD on the exchange volume step grid instead of scaling
+        search_settings = optimizer.search_bot_settings(
+            max_currency_allocated=max_currency_allocated,
+            bo=float(bot.bo),
+            so=float(bot.so),
+            mstc=mstc,
+            sos=sos,
+            os=order_scale,
+            ss=safety_scale,
+            min_volume=min_volume,
+            volume_step=volume_step,
+            max_active_deals=bot_max_active_deals if bot_type == "Bot::MultiBot" else 1
+        )
+        if search_settings is None:
+            # The grid rounds the minimal deal up past the allocation, scale it instead
+            logger.log(
+                'No grid settings of %s (%s) fit the allocation, using the ratio optimizer',
+                "INFO",
+                bot.name, bot.id
+            )
 
     # Make sure the bot can actually use 1 or more deals
-    if floor_max_deals >= 1:
+    if search_settings is not None:
+        valid_bo, valid_so, valid_mad, _ = search_settings
+    elif floor_max_deals >= 1:
         if bot_type == "Bot::MultiBot":
             if potential_max_deals >= bot_max_active_deals:
                 # Potential max deals is greater than we want it to be (6),
@@ -744,11 +1007,8 @@ def optimize_bot(
                 valid_so += safety_order * deal_bo_so_increase
                 valid_mad = floor_max_deals
 
-            remainig_deal_space_info = f'remainig_deal_space {remainig_deal_space}'
-            logger.log(remainig_deal_space_info, "INFO")
-
-            deal_bo_so_increase_info = f'deal_bo_so_increase {deal_bo_so_increase}'
-            logger.log(deal_bo_so_increase_info, "INFO")
+            logger.log('remainig_deal_space %s', "DEBUG", remainig_deal_space)
+            logger.log('deal_bo_so_increase %s', "DEBUG", deal_bo_so_increase)
         elif bot_type == "Bot::SingleBot":
             valid_bo = buy_order * potential_max_deals
             valid_so = safety_order * potential_max_deals
@@ -757,13 +1017,13 @@ def optimize_bot(
             (
                 f'Not enough funds for 1 active deal, '
                 'using minimum bo:so for bot: '
-                f'[{bot_name}](https://3commas.io/bots/{bot_id})'
+                f'[{bot_name}](https://3commas.io/bots/{bot.id})'
             ),
             'WARNING'
         )
 
     max_funds_per_deal_new_size = \
-        calc_max_funds_per_deal(
+        optimizer.calc_max_funds_per_deal(
             bo=valid_bo,
             so=valid_so,
             mstc=mstc,
@@ -772,13 +1032,8 @@ def optimize_bot(
             ss=safety_scale
         )
 
-    # max funds per deal size info text
-    max_funds_per_deal_new_size_info = f'max_funds_per_deal_new_size: {max_funds_per_deal_new_size}'
-    logger.log(max_funds_per_deal_new_size_info, "INFO")
-
-    total_funds_used_by_bot = max_funds_per_deal_new_size * valid_mad
-    total_funds_used_by_bot_info = f'total_funds_used_by_bot: {total_funds_used_by_bot}'
-    logger.log(total_funds_used_by_bot_info, "INFO")
+    logger.log('max_funds_per_deal_new_size: %s', "DEBUG", max_funds_per_deal_new_size)
+    logger.log('total_funds_used_by_bot: %s', "DEBUG", max_funds_per_deal_new_size * valid_mad)
 
     # Round to max 8 the bo:so
     valid_bo = round(valid_bo, 8)
@@ -788,123 +1043,525 @@ def optimize_bot(
         valid_adosp = math.ceil(valid_mad / bot_same_pair_multiple)
 
     if (
-        float(bot_json['bo']) != valid_bo or
-        float(bot_json['so']) != valid_so or
-        bot_json['mad'] != valid_mad or
-        bot_json['adosp'] != valid_adosp
+        float(bot.bo) != valid_bo or
+        float(bot.so) != valid_so or
+        bot.mad != valid_mad or
+        bot.adosp != valid_adosp
     ):
         # Only Send api requests to 3c to update the bot if the data is different than what it was.
-        optimal_found_info = (
-            f'Optimal settings for {bot_json["name"]} ({bot_id}) found! '
-            f'BO: {round(valid_bo, 8)}, SO: {round(valid_so, 8)}, '
-            f'MAD: {valid_mad}, ADOSP: {valid_adosp}'
+        logger.log(
+            'Optimal settings for %s (%s) found! BO: %s, SO: %s, MAD: %s, ADOSP: %s',
+            "INFO",
+            bot.name, bot.id, valid_bo, valid_so, valid_mad, valid_adosp
         )
-        logger.log(optimal_found_info, "INFO")
-
-        update_bot(
-            bot_id,
-            valid_bo,
-            valid_so,
-            valid_mad,
-            valid_adosp,
-            bot_json,
-            forced_mode=forced_mode
+
+        return {
+            'bot_id': bot.id,
+            'bot_name': bot.name,
+            'forced_mode': forced_mode,
+            'old': {
+                'bo': float(bot.bo),
+                'so': float(bot.so),
+                'mad': bot.mad,
+                'adosp': bot.adosp
+            },
+            'new': {
+                'bo': valid_bo,
+                'so': valid_so,
+                'mad': valid_mad,
+                'adosp': valid_adosp
+            },
+            'bot': bot
+        }
+
+    # Did not find newer settings
+    logger.log('Could not find new optimal settings for %s (%s).', "INFO", bot.name, bot.id)
+    return None
+
+
+def new_run_summary():
+    '''
+    :return: summary of a run, bot counts per stage
+    '''
+    return {
+        'valid_config': False,
+        'bots_skipped': 0,
+        'bots_optimized': 0,
+        'bots_planned': 0,
+        'bots_updated': 0
+    }
+
+
+def compound_bots(account_bots, user_config, run_summary, partial=False):
+    '''
+    Optimizes the given bots and writes the new settings to 3c
+    :param account_bots: iterable of (fleet account, fleet bot)
+    :param user_config: compiled bots.json
+    :param run_summary: summary of the run, the bot counts get added to it
+    :param partial: True if only a part of the fleet is compounded,
+        the state of the other bots is kept
+    '''
+    compounding_state.load(partial=partial)
+
+    # Collect the bots to optimize, skipping bots whose inputs did not change
+    bot_jobs = []
+    skipped_count = 0
+    # Loop through each bot to multiply the allocation against total balance
+    # for the accounts currency balance
+    for account, bot in account_bots:
+        bot_currency = bot.currency
+        account_balance = account.balance(bot_currency)
+
+        # Get the allocation for the bot from user_config
+        user_conf_bot = user_config.bots.get(bot.id)
+        if (
+            user_conf_bot is None or
+            user_conf_bot.account_id != account.id or
+            user_conf_bot.currency != bot_currency
+        ):
+            logger.log(
+                'Bot %s is not in bots.json for %s %s', "DEBUG",
+                bot.id, account.name, bot_currency
+            )
+            continue
+
+        # Print account balance
+        logger.log(
+            "%s %s balance: %s",
+            "DEBUG",
+            account.name,
+            bot_currency,
+            account_balance
+        )
+
+        bot_allocation = user_conf_bot.allocation
+        bot_max_active_deals = user_conf_bot.max_active_deals
+        bot_same_pair_multiple = user_conf_bot.bot_same_pair_multiple
+
+        bot_inputs = state_store.bot_inputs(
+            balance=account_balance,
+            allocation=bot_allocation,
+            max_active_deals=bot_max_active_deals,
+            bot_same_pair_multiple=bot_same_pair_multiple,
+            bot=bot,
+            optimizer_mode=optimizer_mode
         )
+        if compounding_state.is_unchanged(bot.id, bot_inputs):
+            compounding_state.keep(bot.id)
+            skipped_count += 1
+            continue
+
+        max_currency_allocated = \
+            float(account_balance) * float(bot_allocation)
+
+        logger.log(
+            "Allocation allowed: %s %s",
+            "DEBUG",
+            max_currency_allocated, bot_currency
+        )
+
+        bot_jobs.append({
+            'bot': bot,
+            'max_currency_allocated': max_currency_allocated,
+            'bot_max_active_deals': bot_max_active_deals,
+            'bot_same_pair_multiple': bot_same_pair_multiple,
+            'forced_mode': account.forced_mode,
+            'inputs': bot_inputs
+        })
+
+    logger.log(
+        'Skipped %s bots with unchanged inputs, optimizing %s bots',
+        "INFO",
+        skipped_count, len(bot_jobs)
+    )
+
+    # Warm the market limits cache concurrently for every pair we are going to optimize
+    fetcher.fan_out(
+        lambda market_pair: get_pair_limits(*market_pair),
+        {
+            (bot_job['bot'].market_code, bot_job['bot'].pairs[0])
+            for bot_job in bot_jobs
+        }
+    )
+
+    run_summary['bots_skipped'] += skipped_count
+    run_summary['bots_optimized'] += len(bot_jobs)
+
+    # Plan the bot updates, nothing gets written to 3c yet
+    update_plan = []
+    planned_inputs = {}
+    for bot_job in bot_jobs:
+        bot = bot_job['bot']
+        try:
+            # Pass the settings to optimize function to find optimal BO:SO for allocation
+            bot_update = optimize_bot(
+                bot=bot,
+                max_currency_allocated=bot_job['max_currency_allocated'],
+                bot_max_active_deals=bot_job['bot_max_active_deals'],
+                bot_same_pair_multiple=bot_job['bot_same_pair_multiple'],
+                forced_mode=bot_job['forced_mode']
+            )
+        except Exception as error:  # pylint: disable=broad-except
+            # One bad bot shouldn't stop the others, it is not recorded so it gets retried
+            webhook.notify_webhook(
+                (
+                    f'Could not optimize [{bot.name}](https://3commas.io/bots/{bot.id}): '
+                    f'{error!r}'
+                ),
+                'ERROR'
+            )
+            continue
+
+        if bot_update:
+            update_plan.append(bot_update)
+            planned_inputs[bot.id] = bot_job['inputs']
+        else:
+            # Settings on 3c are already optimal for these inputs
+            compounding_state.record(bot.id, bot_job['inputs'])
+
+    market_limits_cache.save()
+    run_summary['bots_planned'] += len(update_plan)
+
+    if test_mode == 'True':
+        # Test mode only produces the plan
+        print(update_plan_to_json(update_plan))
+        logger.log("Test Run Completed!", "INFO")
     else:
-        # Did not find newer settings
-        no_optimal_found_info = (
-            'Could not find new optimal settings for '
-            f'{bot_json["name"]} ({bot_id}).'
+        # Write the plan to 3c
+        update_results = apply_update_plan(update_plan)
+        for bot_update, update_result in zip(update_plan, update_results):
+            # Failed updates are not recorded so they get retried next run
+            if update_result['updated']:
+                # Keep the fleet in sync with 3c for the next (daemon) recompute
+                bot_update['bot'].apply(bot_update['new'])
+                compounding_state.record(
+                    bot_update['bot_id'],
+                    state_store.with_applied(
+                        planned_inputs[bot_update['bot_id']],
+                        bot_update['new']
+                    )
+                )
+        run_summary['bots_updated'] += sum(
+            1 for update_result in update_results if update_result['updated']
         )
-        logger.log(no_optimal_found_info, "INFO")
 
+    compounding_state.save()
 
 
-def compounder_start():
+def compound_fleet(run_summary):
     '''
-    Compounder start method. this starts all the other
+    Gets the fleet from 3c, checks it against bots.json and compounds every bot
+    :param run_summary: summary of the run, filled in by this run
+    :return: (fleet, compiled bots.json or False if it is not valid)
     '''
     # Get bot configs from 3c
-    bot_config = get_config()
+    bot_fleet = get_config()
 
     # Compare 3c live configs against user config (bots.json)
-    user_config = check_user_config(bot_config)
+    user_config = check_user_config(bot_fleet)
 
     # If configs are good, update bots
     if user_config:
         logger.log('Valid config found, proceeding to update bots...', "INFO")
-        # Update the bots
-        for account_id in bot_config['accounts']:
-            # Get account balances
-            account_balances = bot_config['accounts'][account_id]['balances']
-            # Loop through each bot to multiply the allocation against total balance
-            # for the accounts currency balance
-            for bot_id in bot_config['accounts'][account_id]['bots']:
-                bot_json = bot_config['accounts'][account_id]['bots'][bot_id]
-                bot_currency = bot_json['currency']
-
-                config_account = user_config['accounts'][str(account_id)]
-                if bot_currency not in config_account['currencies']:
-                    continue
-
-                if str(bot_id) not in config_account['currencies'][bot_currency]:
-                    print(
-                        "config_account['currencies'][bot_currency]", 
-                        config_account['currencies'][bot_currency]
-                    )
-                    print('bot_id', bot_id)
-                    continue
+        run_summary['valid_config'] = True
 
-                # Print account balance
-                account_currency_balance_info = (
-                    f"{bot_config['accounts'][account_id]['account_name']} "
-                    f"{bot_currency} balance: {account_balances[bot_currency]}"
-                )
-                logger.log(account_currency_balance_info, "INFO")
+        compound_bots(
+            (
+                (account, bot)
+                for account in bot_fleet.accounts.values()
+                if account.id not in bot_fleet.unbalanced_accounts
+                for bot in account.bots.values()
+            ),
+            user_config,
+            run_summary,
+            # Bots of the skipped accounts keep their state for the next run
+            partial=bool(bot_fleet.unbalanced_accounts)
+        )
 
+    return bot_fleet, user_config
 
-                # Get the allocation for the bot from user_config
-                user_conf_bot = config_account['currencies'][bot_currency][str(bot_id)]
 
-                bot_allocation = user_conf_bot['allocation']
-                # check if bot has Max active deal, if it does use it otherwise set it to 1
-                bot_max_active_deals = 1 \
-                    if not "max_active_deals" in user_conf_bot \
-                    else user_conf_bot['max_active_deals']
+@metrics.timed('compounder_start')
+def compounder_start():
+    '''
+    Compounder start method. this starts all the other
+    :return: summary of the run, bot counts per stage
+    '''
+    cold_start()
+    p3cw_scheduler.reset_counts()
+    run_summary = new_run_summary()
 
-                # allow multiple deals with same pair
-                bot_same_pair_multiple = False \
-                    if not "bot_same_pair_multiple" in user_conf_bot \
-                    else user_conf_bot['bot_same_pair_multiple']
+    compound_fleet(run_summary)
 
-                max_currency_allocated = \
-                    float(account_balances[bot_currency]) * float(bot_allocation)
+    p3cw_scheduler.log_counts()
 
-                allocation_allowance_info = (
-                    "Allocation allowed: "
-                    f"{max_currency_allocated} {bot_currency}"
-                )
-                logger.log(allocation_allowance_info, "INFO")
+    # Send the notifications queued during the run
+    webhook.flush()
 
+    return run_summary
 
 
-                # Pass the settings to optimize function to find optimal BO:SO for allocation
-                optimize_bot(
-                    bot_id=bot_id,
-                    bot_json=bot_json,
-                    max_currency_allocated=max_currency_allocated,
-                    bot_max_active_deals=bot_max_active_deals,
-                    bot_same_pair_multiple=bot_same_pair_multiple,
-                    forced_mode=bot_config['accounts'][account_id]['forced_mode']
-                )
+@metrics.timed('refresh_account_balances')
+def refresh_account_balances(accounts):
+    '''
+    Re-reads the equity and active deals of the accounts and recalculates their currency balances
+    :param accounts: list of fleet accounts
+    :return: list of the accounts that got refreshed, accounts with errors are left out
+    '''
+    balances_per_account = fetcher.fan_out(
+        lambda account: fetch_account_balances(account.id, forced_mode=account.forced_mode),
+        accounts
+    )
+    deals_index = fetch_deals_index(accounts)
+
+    refreshed_accounts = []
+    for account, (error, account_balances) in zip(accounts, balances_per_account):
+        if error or account.id not in deals_index:
+            # Don't compound with a partial balance, the bots would shrink
+            logger.log('Could not refresh the balances of %s: %s', "ERROR", account.name, error)
+            continue
+
+        for bucket in account.currencies.values():
+            bucket.balance = 0.0
+        aggregate_account_balances(account, account_balances, deals_index[account.id])
+        refreshed_accounts.append(account)
+
+    return refreshed_accounts
+
+
+def compound_buckets(bot_fleet, user_config, buckets):
+    '''
+    Refreshes the balances and compounds only the bots of the given currency buckets
+    :param bot_fleet: fleet of the last full run
+    :param user_config: compiled bots.json of the last full run
+    :param buckets: iterable of (account_id, currency)
+    :return: summary of the run, bot counts per stage
+    '''
+    run_summary = new_run_summary()
+    run_summary['valid_config'] = True
+
+    # account id: currencies to compound
+    currencies_per_account = {}
+    for account_id, currency in buckets:
+        account = bot_fleet.accounts.get(account_id)
+        # Deals of bots that are not compounded, or of accounts we don't know yet
+        if account is None or currency not in account.currencies:
+            continue
+        currencies_per_account.setdefault(account_id, set()).add(currency)
+
+    if not currencies_per_account:
+        return run_summary
+
+    accounts = refresh_account_balances(
+        [bot_fleet.accounts[account_id] for account_id in currencies_per_account]
+    )
+    compound_bots(
+        (
+            (account, bot)
+            for account in accounts
+            for currency in sorted(currencies_per_account[account.id])
+            for bot in account.currencies[currency].bots
+        ),
+        user_config,
+        run_summary,
+        partial=True
+    )
+
+    return run_summary
+
+
+def deal_cursor(deal):
+    '''
+    :param deal: finished deal from the 3c api
+    :return: (closed_at, id), orders deals by the time they closed
+    '''
+    return (deal.get('closed_at') or '', deal['id'])
+
+
+@metrics.timed('fetch_finished_deals')
+def fetch_finished_deals(forced_mode, cursor):
+    '''
+    Gets the deals that closed after the cursor, newest first.
+    Pages are only requested until the cursor is reached.
+    :param forced_mode: 'real' or 'paper' trading.
+    :param cursor: deal_cursor of the newest closed deal seen, None to only get the newest deal
+    :return: (error, deals closed after the cursor)
+    '''
+    finished_deals = fetcher.Paginator(
+        lambda offset, limit: p3cw_scheduler.request(
+            entity='deals',
+            action='',
+            payload={
+                "scope": "finished",
+                "limit": limit,
+                "offset": offset,
+                "order": "closed_at",
+                "order_direction": "desc"
+            },
+            additional_headers={'Forced-Mode': forced_mode}
+        ),
+        finished_deals_page_size,
+        # Usually the first page already reaches the cursor
+        prefetch=False
+    )
+
+    new_deals = []
+    for deal in finished_deals:
+        if cursor is not None and deal_cursor(deal) <= cursor:
+            break
+        new_deals.append(deal)
+        if cursor is None:
+            break
+
+    return finished_deals.error, new_deals
+
+
+def poll_closed_deals(cursors):
+    '''
+    Polls every forced mode for deals that closed since the last poll
+    :param cursors: {forced_mode: deal_cursor of the newest closed deal seen}, gets updated.
+        A mode without cursor only gets its cursor set.
+    :return: set of (account_id, currency) with closed deals
+    '''
+    buckets = set()
+    results = fetcher.fan_out(
+        lambda forced_mode: fetch_finished_deals(forced_mode, cursors.get(forced_mode)),
+        FORCED_MODES
+    )
+    for forced_mode, (error, new_deals) in zip(FORCED_MODES, results):
+        if error:
+            logger.log('Could not poll %s finished deals: %s', "ERROR", forced_mode, error)
+            continue
+
+        first_poll = forced_mode not in cursors
+        # Without finished deals every deal closing later is new
+        cursors.setdefault(forced_mode, ('', 0))
+        if not new_deals:
+            continue
+
+        cursors[forced_mode] = max(cursors[forced_mode], deal_cursor(new_deals[0]))
+        if first_poll:
+            continue
+
+        for deal in new_deals:
+            logger.log('Deal %s of bot %s closed', "INFO", deal['id'], deal['bot_id'])
+            buckets.add((
+                deal['account_id'],
+                get_currency(deal['pair'], deal['strategy'], deal['base_order_volume_type'])
+            ))
+
+    return buckets
+
+
+class FleetSession:
+    '''
+    Fleet and bots.json of the last full run, kept in memory by the long running modes
+    (main.py --daemon and receiver.py) to compound single currency buckets
+    '''
+
+    def __init__(self, full_refresh_interval):
+        '''
+        :param full_refresh_interval: seconds between full runs
+        '''
+        self.full_refresh_interval = full_refresh_interval
+        self.bot_fleet = None
+        # compiled bots.json, False if it is not valid
+        self.user_config = None
+        # bots.json the last full run used, a changed file triggers a full run
+        self._loaded_config = None
+        self._next_full_run = 0
+
+    def refresh(self):
+        '''
+        Compounds every bot when the full refresh interval passed or bots.json changed
+        :return: summary of the full run, None if no full run was needed
+        '''
+        started_at = time.monotonic()
+        if (
+            started_at < self._next_full_run and
+            bots_config.load(BOTS_CONFIG_LOCATION) is self._loaded_config
+        ):
+            return None
+
+        cold_start()
+        self._loaded_config = bots_config.load(BOTS_CONFIG_LOCATION)
+        run_summary = new_run_summary()
+        self.bot_fleet, self.user_config = compound_fleet(run_summary)
+        self._next_full_run = started_at + self.full_refresh_interval
+        logger.log('Full run: %s', "INFO", run_summary)
+        return run_summary
+
+    def compound(self, buckets):
+        '''
+        Compounds the bots of the given currency buckets with the fleet of the last full run
+        :param buckets: set of (account_id, currency)
+        :return: summary of the run, None if bots.json is not valid
+        '''
+        if not self.user_config:
+            return None
+
+        run_summary = compound_buckets(self.bot_fleet, self.user_config, buckets)
+        logger.log('Compounded %s: %s', "INFO", sorted(buckets), run_summary)
+        return run_summary
+
+
+def run_daemon():
+    '''
+    Keeps the 3c client, caches and fleet in memory and polls for closed deals.
+    Only the currency buckets of accounts with closed deals get compounded again,
+    every bot is compounded again on the full refresh interval or when bots.json changes.
+    '''
+    logger.log(
+        'Compounder daemon started, polling closed deals every %ss', "INFO", daemon_poll_interval
+    )
+    cold_start()
+    cursors = {}
+    # Set the cursors before the full run, deals closing during the run are picked up next poll
+    poll_closed_deals(cursors)
+
+    session = FleetSession(daemon_full_refresh_interval)
+
+    while True:
+        started_at = time.monotonic()
+        try:
+            if session.refresh() is None and session.user_config:
+                buckets = poll_closed_deals(cursors)
+                if buckets:
+                    session.compound(buckets)
+        except Exception as error:  # pylint: disable=broad-except
+            # Keep the daemon running, the next iteration retries
+            webhook.notify_webhook(f'Compounder daemon error: {error!r}', 'ERROR')
+        finally:
+            webhook.flush()
+            metrics.flush()
+
+        time.sleep(max(0.0, daemon_poll_interval - (time.monotonic() - started_at)))
+
 
 def request_handler(event, lambda_context):
     '''
     Lambda request handler to / entry for lambda
     '''
-    compounder_start()
+    try:
+        compounder_start()
+    finally:
+        # Lambda freezes the notifier thread after returning, make sure everything got sent
+        webhook.flush()
+        metrics.flush()
 
 
 if __name__ == "__main__":
 
-    compounder_start()
+    parser = argparse.ArgumentParser(description=__doc__.strip())
+    parser.add_argument(
+        '--daemon',
+        action='store_true',
+        help='keep running and compound accounts as soon as their deals close'
+    )
+    if parser.parse_args().daemon:
+        run_daemon()
+    else:
+        try:
+            compounder_start()
+        finally:
+            metrics.flush()
@@ -0,0 +1,163 @@
+'''
+Timing spans and 3commas api metrics, written as CloudWatch Embedded Metric Format (EMF) records.
+Measurements are buffered per phase/endpoint and written by flush() at the end of a run.
+'''
+
+import functools
+import json
+import sys
+import threading
+import time
+
+from collections import Counter
+from contextlib import contextmanager
+from typing import Optional
+
+DEFAULT_NAMESPACE = '3commas-compounder'
+# EMF allows up to 100 values per metric in a single record
+MAX_VALUES_PER_RECORD = 100
+
+enabled = False
+namespace = DEFAULT_NAMESPACE
+# None writes to stdout, which lambda forwards to CloudWatch logs
+output_path: Optional[str] = None
+
+# (dimension, name): {'units': {metric: unit}, 'values': [({metric: value}, status)]}
+_measurements: dict[tuple, dict] = {}
+_lock = threading.Lock()
+
+
+def configure(
+    _enabled: bool, _namespace: str = DEFAULT_NAMESPACE, _output_path: Optional[str] = None
+):
+    '''
+    :param _enabled: False makes every measurement a no-op
+    :param _namespace: CloudWatch metrics namespace
+    :param _output_path: file to append the records to, None writes to stdout
+    '''
+    global enabled, namespace, output_path  # pylint: disable=global-statement
+    enabled = _enabled
+    namespace = _namespace
+    output_path = _output_path
+
+
+def _record(dimension: str, name: str, values: dict, units: dict, status=None):
+    with _lock:
+        measurement = _measurements.setdefault((dimension, name), {'units': units, 'values': []})
+        measurement['values'].append((values, status))
+
+
+def record_span(phase: str, duration: float):
+    '''
+    :param phase: name of the phase, i.e. get_config
+    :param duration: seconds the phase took
+    '''
+    if enabled:
+        _record('Phase', phase, {'Duration': duration * 1000}, {'Duration': 'Milliseconds'})
+
+
+def record_request(endpoint: str, duration: float, status_code, retries: int):
+    '''
+    :param endpoint: endpoint name, i.e. bots/update
+    :param duration: seconds the request took, including retries
+    :param status_code: http status code of the last attempt, None without response
+    :param retries: amount of retries
+    '''
+    if enabled:
+        _record(
+            'Endpoint',
+            endpoint,
+            {'Duration': duration * 1000, 'Retries': retries},
+            {'Duration': 'Milliseconds', 'Retries': 'Count'},
+            status_code
+        )
+
+
+@contextmanager
+def span(phase: str):
+    '''
+    Measures the duration of the with block
+    :param phase: name of the phase
+    '''
+    started_at = time.perf_counter()
+    try:
+        yield
+    finally:
+        record_span(phase, time.perf_counter() - started_at)
+
+
+def timed(phase: str):
+    '''
+    Decorator measuring every call of the function as a span
+    :param phase: name of the phase
+    '''
+    def decorator(func):
+        @functools.wraps(func)
+        def wrapper(*args, **kwargs):
+            with span(phase):
+                return func(*args, **kwargs)
+        return wrapper
+    return decorator
+
+
+def to_emf_records(timestamp: Optional[int] = None):
+    '''
+    Drains the buffered measurements into EMF records
+    :param timestamp: epoch milliseconds of the records, defaults to now
+    :return: list of EMF dicts
+    '''
+    with _lock:
+        measurements = dict(_measurements)
+        _measurements.clear()
+
+    timestamp = timestamp if timestamp is not None else int(time.time() * 1000)
+    records = []
+    for (dimension, name), measurement in measurements.items():
+        units = measurement['units']
+        values = measurement['values']
+        for start in range(0, len(values), MAX_VALUES_PER_RECORD):
+            chunk = values[start:start + MAX_VALUES_PER_RECORD]
+            record = {
+                '_aws': {
+                    'Timestamp': timestamp,
+                    'CloudWatchMetrics': [{
+                        'Namespace': namespace,
+                        'Dimensions': [[dimension]],
+                        'Metrics': [
+                            {'Name': metric, 'Unit': unit} for metric, unit in units.items()
+                        ]
+                    }]
+                },
+                dimension: name,
+                'Calls': len(chunk),
+            }
+            for metric in units:
+                record[metric] = [round(chunk_values[metric], 3) for chunk_values, _ in chunk]
+            status_codes = Counter(str(status) for _, status in chunk if status is not None)
+            if status_codes:
+                record['StatusCodes'] = dict(status_codes)
+            records.append(record)
+
+    return records
+
+
+def flush():
+    '''
+    Writes the buffered measurements as EMF records, one json record per line
+    '''
+    if not enabled:
+        return
+
+    lines = ''.join(
+        json.dumps(record, separators=(',', ':')) + '\n' for record in to_emf_records()
+    )
+    if not lines:
+        return
+
+    if output_path:
+        with open(output_path, 'a', encoding='UTF-8') as outfile:
+            outfile.write(lines)
+    else:
+        # EMF lines need to be on stdout as is, without the logging prefix
+        sys.stdout.write(lines)
+        sys.stdout.flush()
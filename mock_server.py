@@ -0,0 +1,613 @@
+'''
+Local stand-in for the 3commas api, serves a synthetic fleet of accounts, bots and deals.
+Only implements the endpoints the compounder uses,
+the routes are taken from 3commas_swaggerdoc.json.
+
+Run it and point the compounder at it with api_url in the [3commas] section of config.ini:
+    python mock_server.py --accounts 200 --bots 10000 --latency 0.05 --throttle-rate 0.01 \
+        --bots-json bot_config/bots.json
+'''
+
+import argparse
+import json
+import math
+import os
+import random
+import re
+import threading
+import time
+
+from collections import Counter
+from datetime import datetime, timedelta, timezone
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+from typing import cast
+from urllib.parse import parse_qs, urlsplit
+
+SWAGGER_DOC = os.path.join(os.path.dirname(os.path.abspath(__file__)), '3commas_swaggerdoc.json')
+
+# (method, swagger path): endpoint name, names match the request scheduler call counts
+ROUTES = {
+    ('GET', '/ver1/bots'): 'bots',
+    ('PATCH', '/ver1/bots/{bot_id}/update'): 'bots/update',
+    ('GET', '/ver1/deals'): 'deals',
+    ('GET', '/ver1/accounts/currency_rates'): 'accounts/currency_rates',
+    ('GET', '/ver1/accounts/{account_id}'): 'accounts/account_info',
+    ('POST', '/ver1/accounts/{account_id}/load_balances'): 'accounts/load_balances',
+    ('POST', '/ver1/accounts/{account_id}/account_table_data'): 'accounts/account_table_data',
+}
+
+STATS_PATH = '/__mock__/stats'
+
+# 3c page size limits
+BOTS_MAX_LIMIT = 100
+DEALS_MAX_LIMIT = 1000
+
+MARKET_CODES = ('binance', 'ftx', 'kucoin')
+BASE_COINS = (
+    'ETH', 'ADA', 'SOL', 'DOT', 'LINK', 'MATIC', 'AVAX', 'ATOM', 'XRP', 'LTC',
+    'BNB', 'TRX', 'NEAR', 'ALGO', 'FTM', 'VET', 'EGLD', 'FIL', 'XLM', 'AAVE'
+)
+# quote: (equity range, base order range, min total, price step)
+QUOTE_CURRENCIES = {
+    'USDT': ((1000, 50000), (10, 50), '10.0', '0.01'),
+    'BUSD': ((1000, 50000), (10, 50), '10.0', '0.01'),
+    'BTC': ((0.05, 2), (0.0002, 0.001), '0.0001', '0.00000001'),
+}
+
+
+def load_routes(doc_path=SWAGGER_DOC):
+    '''
+    Compiles the implemented routes, every route has to exist in the swagger doc
+    :param doc_path: location of 3commas_swaggerdoc.json
+    :return: list of (method, compiled path regex, endpoint name)
+    '''
+    with open(doc_path, 'r', encoding='UTF-8') as infile:
+        doc = json.load(infile)
+
+    routes = []
+    for (method, path), endpoint in ROUTES.items():
+        if method.lower() not in doc['paths'].get(path, {}):
+            raise ValueError(f'{method} {path} is not in {doc_path}')
+        pattern = re.sub(r'\\{(\w+)\\}', r'(?P<\1>[^/]+)', re.escape(doc['basePath'] + path))
+        routes.append((method, re.compile(f'^{pattern}$'), endpoint))
+
+    # Literal paths first, i.e. accounts/currency_rates before accounts/{account_id}
+    routes.sort(key=lambda route: route[1].groups)
+    return routes
+
+
+def _timestamp(moment):
+    return moment.strftime('%Y-%m-%dT%H:%M:%S.000Z')
+
+
+class Fleet:
+    '''
+    Synthetic accounts, bots, deals and balances, generated from a seed
+    '''
+
+    def __init__(
+            self,
+            accounts: int = 3,
+            bots: int = 40,
+            deals_per_bot: int = 3,
+            paper_accounts: int = 0,
+            short_ratio: float = 0.0,
+            seed: int = 1
+        ):
+        '''
+        :param accounts: amount of real accounts
+        :param bots: amount of enabled bots, spread over all accounts
+        :param deals_per_bot: max active deals per bot, every bot gets 0 up to this amount
+        :param paper_accounts: amount of paper accounts on top of the real accounts
+        :param short_ratio: share of short bots
+        :param seed: random seed, the same seed generates the same fleet
+        '''
+        rnd = random.Random(seed)
+        now = datetime.now(timezone.utc)
+        self.lock = threading.Lock()
+
+        self.accounts = {}
+        for index in range(accounts + paper_accounts):
+            account_id = 30000000 + index
+            self.accounts[account_id] = {
+                'id': account_id,
+                'name': f'account {index}',
+                'market_code': rnd.choice(MARKET_CODES),
+                'mode': 'real' if index < accounts else 'paper',
+            }
+
+        self.balances = {
+            account_id: [
+                {
+                    'currency_code': quote,
+                    'equity': f'{rnd.uniform(*equity):.8f}',
+                }
+                for quote, (equity, _, _, _) in QUOTE_CURRENCIES.items()
+            ]
+            for account_id in self.accounts
+        }
+
+        account_ids = list(self.accounts)
+        self.bots = {}
+        self.deals: list[dict] = []
+        for index in range(bots):
+            bot_id = 9000000 + index
+            account = self.accounts[account_ids[index % len(account_ids)]]
+            quote = rnd.choice(list(QUOTE_CURRENCIES))
+            base = rnd.choice(BASE_COINS)
+            _, (order_min, order_max), _, _ = QUOTE_CURRENCIES[quote]
+            base_order = rnd.uniform(order_min, order_max)
+            strategy = 'short' if rnd.random() < short_ratio else 'long'
+            volume_type = 'quote_currency' if strategy == 'long' else 'base_currency'
+            bot_type = rnd.choice(('Bot::MultiBot', 'Bot::SingleBot'))
+
+            self.bots[bot_id] = {
+                'id': bot_id,
+                'account_id': account['id'],
+                'account_name': account['name'],
+                'is_enabled': True,
+                'name': f'bot {index} {quote}_{base}',
+                'type': bot_type,
+                'strategy': strategy,
+                'pairs': [f'{quote}_{base}'],
+                'base_order_volume': f'{base_order:.8f}',
+                'base_order_volume_type': volume_type,
+                'safety_order_volume': f'{base_order * rnd.choice((1, 2, 3)):.8f}',
+                'safety_order_volume_type': volume_type,
+                'martingale_volume_coefficient': str(rnd.choice((1.0, 1.05, 1.2, 1.5))),
+                'martingale_step_coefficient': str(rnd.choice((1.0, 1.1, 1.3))),
+                'safety_order_step_percentage': str(rnd.choice((1.0, 1.5, 2.0, 2.5))),
+                'max_safety_orders': rnd.randint(3, 20),
+                'active_safety_orders_count': 1,
+                'max_active_deals': rnd.randint(1, 5) if bot_type == 'Bot::MultiBot' else 1,
+                'allowed_deals_on_same_pair': 1,
+                'take_profit': '1.5',
+                'take_profit_type': 'total',
+                'strategy_list': [{'strategy': 'nonstop'}],
+                'created_at': _timestamp(now - timedelta(days=30)),
+                'updated_at': _timestamp(now - timedelta(days=1)),
+            }
+
+            for _ in range(rnd.randint(0, deals_per_bot)):
+                bought_volume = base_order * rnd.uniform(1, 5)
+                self.deals.append({
+                    'id': 1000000000 + len(self.deals),
+                    'bot_id': bot_id,
+                    'account_id': account['id'],
+                    'pair': f'{quote}_{base}',
+                    'strategy': strategy,
+                    'status': 'bought',
+                    'finished?': False,
+                    'base_order_volume_type': volume_type,
+                    'bought_volume': f'{bought_volume:.8f}',
+                    'sold_amount': f'{bought_volume * rnd.uniform(0.5, 1):.8f}',
+                    'sold_volume': f'{bought_volume * rnd.uniform(0, 0.1):.8f}',
+                    'created_at': _timestamp(now - timedelta(minutes=rnd.randint(1, 43200))),
+                    'closed_at': None,
+                })
+
+        self.deals.sort(key=lambda deal: deal['created_at'])
+
+    def visible_accounts(self, forced_mode):
+        '''
+        :param forced_mode: 'real' or 'paper', from the Forced-Mode header
+        :return: ids of the accounts available in that mode
+        '''
+        return {
+            account_id for account_id, account in self.accounts.items()
+            if account['mode'] == forced_mode
+        }
+
+    def bots_json(self, forced_mode='real'):
+        '''
+        bots.json matching the fleet, the allocation is split evenly per currency
+        :param forced_mode: 'real' or 'paper'
+        :return: bots.json dict
+        '''
+        user_config = {'accounts': {}}
+        account_ids = self.visible_accounts(forced_mode)
+        for bot in self.bots.values():
+            if bot['account_id'] not in account_ids:
+                continue
+            pair = bot['pairs'][0].split('_')
+            currency = pair[0] if bot['base_order_volume_type'] == 'quote_currency' else pair[1]
+            account = user_config['accounts'].setdefault(str(bot['account_id']), {
+                'forced_mode': forced_mode,
+                'account_name': bot['account_name'],
+                'currencies': {},
+            })
+            bot_config = {'bot_name': bot['name'], 'allocation': None}
+            if bot['type'] == 'Bot::MultiBot':
+                bot_config['max_active_deals'] = bot['max_active_deals']
+            account['currencies'].setdefault(currency, {})[str(bot['id'])] = bot_config
+
+        for account in user_config['accounts'].values():
+            for currency_bots in account['currencies'].values():
+                for bot_config in currency_bots.values():
+                    # Round down so the allocations never add up to more than 100%
+                    bot_config['allocation'] = math.floor(9999 / len(currency_bots)) / 10000
+
+        return user_config
+
+    def close_deal(self, deal_id: int, profit: float = 0.0):
+        '''
+        Closes an active deal and adds its profit to the account equity,
+        i.e. to test main.py --daemon
+        :param deal_id: id of an active deal
+        :param profit: profit of the deal in the quote currency of its pair
+        :return: the closed deal
+        '''
+        with self.lock:
+            deal = next(deal for deal in self.deals if deal['id'] == deal_id)
+            deal['finished?'] = True
+            deal['status'] = 'completed'
+            deal['closed_at'] = _timestamp(datetime.now(timezone.utc))
+
+            quote = deal['pair'].split('_')[0]
+            for balance in self.balances[deal['account_id']]:
+                if balance['currency_code'] == quote:
+                    balance['equity'] = f"{float(balance['equity']) + profit:.8f}"
+            return dict(deal)
+
+
+class MockServer(ThreadingHTTPServer):
+    '''
+    Threaded http server serving a fleet, with injected latency and 429s
+    '''
+    daemon_threads = True
+
+    def __init__(
+            self,
+            server_address,
+            fleet: Fleet,
+            latency: float = 0.0,
+            jitter: float = 0.0,
+            throttle_rate: float = 0.0,
+            rate_limit: float = 0.0,
+            retry_after: float = 1.0,
+            seed: int = 1
+        ):
+        '''
+        :param server_address: (host, port), port 0 picks a free port
+        :param fleet: fleet to serve
+        :param latency: seconds added to every response
+        :param jitter: up to this many seconds are randomly added on top of the latency
+        :param throttle_rate: share of requests answered with a 429
+        :param rate_limit: requests per second before answering with 429s, 0 disables
+        :param retry_after: Retry-After seconds sent with a 429
+        :param seed: random seed for the jitter and throttling
+        '''
+        super().__init__(server_address, MockHandler)
+        self.fleet = fleet
+        self.routes = load_routes()
+        self.latency = latency
+        self.jitter = jitter
+        self.throttle_rate = throttle_rate
+        self.rate_limit = rate_limit
+        self.retry_after = retry_after
+
+        self.counts: Counter[str] = Counter()
+        self.throttle_counts: Counter[str] = Counter()
+        self._random = random.Random(seed)
+        # monotonic times of the requests in the last second
+        self._window: list[float] = []
+        self._lock = threading.Lock()
+
+    @property
+    def url(self) -> str:
+        '''
+        Base url to use as py3cw API_URL
+        '''
+        host, port = self.server_address[:2]
+        return f'http://{cast(str, host)}:{port}'
+
+    def is_throttled(self, endpoint: str) -> bool:
+        '''
+        Counts the request and decides if it gets a 429
+        :param endpoint: endpoint name
+        :return: True if the request should get a 429
+        '''
+        with self._lock:
+            self.counts[endpoint] += 1
+            throttled = self._random.random() < self.throttle_rate
+            if self.rate_limit:
+                now = time.monotonic()
+                self._window = [moment for moment in self._window if now - moment < 1]
+                if len(self._window) >= self.rate_limit:
+                    throttled = True
+                else:
+                    self._window.append(now)
+            if throttled:
+                self.throttle_counts[endpoint] += 1
+            return throttled
+
+    def delay(self) -> float:
+        '''
+        :return: seconds to wait before responding
+        '''
+        with self._lock:
+            return self.latency + self._random.uniform(0, self.jitter)
+
+    def stats(self) -> dict:
+        '''
+        :return: requests and 429s per endpoint
+        '''
+        with self._lock:
+            return {
+                'requests': dict(self.counts),
+                'throttled': dict(self.throttle_counts),
+            }
+
+    def reset_stats(self):
+        '''
+        Resets the request counts, i.e. between benchmark runs
+        '''
+        with self._lock:
+            self.counts.clear()
+            self.throttle_counts.clear()
+
+
+class MockHandler(BaseHTTPRequestHandler):
+    '''
+    Routes the 3c api requests to the fleet
+    '''
+    server: MockServer
+    protocol_version = 'HTTP/1.1'
+    # Send headers and body in one write, avoids delayed ack stalls on keep-alive connections
+    wbufsize = 65536
+    disable_nagle_algorithm = True
+
+    def log_message(self, format, *args):  # pylint: disable=redefined-builtin
+        # Keep benchmarks quiet
+        pass
+
+    def do_GET(self):  # pylint: disable=invalid-name
+        '''
+        GET requests
+        '''
+        self._dispatch('GET')
+
+    def do_POST(self):  # pylint: disable=invalid-name
+        '''
+        POST requests
+        '''
+        self._dispatch('POST')
+
+    def do_PATCH(self):  # pylint: disable=invalid-name
+        '''
+        PATCH requests
+        '''
+        self._dispatch('PATCH')
+
+    def _respond(self, status: int, body, headers=None):
+        data = json.dumps(body).encode('UTF-8')
+        self.send_response(status)
+        self.send_header('Content-Type', 'application/json')
+        self.send_header('Content-Length', str(len(data)))
+        for header, value in (headers or {}).items():
+            self.send_header(header, value)
+        self.end_headers()
+        self.wfile.write(data)
+
+    def _error(self, status: int, error: str, description: str):
+        self._respond(status, {'error': error, 'error_description': description})
+
+    def _dispatch(self, method: str):
+        url = urlsplit(self.path)
+        length = int(self.headers.get('Content-Length') or 0)
+        body = self.rfile.read(length) if length else b''
+
+        if method == 'GET' and url.path == STATS_PATH:
+            self._respond(200, self.server.stats())
+            return
+
+        for route_method, pattern, endpoint in self.server.routes:
+            match = pattern.match(url.path)
+            if route_method == method and match:
+                break
+        else:
+            self._error(404, 'not_found', f'{method} {url.path} is not mocked')
+            return
+
+        if not self.headers.get('APIKEY'):
+            self._error(
+                401, 'api_key_invalid_or_expired', 'Unauthorized. Invalid or expired api key.'
+            )
+            return
+
+        time.sleep(self.server.delay())
+
+        if self.server.is_throttled(endpoint):
+            self._respond(
+                429,
+                {'error': 'rate_limit_exceeded', 'error_description': 'Too many requests'},
+                {'Retry-After': f'{self.server.retry_after:g}'}
+            )
+            return
+
+        params = {key: values[-1] for key, values in parse_qs(url.query).items()}
+        if body:
+            params.update(json.loads(body))
+        params.update(match.groupdict())
+        forced_mode = self.headers.get('Forced-Mode', 'real')
+
+        handler = getattr(self, f"_handle_{endpoint.replace('/', '_')}")
+        status, response = handler(params, forced_mode)
+        self._respond(status, response)
+
+    def _account(self, params, forced_mode):
+        account_id = int(params['account_id'])
+        if account_id not in self.server.fleet.visible_accounts(forced_mode):
+            return None
+        return self.server.fleet.accounts[account_id]
+
+    def _handle_bots(self, params, forced_mode):
+        fleet = self.server.fleet
+        account_ids = fleet.visible_accounts(forced_mode)
+        if 'account_id' in params:
+            account_ids &= {int(params['account_id'])}
+        limit = min(int(params.get('limit', 50)), BOTS_MAX_LIMIT)
+        offset = int(params.get('offset', 0))
+
+        with fleet.lock:
+            bots = [
+                bot for bot in fleet.bots.values()
+                if bot['account_id'] in account_ids and
+                (params.get('scope') != 'enabled' or bot['is_enabled']) and
+                (params.get('scope') != 'disabled' or not bot['is_enabled']) and
+                ('strategy' not in params or bot['strategy'] == params['strategy'])
+            ]
+            return 200, [dict(bot) for bot in bots[offset:offset + limit]]
+
+    def _handle_bots_update(self, params, forced_mode):
+        fleet = self.server.fleet
+        bot = fleet.bots.get(int(params['bot_id']))
+        if bot is None or bot['account_id'] not in fleet.visible_accounts(forced_mode):
+            return 404, {'error': 'record_not_found', 'error_description': 'Not found'}
+
+        with fleet.lock:
+            for key, value in params.items():
+                if key in bot and key not in ('id', 'account_id'):
+                    bot[key] = value
+            bot['updated_at'] = _timestamp(datetime.now(timezone.utc))
+            return 200, dict(bot)
+
+    def _handle_deals(self, params, forced_mode):
+        fleet = self.server.fleet
+        account_ids = fleet.visible_accounts(forced_mode)
+        if 'account_id' in params:
+            account_ids &= {int(params['account_id'])}
+        bot_id = int(params['bot_id']) if 'bot_id' in params else None
+        finished = {'active': False, 'finished': True}.get(params.get('scope'))
+        limit = min(int(params.get('limit', 50)), DEALS_MAX_LIMIT)
+        offset = int(params.get('offset', 0))
+
+        with fleet.lock:
+            deals = [
+                deal for deal in fleet.deals
+                if deal['account_id'] in account_ids and
+                (bot_id is None or deal['bot_id'] == bot_id) and
+                (finished is None or deal['finished?'] == finished)
+            ]
+            order = params.get('order', 'created_at')
+            deals.sort(
+                key=lambda deal: (deal.get(order) or '', deal['id']),
+                reverse=params.get('order_direction', 'desc') == 'desc'
+            )
+            return 200, [dict(deal) for deal in deals[offset:offset + limit]]
+
+    def _handle_accounts_account_info(self, params, forced_mode):
+        account = self._account(params, forced_mode)
+        if account is None:
+            return 404, {'error': 'record_not_found', 'error_description': 'Not found'}
+        return 200, {
+            'id': account['id'],
+            'name': account['name'],
+            'market_code': account['market_code'],
+            'auto_balance_method': None,
+        }
+
+    def _handle_accounts_currency_rates(self, params, _forced_mode):
+        quote = params.get('pair', '').split('_')[0]
+        _, _, min_total, price_step = QUOTE_CURRENCIES.get(
+            quote, (None, None, '0.001', '0.00000001')
+        )
+        return 200, {
+            'last': '1.0',
+            'bid': '1.0',
+            'ask': '1.0',
+            'minTotal': min_total,
+            'minLotSize': '0.0001',
+            'maxLotSize': '90000000.0',
+            'lotStep': '0.001',
+            'priceStep': price_step,
+            'maxMarketBuyAmount': None,
+            'maxMarketSellAmount': None,
+        }
+
+    def _handle_accounts_load_balances(self, params, forced_mode):
+        account = self._account(params, forced_mode)
+        if account is None:
+            return 404, {'error': 'record_not_found', 'error_description': 'Not found'}
+        return 200, {'id': account['id'], 'name': account['name']}
+
+    def _handle_accounts_account_table_data(self, params, forced_mode):
+        account = self._account(params, forced_mode)
+        if account is None:
+            return 404, {'error': 'record_not_found', 'error_description': 'Not found'}
+        return 200, [dict(balance) for balance in self.server.fleet.balances[account['id']]]
+
+
+def start(fleet: Fleet, host: str = '127.0.0.1', port: int = 0, **options) -> MockServer:
+    '''
+    Starts the mock server in a background thread
+    :param fleet: fleet to serve
+    :param host: host to bind to
+    :param port: port to bind to, 0 picks a free port
+    :param options: other MockServer options, i.e. latency
+    :return: running server, stop it with shutdown()
+    '''
+    server = MockServer((host, port), fleet, **options)
+    threading.Thread(target=server.serve_forever, daemon=True).start()
+    return server
+
+
+def main():
+    '''
+    Runs the mock server until interrupted
+    '''
+    parser = argparse.ArgumentParser(description=__doc__.split('\n')[1])
+    parser.add_argument('--host', default='127.0.0.1')
+    parser.add_argument('--port', type=int, default=8080)
+    parser.add_argument('--accounts', type=int, default=3)
+    parser.add_argument('--paper-accounts', type=int, default=0)
+    parser.add_argument('--bots', type=int, default=40)
+    parser.add_argument('--deals-per-bot', type=int, default=3)
+    parser.add_argument('--short-ratio', type=float, default=0.0)
+    parser.add_argument('--seed', type=int, default=1)
+    parser.add_argument('--latency', type=float, default=0.0, help='seconds per response')
+    parser.add_argument('--jitter', type=float, default=0.0, help='max random extra seconds')
+    parser.add_argument('--throttle-rate', type=float, default=0.0, help='share of 429 responses')
+    parser.add_argument(
+        '--rate-limit', type=float, default=0.0, help='requests per second, 0 disables'
+    )
+    parser.add_argument('--retry-after', type=float, default=1.0)
+    parser.add_argument('--bots-json', help='write a bots.json matching the fleet to this path')
+    args = parser.parse_args()
+
+    fleet = Fleet(
+        accounts=args.accounts,
+        bots=args.bots,
+        deals_per_bot=args.deals_per_bot,
+        paper_accounts=args.paper_accounts,
+        short_ratio=args.short_ratio,
+        seed=args.seed
+    )
+
+    if args.bots_json:
+        user_config = fleet.bots_json('real')
+        user_config['accounts'].update(fleet.bots_json('paper')['accounts'])
+        with open(args.bots_json, 'w', encoding='UTF-8') as outfile:
+            json.dump(user_config, outfile, indent=4)
+
+    server = MockServer(
+        (args.host, args.port),
+        fleet,
+        latency=args.latency,
+        jitter=args.jitter,
+        throttle_rate=args.throttle_rate,
+        rate_limit=args.rate_limit,
+        retry_after=args.retry_after,
+        seed=args.seed
+    )
+    print(f'Serving {len(fleet.bots)} bots on {len(fleet.accounts)} accounts at {server.url}')
+    try:
+        server.serve_forever()
+    except KeyboardInterrupt:
+        pass
+    finally:
+        server.server_close()
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,232 @@
+'''
+Bot settings maths, scalar and vectorized (numpy) versions
+'''
+
+from decimal import Decimal
+
+import numpy as np
+
+# A deal can't draw down further than 100%, safety orders past that are never placed
+MAX_DRAWDOWN = 100
+# Max relative change of the BO:SO ratio when the search tops up the smaller order
+RATIO_TOLERANCE = 0.05
+
+
+def calc_max_funds_per_deal(
+        bo: float,
+        so: float,
+        mstc: int,
+        sos: float,
+        os: float,
+        ss: float
+    ) -> float:
+    '''
+    Helper function to optimize allocations on
+    :param bo: Base Order
+    :param so: Safety Order
+    :param mstc: Max Safety Trade Count
+    :param sos: Safety Order Step
+    :param os: (Safety) Order Scale
+    :param ss: (Safety Order) Step Scale
+    :return: max funds the bot can use
+    '''
+    max_total = bo
+    drawdown = .0
+    # stc indexed from 0
+    for stc in range(0, mstc):
+        drawdown += sos * ss ** stc
+        if drawdown >= MAX_DRAWDOWN:  # TODO: Validate that using 100 here instead of 1 is correct
+            return max_total
+        max_total += so * os ** stc
+    return max_total
+
+
+def geometric_series(ratio, count):
+    '''
+    Sum of ratio ** i for i in range(count), element wise
+    :param ratio: array of ratios (scales)
+    :param count: array of amount of terms
+    :return: array of sums
+    '''
+    ratio = np.asarray(ratio, dtype=float)
+    count = np.asarray(count, dtype=float)
+    with np.errstate(divide='ignore', invalid='ignore', over='ignore'):
+        # expm1/log keeps precision for ratios close to 1
+        series = np.expm1(count * np.log(ratio)) / (ratio - 1)
+    series = np.where(ratio == 1, count, series)
+    return np.where(count == 0, 0.0, series)
+
+
+def calc_safety_orders_within_drawdown(mstc, sos, ss):
+    '''
+    Amount of safety orders that are placed before the deal hits MAX_DRAWDOWN, element wise
+    :param mstc: array of Max Safety Trade Count
+    :param sos: array of Safety Order Step
+    :param ss: array of (Safety Order) Step Scale
+    :return: int array of safety orders that count towards the max funds
+    '''
+    mstc = np.asarray(mstc, dtype=np.int64)
+    sos = np.asarray(sos, dtype=float)
+    ss = np.asarray(ss, dtype=float)
+
+    safety_orders = mstc.copy()
+
+    # Closed form total drawdown after all safety orders, only the settings
+    # that (nearly) reach the cutoff need to be walked step by step.
+    # The margin makes sure rounding in the closed form never hides a cutoff.
+    total_drawdown = sos * geometric_series(ss, mstc)
+    cut_off = total_drawdown >= MAX_DRAWDOWN * (1 - 1e-9)
+
+    if cut_off.any():
+        cut_mstc = mstc[cut_off]
+        steps = np.arange(cut_mstc.max())
+        with np.errstate(over='ignore'):
+            drawdowns = np.cumsum(sos[cut_off, None] * ss[cut_off, None] ** steps, axis=1)
+        reached = (drawdowns >= MAX_DRAWDOWN) & (steps < cut_mstc[:, None])
+        safety_orders[cut_off] = np.where(
+            reached.any(axis=1),
+            reached.argmax(axis=1),
+            cut_mstc
+        )
+
+    return safety_orders
+
+
+def calc_max_funds_per_deal_batch(bo, so, mstc, sos, os, ss):
+    '''
+    Vectorized calc_max_funds_per_deal, evaluates many bot settings in one call.
+    Arguments are broadcast against each other so scalars and arrays can be mixed.
+    :param bo: Base Order(s)
+    :param so: Safety Order(s)
+    :param mstc: Max Safety Trade Count(s)
+    :param sos: Safety Order Step(s)
+    :param os: (Safety) Order Scale(s)
+    :param ss: (Safety Order) Step Scale(s)
+    :return: array with the max funds every setting can use
+    '''
+    bo, so, mstc, sos, os, ss = np.broadcast_arrays(
+        np.asarray(bo, dtype=float),
+        np.asarray(so, dtype=float),
+        np.asarray(mstc, dtype=np.int64),
+        np.asarray(sos, dtype=float),
+        np.asarray(os, dtype=float),
+        np.asarray(ss, dtype=float)
+    )
+    shape = bo.shape
+
+    safety_orders = calc_safety_orders_within_drawdown(
+        mstc.ravel(), sos.ravel(), ss.ravel()
+    )
+    max_funds = bo.ravel() + so.ravel() * geometric_series(os.ravel(), safety_orders)
+
+    return max_funds.reshape(shape)
+
+
+def _grid_volume(steps: int, step: float) -> float:
+    '''
+    Volume of a whole amount of steps, exact on the step grid
+    :param steps: amount of steps
+    :param step: volume step, i.e. 0.25
+    :return: steps * step without float drift
+    '''
+    return float(Decimal(int(steps)) * Decimal(str(step)))
+
+
+def search_bot_settings(
+        max_currency_allocated: float,
+        bo: float,
+        so: float,
+        mstc: int,
+        sos: float,
+        os: float,
+        ss: float,
+        min_volume: float,
+        volume_step: float,
+        max_active_deals: int = 1
+    ):
+    '''
+    Searches BO, SO and MAD on the volume step grid, keeping the BO:SO ratio
+    of the bot, for the setting that uses the most of the allocation without exceeding it.
+    MAD is the max amount of minimal deals that fit, capped at max_active_deals.
+    The larger order is bisected on the grid, the smaller order is the grid volume nearest
+    to the ratio and gets topped up with the leftover funds by at most RATIO_TOLERANCE.
+    :param max_currency_allocated: total amount of funds we are allocating to the bot
+    :param bo: current Base Order, only used for the BO:SO ratio
+    :param so: current Safety Order, only used for the BO:SO ratio
+    :param mstc: Max Safety Trade Count
+    :param sos: Safety Order Step
+    :param os: (Safety) Order Scale
+    :param ss: (Safety Order) Step Scale
+    :param min_volume: minimum order volume on the exchange
+    :param volume_step: step of the order volumes (in the currency of the bot),
+        every order volume is a multiple of it
+    :param max_active_deals: max active deals allowed, 1 for single bots
+    :return: tuple with (BO, SO, MAD, max funds per deal),
+        None if not even one minimal deal fits the allocation
+    '''
+    ratio = bo / so
+    step = float(volume_step)
+
+    # Safety order volume multiplier, max funds per deal = bo + so * so_scale
+    so_scale = float(geometric_series(os, calc_safety_orders_within_drawdown(mstc, sos, ss)))
+
+    # Work in whole steps, larger order drives the search, smaller follows the ratio.
+    # Without safety orders the SO doesn't use funds so the BO always drives.
+    min_steps = int(np.ceil(min_volume / step - 1e-9))
+    bo_drives = ratio >= 1 or so_scale == 0
+    if bo_drives:
+        primary_scale, secondary_scale, secondary_ratio = 1.0, so_scale, 1 / ratio
+    else:
+        primary_scale, secondary_scale, secondary_ratio = so_scale, 1.0, ratio
+
+    def secondary_steps(primary: int) -> int:
+        return max(min_steps, int(np.floor(primary * secondary_ratio + 0.5)))
+
+    def deal_cost(primary: int, secondary: int) -> float:
+        return (
+            _grid_volume(primary, step) * primary_scale +
+            _grid_volume(secondary, step) * secondary_scale
+        )
+
+    def fits(primary: int, secondary: int, mad: int) -> bool:
+        return deal_cost(primary, secondary) * mad <= max_currency_allocated
+
+    # Minimal setting on the grid that keeps the ratio
+    low = max(min_steps, int(np.ceil(min_steps / secondary_ratio - 1e-9)))
+    if not fits(low, secondary_steps(low), 1):
+        return None
+
+    floor_max_deals = int(np.floor(max_currency_allocated / deal_cost(low, secondary_steps(low))))
+    mad = max(1, min(max_active_deals, floor_max_deals))
+    if not fits(low, secondary_steps(low), mad):
+        mad -= 1
+
+    # Largest primary amount of steps that still fits the deal budget
+    high = int(max_currency_allocated / mad / (step * primary_scale)) + 2
+    while high - low > 1:
+        middle = (low + high) // 2
+        if fits(middle, secondary_steps(middle), mad):
+            low = middle
+        else:
+            high = middle
+
+    # Top up the smaller order with what is left over, within the ratio tolerance
+    secondary = secondary_steps(low)
+    if secondary_scale > 0:
+        max_secondary = int(np.floor(low * secondary_ratio * (1 + RATIO_TOLERANCE) + 1e-9))
+        deal_budget = max_currency_allocated / mad
+        target = int(
+            (deal_budget - _grid_volume(low, step) * primary_scale) / (secondary_scale * step)
+        )
+        # Closed form target plus one, float rounding is settled by the exact fit check
+        for candidate in range(min(target + 1, max_secondary), secondary, -1):
+            if fits(low, candidate, mad):
+                secondary = candidate
+                break
+
+    primary_volume = _grid_volume(low, step)
+    secondary_volume = _grid_volume(secondary, step)
+    max_funds = deal_cost(low, secondary)
+    if bo_drives:
+        return primary_volume, secondary_volume, mad, max_funds
+    return secondary_volume, primary_volume, mad, max_funds
@@ -0,0 +1,277 @@
+'''
+Local http receiver for deal-closed notifications, from 3commas or own tooling.
+Notifications are debounced per (account_id, currency): a burst of closed deals on an
+account compounds the bots of that currency bucket once instead of once per deal.
+
+    python receiver.py
+
+    curl -X POST http://127.0.0.1:8090/deal-closed -H 'X-Compounder-Token: <token>' \
+        -d '{"account_id": 123, "currency": "USDT"}'
+
+The body is a json object or a list of objects with an account_id and either the currency
+or the pair, strategy and base_order_volume_type of the deal (a 3c deal works as is).
+'''
+
+import hmac
+import json
+import threading
+import time
+
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+from urllib.parse import urlsplit
+
+import logger
+import main
+import metrics
+import webhook
+
+DEAL_CLOSED_PATH = '/deal-closed'
+HEALTH_PATH = '/health'
+# Larger bodies are rejected
+MAX_BODY_SIZE = 1024 * 1024
+
+
+class Debouncer:
+    '''
+    Collects keys and hands them out once no new notification for the key came in
+    for `delay` seconds, or at most `max_delay` seconds after its first notification
+    '''
+
+    def __init__(self, delay: float, max_delay: float):
+        '''
+        :param delay: quiet seconds before a key is due
+        :param max_delay: max seconds a key waits while notifications keep coming in
+        '''
+        self.delay = delay
+        self.max_delay = max(delay, max_delay)
+        # key: (first notification, last notification)
+        self._pending: dict[object, tuple[float, float]] = {}
+        self._condition = threading.Condition()
+
+    def _due_at(self, first_seen, last_seen):
+        return min(last_seen + self.delay, first_seen + self.max_delay)
+
+    def submit(self, key):
+        '''
+        :param key: hashable key, i.e. (account_id, currency)
+        '''
+        now = time.monotonic()
+        with self._condition:
+            first_seen, _ = self._pending.get(key, (now, now))
+            self._pending[key] = (first_seen, now)
+            self._condition.notify()
+
+    def pending(self) -> int:
+        '''
+        :return: amount of keys waiting
+        '''
+        with self._condition:
+            return len(self._pending)
+
+    def wait_due(self, timeout: float):
+        '''
+        Blocks until keys are due or the timeout passed
+        :param timeout: max seconds to wait
+        :return: set of due keys, empty on timeout
+        '''
+        deadline = time.monotonic() + timeout
+        with self._condition:
+            while True:
+                now = time.monotonic()
+                due_at = {key: self._due_at(*seen) for key, seen in self._pending.items()}
+                due = {key for key, at in due_at.items() if at <= now}
+                if due:
+                    for key in due:
+                        del self._pending[key]
+                    return due
+                if now >= deadline:
+                    return set()
+                self._condition.wait(min([deadline] + list(due_at.values())) - now)
+
+
+def parse_buckets(payload):
+    '''
+    :param payload: json body of a deal-closed notification
+    :return: list of (account_id, currency)
+    :raises ValueError: if a notification misses the account or currency
+    '''
+    notifications = payload if isinstance(payload, list) else [payload]
+    buckets = []
+    for notification in notifications:
+        if not isinstance(notification, dict) or 'account_id' not in notification:
+            raise ValueError('every notification needs an account_id')
+        # A 3c deal that did not close yet does not change the balance
+        if notification.get('finished?') is False:
+            continue
+
+        if notification.get('currency'):
+            currency = str(notification['currency'])
+        else:
+            try:
+                currency = main.get_currency(
+                    notification['pair'],
+                    notification['strategy'],
+                    notification['base_order_volume_type']
+                )
+            except (KeyError, AttributeError, IndexError) as error:
+                raise ValueError(
+                    'every notification needs a currency or the pair, '
+                    'strategy and base_order_volume_type of the deal'
+                ) from error
+        try:
+            account_id = int(notification['account_id'])
+        except (TypeError, ValueError) as error:
+            raise ValueError('account_id needs to be a number') from error
+        buckets.append((account_id, currency))
+
+    return buckets
+
+
+class ReceiverHandler(BaseHTTPRequestHandler):
+    '''
+    Queues the buckets of deal-closed notifications in the debouncer of the server
+    '''
+    server_version = 'CompounderReceiver/1.0'
+
+    def log_message(self, format, *args):  # pylint: disable=redefined-builtin
+        logger.log(f'%s {format}', "DEBUG", self.address_string(), *args)
+
+    def _send_json(self, status_code, body):
+        data = json.dumps(body).encode('UTF-8')
+        self.send_response(status_code)
+        self.send_header('Content-Type', 'application/json')
+        self.send_header('Content-Length', str(len(data)))
+        self.end_headers()
+        self.wfile.write(data)
+
+    def _authorized(self):
+        token = self.server.token
+        if not token:
+            return True
+        return hmac.compare_digest(self.headers.get('X-Compounder-Token', ''), token)
+
+    def do_GET(self):  # pylint: disable=invalid-name
+        '''
+        Health check with the amount of pending buckets
+        '''
+        if urlsplit(self.path).path != HEALTH_PATH:
+            self._send_json(404, {'error': 'not found'})
+            return
+        self._send_json(200, {'pending': self.server.debouncer.pending()})
+
+    def do_POST(self):  # pylint: disable=invalid-name
+        '''
+        Accepts deal-closed notifications
+        '''
+        if urlsplit(self.path).path != DEAL_CLOSED_PATH:
+            self._send_json(404, {'error': 'not found'})
+            return
+        if not self._authorized():
+            self._send_json(401, {'error': 'invalid token'})
+            return
+
+        try:
+            length = int(self.headers.get('Content-Length') or 0)
+        except ValueError:
+            length = -1
+        if length < 0:
+            # rfile.read(-1) would block until the client closes the connection
+            self._send_json(400, {'error': 'invalid Content-Length'})
+            return
+        if length > MAX_BODY_SIZE:
+            self._send_json(413, {'error': 'body too large'})
+            return
+
+        try:
+            buckets = parse_buckets(json.loads(self.rfile.read(length) or b'null'))
+        except ValueError as error:
+            self._send_json(400, {'error': str(error)})
+            return
+
+        for bucket in buckets:
+            self.server.debouncer.submit(bucket)
+        self._send_json(202, {'queued': len(buckets)})
+
+
+class Receiver(ThreadingHTTPServer):
+    '''
+    Http server for the notifications, the debouncer is drained by run_compounder
+    '''
+    daemon_threads = True
+
+    def __init__(self, server_address, debouncer: Debouncer, token: str = ''):
+        '''
+        :param server_address: (host, port)
+        :param debouncer: debouncer the notifications are queued in
+        :param token: shared secret expected in the X-Compounder-Token header, empty allows all
+        '''
+        super().__init__(server_address, ReceiverHandler)
+        self.debouncer = debouncer
+        self.token = token
+
+
+def run_compounder(debouncer: Debouncer, session, stop_event: threading.Event):
+    '''
+    Compounds the due buckets one batch at a time, bots are never compounded concurrently
+    :param debouncer: debouncer with the notified buckets
+    :param session: main.FleetSession
+    :param stop_event: set to stop the loop
+    '''
+    while not stop_event.is_set():
+        # Wake up regularly for the full refresh, even without notifications
+        buckets = debouncer.wait_due(timeout=1.0)
+        try:
+            session.refresh()
+            if buckets:
+                session.compound(buckets)
+        except Exception as error:  # pylint: disable=broad-except
+            # Keep receiving, the next notification or full run retries
+            webhook.notify_webhook(f'Compounder receiver error: {error!r}', 'ERROR')
+        finally:
+            webhook.flush()
+            metrics.flush()
+
+
+def start():
+    '''
+    Runs the receiver until it gets interrupted
+    '''
+    config = main.config
+    debouncer = Debouncer(
+        delay=config.getfloat('receiver', 'debounce', fallback=5),
+        max_delay=config.getfloat('receiver', 'max_debounce', fallback=30)
+    )
+    receiver = Receiver(
+        (
+            config.get('receiver', 'host', fallback='127.0.0.1'),
+            config.getint('receiver', 'port', fallback=8090)
+        ),
+        debouncer,
+        token=config.get('receiver', 'token', fallback='')
+    )
+    session = main.FleetSession(main.daemon_full_refresh_interval)
+    stop_event = threading.Event()
+    compounder = threading.Thread(
+        target=run_compounder,
+        args=(debouncer, session, stop_event),
+        name='compounder',
+        daemon=True
+    )
+    compounder.start()
+
+    host, port = receiver.server_address[:2]
+    logger.log('Receiving deal-closed notifications on http://%s:%s%s', "INFO",
+               host, port, DEAL_CLOSED_PATH)
+    try:
+        receiver.serve_forever()
+    except KeyboardInterrupt:
+        pass
+    finally:
+        receiver.server_close()
+        stop_event.set()
+        compounder.join()
+
+
+if __name__ == "__main__":
+
+    start()
@@ -0,0 +1,237 @@
+'''
+Shared request scheduler for the 3commas api.
+Rate limits with a token bucket, retries throttled/failed requests with jittered
+backoff (honoring Retry-After) and adapts the concurrency to observed throttling.
+'''
+
+import random
+import threading
+import time
+
+from collections import Counter
+from email.utils import parsedate_to_datetime
+
+import logger
+import metrics
+
+# Status codes 3c uses for rate limiting, 418 is returned when 429s are ignored
+THROTTLE_STATUS_CODES = (418, 429)
+RETRY_STATUS_CODES = (500, 502, 503, 504)
+
+
+def parse_retry_after(retry_after):
+    '''
+    :param retry_after: Retry-After header value, seconds or http date
+    :return: seconds to wait, None if missing or invalid
+    '''
+    if not retry_after:
+        return None
+    try:
+        return max(0.0, float(retry_after))
+    except ValueError:
+        pass
+    try:
+        return max(0.0, parsedate_to_datetime(retry_after).timestamp() - time.time())
+    except (TypeError, ValueError):
+        return None
+
+
+def endpoint_name(entity: str, action: str) -> str:
+    '''
+    :return: endpoint name used for the call counts, i.e. bots/update
+    '''
+    return f'{entity}/{action}' if action else entity
+
+
+class RequestScheduler:
+    '''
+    Wraps a Py3CW client, every p3cw.request should go through RequestScheduler.request
+    '''
+
+    def __init__(
+            self,
+            client_factory,
+            requests_per_second: float = 10,
+            burst: int = 20,
+            max_concurrency: int = 8,
+            min_concurrency: int = 1,
+            max_retries: int = 3,
+            backoff_base: float = 0.5,
+            backoff_max: float = 30
+        ):
+        '''
+        :param client_factory: function creating the Py3CW client, called on the first request
+        :param requests_per_second: token bucket refill rate
+        :param burst: token bucket size
+        :param max_concurrency: max requests in flight
+        :param min_concurrency: concurrency never drops below this when throttled
+        :param max_retries: retries for throttled, 5xx and connection errors
+        :param backoff_base: first backoff in seconds, doubles every retry
+        :param backoff_max: max backoff in seconds
+        '''
+        self.client_factory = client_factory
+        self._client = None
+        self._client_lock = threading.Lock()
+        self.requests_per_second = requests_per_second
+        self.burst = burst
+        self.max_concurrency = max_concurrency
+        self.min_concurrency = min(min_concurrency, max_concurrency)
+        self.max_retries = max_retries
+        self.backoff_base = backoff_base
+        self.backoff_max = backoff_max
+
+        self.endpoint_counts: Counter[str] = Counter()
+        self.retry_counts: Counter[str] = Counter()
+        self.throttle_counts: Counter[str] = Counter()
+
+        self._tokens = float(burst)
+        self._refilled_at = time.monotonic()
+        self._paused_until = 0.0
+        self._concurrency = max_concurrency
+        self._in_flight = 0
+        self._successes = 0
+        self._condition = threading.Condition()
+        self._local = threading.local()
+
+    @property
+    def client(self):
+        '''
+        The Py3CW client, created on first use
+        '''
+        if self._client is None:
+            with self._client_lock:
+                if self._client is None:
+                    client = self.client_factory()
+                    # py3cw swallows the response, grab status and headers with a session hook
+                    client.session.hooks['response'].append(self._record_response)
+                    self._client = client
+        return self._client
+
+    def _record_response(self, response, *_args, **_kwargs):
+        self._local.response = response
+        return response
+
+    def _acquire(self):
+        '''
+        Blocks until there is a concurrency slot, no pause and a token available
+        '''
+        with self._condition:
+            while True:
+                now = time.monotonic()
+                self._tokens = min(
+                    self.burst,
+                    self._tokens + (now - self._refilled_at) * self.requests_per_second
+                )
+                self._refilled_at = now
+
+                if self._in_flight >= self._concurrency:
+                    self._condition.wait()
+                    continue
+
+                wait = self._paused_until - now
+                if wait <= 0 and self._tokens < 1:
+                    wait = (1 - self._tokens) / self.requests_per_second
+                if wait > 0:
+                    self._condition.wait(wait)
+                    continue
+
+                self._tokens -= 1
+                self._in_flight += 1
+                return
+
+    def _release(self, throttled: bool, retry_after):
+        with self._condition:
+            self._in_flight -= 1
+            if throttled:
+                # Multiplicative decrease and pause everyone when asked to
+                self._concurrency = max(self.min_concurrency, self._concurrency // 2)
+                self._successes = 0
+                if retry_after is not None:
+                    self._paused_until = max(self._paused_until, time.monotonic() + retry_after)
+            else:
+                # Additive increase after a full window of successes
+                self._successes += 1
+                if (self._successes >= self._concurrency
+                        and self._concurrency < self.max_concurrency):
+                    self._concurrency += 1
+                    self._successes = 0
+            self._condition.notify_all()
+
+    def _backoff(self, attempt: int) -> float:
+        # Full jitter exponential backoff
+        return random.uniform(0, min(self.backoff_max, self.backoff_base * 2 ** attempt))
+
+    def request(self, entity: str, action: str = '', **kwargs):
+        '''
+        Rate limited p3cw.request with retries
+        :param entity: 3c entity, i.e. bots
+        :param action: 3c action, i.e. update
+        :param kwargs: other p3cw.request arguments
+        :return: (error, data) like p3cw.request
+        '''
+        endpoint = endpoint_name(entity, action)
+        attempt = 0
+        started_at = time.perf_counter()
+
+        while True:
+            self._acquire()
+            self._local.response = None
+            try:
+                error, data = self.client.request(entity=entity, action=action, **kwargs)
+            finally:
+                response = self._local.response
+                status_code = response.status_code if response is not None else None
+                throttled = status_code in THROTTLE_STATUS_CODES
+                retry_after = parse_retry_after(
+                    response.headers.get('Retry-After') if response is not None else None
+                )
+                self._release(throttled, retry_after)
+
+            with self._condition:
+                self.endpoint_counts[endpoint] += 1
+                if throttled:
+                    self.throttle_counts[endpoint] += 1
+
+            # Retry throttled, server errors and requests that never got a response
+            should_retry = throttled or (
+                error and (status_code in RETRY_STATUS_CODES or response is None)
+            )
+            if not should_retry or attempt >= self.max_retries:
+                metrics.record_request(
+                    endpoint, time.perf_counter() - started_at, status_code, attempt
+                )
+                return error, data
+
+            wait = retry_after if retry_after is not None else self._backoff(attempt)
+            logger.log(
+                'Retrying %s in %.2fs (status %s, attempt %s)',
+                "WARNING",
+                endpoint, wait, status_code, attempt + 1
+            )
+            with self._condition:
+                self.retry_counts[endpoint] += 1
+            time.sleep(wait)
+            attempt += 1
+
+    def reset_counts(self):
+        '''
+        Resets the per endpoint counters, i.e. at the start of a run
+        '''
+        with self._condition:
+            self.endpoint_counts.clear()
+            self.retry_counts.clear()
+            self.throttle_counts.clear()
+
+    def log_counts(self):
+        '''
+        Logs the api calls made per endpoint
+        '''
+        with self._condition:
+            calls = dict(self.endpoint_counts)
+            retries = dict(self.retry_counts)
+            throttled = dict(self.throttle_counts)
+        logger.log(
+            '3c api calls: %s, retries: %s, throttled: %s',
+            "INFO",
+            calls, retries, throttled
+        )
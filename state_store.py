@@ -0,0 +1,157 @@
+'''
+Persisted snapshot of the compounder inputs per bot, bots whose inputs did not
+change since the last run don't need to be recomputed or updated
+'''
+
+import json
+import math
+import os
+
+
+def bot_inputs(
+        balance,
+        allocation,
+        max_active_deals,
+        bot_same_pair_multiple,
+        bot,
+        optimizer_mode
+    ):
+    '''
+    Snapshot of everything the bot settings are computed from
+    :param balance: account balance of the bot currency
+    :param allocation: bot allocation from bots.json
+    :param max_active_deals: max active deals from bots.json
+    :param bot_same_pair_multiple: bot_same_pair_multiple from bots.json
+    :param bot: fleet bot with the settings from 3c
+    :param optimizer_mode: optimizer mode from config.ini
+    :return: json serializable dict
+    '''
+    return {
+        'balance': float(balance),
+        'allocation': float(allocation),
+        'max_active_deals': max_active_deals,
+        'bot_same_pair_multiple': bot_same_pair_multiple,
+        'optimizer_mode': optimizer_mode,
+        'bot': {
+            'type': bot.type,
+            'pair': bot.pairs[0],
+            'mstc': int(bot.mstc),
+            'sos': float(bot.sos),
+            'os': float(bot.os),
+            'ss': float(bot.ss)
+        },
+        # The settings currently on 3c
+        'applied': {
+            'bo': float(bot.bo),
+            'so': float(bot.so),
+            'mad': bot.mad,
+            'adosp': bot.adosp
+        }
+    }
+
+
+def with_applied(inputs, settings):
+    '''
+    :param inputs: snapshot created by bot_inputs
+    :param settings: dict with the bo, so, mad and adosp written to 3c
+    :return: copy of the snapshot with the written settings as applied settings
+    '''
+    return {
+        **inputs,
+        'applied': {
+            'bo': float(settings['bo']),
+            'so': float(settings['so']),
+            'mad': settings['mad'],
+            'adosp': settings['adosp']
+        }
+    }
+
+
+class StateStore:
+    '''
+    Per bot snapshot of the inputs of the last run that computed its settings.
+    Only bots seen in the current run are kept when saving, unless the run is partial.
+    '''
+
+    def __init__(self, path=None, balance_tolerance=0.0):
+        '''
+        :param path: json file to persist the state to, None keeps it in memory only
+        :param balance_tolerance: relative balance change that does not trigger a recompute,
+            i.e. 0.001 is 0.1%
+        '''
+        self.path = path
+        self.balance_tolerance = balance_tolerance
+        self._previous = {}
+        self._current = {}
+
+    def is_unchanged(self, bot_id, inputs) -> bool:
+        '''
+        :param bot_id: 3c ID of the bot
+        :param inputs: snapshot created by bot_inputs
+        :return: True if the bot does not need to be recomputed
+        '''
+        previous = self._previous.get(str(bot_id))
+        if previous is None:
+            return False
+
+        for key in ('allocation', 'max_active_deals', 'bot_same_pair_multiple',
+                    'optimizer_mode', 'bot'):
+            if previous[key] != inputs[key]:
+                return False
+
+        # Bot settings changed on 3c since we wrote them
+        for key, value in inputs['applied'].items():
+            if not math.isclose(previous['applied'][key], value, rel_tol=1e-9):
+                return False
+
+        return math.isclose(
+            previous['balance'],
+            inputs['balance'],
+            rel_tol=self.balance_tolerance
+        )
+
+    def keep(self, bot_id):
+        '''
+        Keeps the previous snapshot of a skipped bot, the balance change is
+        measured from the last recompute so it can't drift past the tolerance
+        :param bot_id: 3c ID of the bot
+        '''
+        self._current[str(bot_id)] = self._previous[str(bot_id)]
+
+    def record(self, bot_id, inputs):
+        '''
+        :param bot_id: 3c ID of the bot
+        :param inputs: snapshot of a bot whose settings on 3c match its applied settings
+        '''
+        self._current[str(bot_id)] = inputs
+
+    def load(self, partial=False):
+        '''
+        Loads the snapshot of the last run, the state of the previous run is kept
+        in memory when there is no path (warm lambda containers)
+        :param partial: True if the run only recomputes some bots, the others keep their snapshot
+        '''
+        if not self.path:
+            self._previous = self._current
+        elif os.path.exists(self.path):
+            try:
+                with open(self.path, 'r', encoding='UTF-8') as infile:
+                    self._previous = json.load(infile)
+            except (ValueError, OSError):
+                # Corrupt or unreadable state file, recompute every bot
+                self._previous = {}
+        else:
+            self._previous = {}
+        self._current = dict(self._previous) if partial else {}
+
+    def save(self):
+        '''
+        Persists the snapshot of this run to disk if a path is configured
+        '''
+        if not self.path:
+            return
+
+        tmp_path = f'{self.path}.tmp'
+        with open(tmp_path, 'w', encoding='UTF-8') as outfile:
+            json.dump(self._current, outfile, separators=(',', ':'))
+        os.replace(tmp_path, self.path)
@@ -0,0 +1,197 @@
+'''
+Runs the compounder for several 3commas users (tenants), every tenant runs the full
+compounder_start in its own worker process with its own secrets, bots.json, caches and state.
+
+Locally the tenants are configured in config.ini:
+    [tenants]
+    names=alice,bob
+    source=config
+    [tenant:alice]
+    key=...
+    secret=...
+    webhook_url=...
+
+With source=ssm the secrets of every tenant are read from
+/3commas-compounder/<tenant>/3commas_key, 3commas_secret and webhook_url.
+'''
+
+import configparser
+import json
+import multiprocessing
+import re
+import time
+
+from multiprocessing.connection import wait
+from os.path import exists
+
+# Tenant names are used as directory names and s3 prefixes
+TENANT_NAME_PATTERN = re.compile(r'[A-Za-z0-9_-]+')
+
+DEFAULT_MAX_PROCESSES = 4
+
+
+def read_config():
+    '''
+    :return: config.ini when running locally, config.lambda.ini in lambda
+    '''
+    config = configparser.ConfigParser()
+    config.read('config.ini' if exists('config.ini') else 'config.lambda.ini')
+    return config
+
+
+def tenant_secret_parameters(tenant_name):
+    '''
+    :param tenant_name: name of the tenant
+    :return: ssm parameter names of the tenant secrets
+    '''
+    return [
+        f"/3commas-compounder/{tenant_name}/3commas_key",
+        f"/3commas-compounder/{tenant_name}/3commas_secret",
+        f"/3commas-compounder/{tenant_name}/webhook_url",
+    ]
+
+
+def load_tenants(config):
+    '''
+    Reads the tenants from the [tenants] section
+    :param config: parsed config
+    :return: list of tenant dicts with name, source and (for config tenants) secrets
+    '''
+    names = [
+        name.strip() for name in config.get('tenants', 'names', fallback='').split(',')
+        if name.strip()
+    ]
+    source = config.get('tenants', 'source', fallback='config')
+    if source not in ('config', 'ssm'):
+        raise ValueError(f'Unknown tenants source {source}, use config or ssm')
+
+    tenants = []
+    for name in names:
+        if not TENANT_NAME_PATTERN.fullmatch(name):
+            raise ValueError(f'Invalid tenant name {name}, only use letters, numbers, _ and -')
+
+        tenant = {'name': name, 'source': source, 'secrets': None}
+        if source == 'config':
+            section = f'tenant:{name}'
+            tenant['secrets'] = {
+                "3commas_key": config.get(section, 'key'),
+                "3commas_secret": config.get(section, 'secret'),
+                "webhook_url": config.get(section, 'webhook_url', fallback='')
+            }
+        tenants.append(tenant)
+
+    return tenants
+
+
+def run_tenant(tenant):
+    '''
+    Runs compounder_start for a single tenant, only call this in a fresh process
+    :param tenant: tenant dict from load_tenants
+    :return: summary of the run
+    '''
+    # pylint: disable=import-outside-toplevel
+    import utils
+
+    secrets = tenant['secrets']
+    if secrets is None:
+        secrets = utils.get_param_dict_from_ssm(tenant_secret_parameters(tenant['name']))
+        secrets.setdefault('webhook_url', '')
+
+    # Imported in the worker, every worker gets its own clients, caches and queues
+    import main
+    import metrics
+    import webhook
+
+    main.use_tenant(tenant['name'], secrets)
+    try:
+        return main.compounder_start()
+    finally:
+        webhook.flush()
+        metrics.flush()
+
+
+def _worker(tenant, connection):
+    '''
+    Worker process entry, sends the result of the tenant run back to the runner
+    '''
+    try:
+        result = {'ok': True, **run_tenant(tenant)}
+    except Exception as error:  # pylint: disable=broad-except
+        # Report the error instead of losing the tenant
+        result = {'ok': False, 'error': repr(error)}
+    connection.send(result)
+    connection.close()
+
+
+def run_tenants(tenants, max_processes=DEFAULT_MAX_PROCESSES):
+    '''
+    Runs every tenant in its own worker process, at most max_processes at the same time.
+    Uses Process and Pipe since lambda does not support multiprocessing pools and queues.
+    :param tenants: list of tenant dicts from load_tenants
+    :param max_processes: max amount of tenants running at the same time
+    :return: list with a result per tenant, in the same order as tenants
+    '''
+    # Spawn instead of fork, the workers should not inherit threads or clients
+    context = multiprocessing.get_context('spawn')
+    pending = list(tenants)
+    running = {}
+    results = {}
+
+    while pending or running:
+        while pending and len(running) < max(1, max_processes):
+            tenant = pending.pop(0)
+            receiver, sender = context.Pipe(duplex=False)
+            process = context.Process(target=_worker, args=(tenant, sender), name=tenant['name'])
+            process.start()
+            # Only the worker writes, closing our copy lets recv notice a crashed worker
+            sender.close()
+            running[receiver] = (process, tenant, time.perf_counter())
+
+        for receiver in wait(list(running)):
+            process, tenant, started_at = running.pop(receiver)
+            try:
+                result = receiver.recv()
+            except EOFError:
+                result = {'ok': False, 'error': 'worker exited without a result'}
+            receiver.close()
+            process.join()
+
+            results[tenant['name']] = {
+                'tenant': tenant['name'],
+                'duration': round(time.perf_counter() - started_at, 3),
+                'exitcode': process.exitcode,
+                **result
+            }
+
+    return [results[tenant['name']] for tenant in tenants]
+
+
+def start():
+    '''
+    Runs all configured tenants
+    :return: list with a result per tenant
+    '''
+    config = read_config()
+    tenants = load_tenants(config)
+    started_at = time.perf_counter()
+    results = run_tenants(
+        tenants,
+        config.getint('tenants', 'max_processes', fallback=DEFAULT_MAX_PROCESSES)
+    )
+    print(json.dumps({
+        'duration': round(time.perf_counter() - started_at, 3),
+        'tenants': results
+    }))
+    return results
+
+
+def request_handler(event, lambda_context):
+    '''
+    Lambda request handler running all tenants
+    '''
+    return start()
+
+
+if __name__ == "__main__":
+
+    start()
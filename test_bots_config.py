@@ -0,0 +1,121 @@
+'''
+Checks the bots.json validation and the compiled config cache
+'''
+
+import json
+import os
+
+import pytest
+
+import bots_config
+
+
+def bots_json(**bot):
+    bot.setdefault('bot_name', 'bot')
+    bot.setdefault('allocation', 0.5)
+    return {
+        'accounts': {
+            '123': {
+                'account_name': 'main',
+                'currencies': {'USDT': {'9001': bot}}
+            }
+        }
+    }
+
+
+@pytest.fixture(autouse=True)
+def fixture_clear_cache():
+    bots_config._loaded.clear()  # pylint: disable=protected-access
+    yield
+    bots_config._loaded.clear()  # pylint: disable=protected-access
+
+
+def test_valid_config_is_indexed_by_bot_id():
+    compiled = bots_config.compile_config(
+        bots_json(max_active_deals=3, bot_same_pair_multiple=2)
+    )
+
+    assert not compiled.errors
+    assert compiled.bots == {
+        9001: bots_config.BotEntry(123, 'USDT', 'bot', 0.5, 3, 2)
+    }
+
+
+@pytest.mark.parametrize('user_config, error', [
+    ([], 'needs an "accounts" object'),
+    ({'accounts': {'abc': {'currencies': {}}}}, 'account abc is not a valid account'),
+    ({'accounts': {'123': {}}}, 'needs a "currencies" object'),
+    (bots_json(allocation=None), 'does not have an allocation defined'),
+    (bots_json(allocation='half'), 'has an invalid allocation'),
+    (bots_json(max_active_deals=0), 'has an invalid max_active_deals'),
+    (bots_json(max_active_deals=True), 'has an invalid max_active_deals'),
+    (bots_json(bot_same_pair_multiple='2'), 'has an invalid bot_same_pair_multiple'),
+])
+def test_invalid_configs_are_reported(user_config, error):
+    compiled = bots_config.compile_config(user_config)
+
+    assert len(compiled.errors) == 1
+    assert error in compiled.errors[0]
+
+
+def test_duplicate_bots_and_over_allocation():
+    user_config = bots_json(allocation=0.8)
+    user_config['accounts']['456'] = {
+        'account_name': 'second',
+        'ignore_other_bots': True,
+        'currencies': {
+            'BTC': {
+                '9001': {'allocation': 0.1},
+                '9002': {'allocation': 0.7},
+                '9003': {'allocation': 0.7}
+            }
+        }
+    }
+
+    compiled = bots_config.compile_config(user_config)
+
+    assert compiled.errors == ['bots.json has bot 9001 more than once']
+    assert compiled.warnings == [('second', 'BTC', 1.4)]
+    assert compiled.ignore_other_bots == {456}
+
+
+def write_json(path, user_config, mtime_ns=None):
+    with open(path, 'w', encoding='UTF-8') as outfile:
+        json.dump(user_config, outfile)
+    if mtime_ns is not None:
+        os.utime(path, ns=(mtime_ns, mtime_ns))
+
+
+def test_load_is_cached_by_mtime_and_size(tmp_path, monkeypatch):
+    path = str(tmp_path / 'bots.json')
+    write_json(path, bots_json(), mtime_ns=10**18)
+    compiles = []
+    compile_config = bots_config.compile_config
+    monkeypatch.setattr(
+        bots_config, 'compile_config',
+        lambda user_config: compiles.append(1) or compile_config(user_config)
+    )
+
+    first = bots_config.load(path)
+    assert bots_config.load(path) is first
+    assert len(compiles) == 1
+
+    # Touched without changes, the content hash matches so it is not compiled again
+    os.utime(path, ns=(2 * 10**18, 2 * 10**18))
+    assert bots_config.load(path) is first
+    assert len(compiles) == 1
+
+    # Changed content, compiled again
+    write_json(path, bots_json(allocation=0.25), mtime_ns=3 * 10**18)
+    changed = bots_config.load(path)
+    assert len(compiles) == 2
+    assert changed.bots[9001].allocation == 0.25
+
+
+def test_missing_and_invalid_files(tmp_path):
+    path = tmp_path / 'bots.json'
+    assert bots_config.load(str(path)) is None
+
+    path.write_text('{"accounts": ', encoding='UTF-8')
+    compiled = bots_config.load(str(path))
+    assert compiled.errors[0].startswith('bots.json is not valid json')
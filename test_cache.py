@@ -0,0 +1,123 @@
+'''
+Checks the TTL cache: expiry, single flight fetches and persistence
+'''
+
+import threading
+import time
+
+import cache
+
+
+class Clock:
+    '''
+    Replaces time.time in the cache module
+    '''
+    def __init__(self, now=1000.0):
+        self.now = now
+
+    def __call__(self):
+        return self.now
+
+
+def test_entries_expire_after_ttl(monkeypatch):
+    clock = Clock()
+    monkeypatch.setattr(cache.time, 'time', clock)
+    limits_cache = cache.TTLCache(ttl=60)
+    fetches = []
+
+    def fetch():
+        fetches.append(clock.now)
+        return {'minTotal': '10'}
+
+    limits_cache.get_or_fetch(('binance', 'USDT_BTC'), fetch)
+    clock.now += 60
+    limits_cache.get_or_fetch(('binance', 'USDT_BTC'), fetch)
+    assert len(fetches) == 1
+
+    clock.now += 1
+    limits_cache.get_or_fetch(('binance', 'USDT_BTC'), fetch)
+    assert len(fetches) == 2
+
+
+def test_none_results_are_not_cached():
+    limits_cache = cache.TTLCache(ttl=60)
+    fetches = []
+
+    def fetch():
+        fetches.append(1)
+
+    assert limits_cache.get_or_fetch('key', fetch) is None
+    assert limits_cache.get_or_fetch('key', fetch) is None
+    assert len(fetches) == 2
+
+
+def test_concurrent_misses_share_one_fetch():
+    limits_cache = cache.TTLCache()
+    started = threading.Event()
+    release = threading.Event()
+    fetches = []
+
+    def fetch():
+        fetches.append(1)
+        started.set()
+        release.wait(5)
+        # Not cached, a thread that didn't join the flight would fetch again
+        return None
+
+    threads = [
+        threading.Thread(target=limits_cache.get_or_fetch, args=('key', fetch))
+        for _ in range(8)
+    ]
+    threads[0].start()
+    started.wait(5)
+    for thread in threads[1:]:
+        thread.start()
+    # Give the followers time to wait on the flight of the first thread
+    time.sleep(0.2)
+    release.set()
+    for thread in threads:
+        thread.join(5)
+
+    assert fetches == [1]
+
+
+def test_lru_eviction():
+    limits_cache = cache.TTLCache(max_size=2)
+    limits_cache.set('a', 1)
+    limits_cache.set('b', 2)
+    limits_cache.get('a')
+    limits_cache.set('c', 3)
+
+    assert limits_cache.get('a') == 1
+    assert limits_cache.get('b') is None
+    assert limits_cache.get('c') == 3
+
+
+def test_persisted_entries_are_loaded_without_expired_ones(tmp_path, monkeypatch):
+    clock = Clock()
+    monkeypatch.setattr(cache.time, 'time', clock)
+    path = str(tmp_path / 'cache.json')
+
+    limits_cache = cache.TTLCache(path=path, ttl=60)
+    limits_cache.set(('binance', 'USDT_BTC'), {'minTotal': '10'})
+    clock.now += 30
+    limits_cache.set(('binance', 'BTC_ADA'), {'minTotal': '0.0001'})
+    limits_cache.save()
+
+    clock.now += 40
+    loaded = cache.TTLCache(path=path, ttl=60)
+    loaded.load()
+
+    assert loaded.get(('binance', 'USDT_BTC')) is None
+    assert loaded.get(('binance', 'BTC_ADA')) == {'minTotal': '0.0001'}
+
+
+def test_corrupt_cache_file_starts_empty(tmp_path):
+    path = tmp_path / 'cache.json'
+    path.write_text('{not json', encoding='UTF-8')
+
+    limits_cache = cache.TTLCache(path=str(path))
+    limits_cache.set('stale', 1)
+    limits_cache.load()
+
+    assert limits_cache.get('stale') is None
@@ -0,0 +1,89 @@
+'''
+Checks the fan out helper and the prefetching paginator
+'''
+
+import threading
+
+import pytest
+
+import fetcher
+
+
+class Pages:
+    '''
+    Paginated endpoint over a list of records, records the requested offsets
+    '''
+    def __init__(self, records, errors=None):
+        self.records = records
+        self.errors = errors or {}
+        self.offsets = []
+        self.requested = {}
+        self._lock = threading.Lock()
+
+    def event(self, offset):
+        with self._lock:
+            return self.requested.setdefault(offset, threading.Event())
+
+    def __call__(self, offset, limit):
+        with self._lock:
+            self.offsets.append(offset)
+        self.event(offset).set()
+        if offset in self.errors:
+            return self.errors[offset], None
+        return {}, self.records[offset:offset + limit]
+
+
+def test_fan_out_keeps_order():
+    assert fetcher.fan_out(lambda item: item * 2, range(20), limit=4) == list(range(0, 40, 2))
+
+
+@pytest.mark.parametrize('prefetch', [True, False])
+@pytest.mark.parametrize('count', [0, 1, 9, 10, 25])
+def test_all_records_are_streamed(prefetch, count):
+    pages = Pages(list(range(count)))
+
+    paginator = fetcher.Paginator(pages, page_size=10, prefetch=prefetch)
+
+    assert list(paginator) == list(range(count))
+    assert not paginator.error
+    # A short page is the last page, a full page is followed by one more request
+    assert sorted(pages.offsets) == list(range(0, count // 10 * 10 + 1, 10))
+
+
+def test_next_page_is_requested_while_the_current_page_is_consumed():
+    pages = Pages(list(range(25)))
+    paginator = fetcher.Paginator(pages, page_size=10, prefetch=True)
+
+    records = iter(paginator)
+    assert next(records) == 0
+    # Only the first record of page 0 was consumed, page 1 is already on its way
+    assert pages.event(10).wait(5)
+    assert list(records) == list(range(1, 25))
+
+
+def test_consumer_can_stop_early():
+    pages = Pages(list(range(100)))
+    paginator = fetcher.Paginator(pages, page_size=10, prefetch=True)
+
+    for record in paginator:
+        if record == 3:
+            break
+
+    # Page 0 and at most the prefetched page 1 got requested
+    assert set(pages.offsets) <= {0, 10}
+
+
+@pytest.mark.parametrize('prefetch', [True, False])
+def test_errors_stop_iteration_and_are_kept(prefetch):
+    error = {'error': True, 'status_code': 500}
+    pages = Pages(list(range(30)), errors={10: error})
+    paginator = fetcher.Paginator(pages, page_size=10, prefetch=prefetch)
+
+    assert list(paginator) == list(range(10))
+    assert paginator.error == error
+    assert 20 not in pages.offsets
+
+    # Iterating again starts from scratch
+    pages.errors = {}
+    assert list(paginator) == list(range(30))
+    assert not paginator.error
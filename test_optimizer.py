@@ -0,0 +1,142 @@
+'''
+Checks the vectorized optimizer maths against the scalar functions,
+and the settings of the search optimizer
+
+    python -m pytest -q
+'''
+
+from decimal import Decimal
+
+import numpy as np
+import pytest
+
+import optimizer
+
+
+def scalar_max_funds(bo, so, mstc, sos, os, ss):
+    '''
+    :return: array of calc_max_funds_per_deal for every setting
+    '''
+    return np.array([
+        optimizer.calc_max_funds_per_deal(*setting)
+        for setting in zip(
+            bo.tolist(), so.tolist(), mstc.tolist(), sos.tolist(), os.tolist(), ss.tolist()
+        )
+    ])
+
+
+def test_batch_matches_scalar_on_random_settings():
+    rng = np.random.default_rng(6)
+    count = 20000
+    bo = rng.uniform(1, 500, count)
+    so = rng.uniform(1, 500, count)
+    mstc = rng.integers(0, 60, count)
+    sos = rng.uniform(0.1, 10, count)
+    os = rng.uniform(0.5, 2.5, count)
+    ss = rng.uniform(0.5, 2.5, count)
+    # Include ratios of exactly 1, the closed form has a separate branch for them
+    os[::10] = 1
+    ss[::7] = 1
+
+    batch = optimizer.calc_max_funds_per_deal_batch(bo, so, mstc, sos, os, ss)
+
+    assert np.isclose(batch, scalar_max_funds(bo, so, mstc, sos, os, ss), rtol=1e-9).all()
+
+
+@pytest.mark.parametrize('mstc, sos, ss', [
+    # Drawdown is exactly 100% at a safety order, it is not placed
+    (6, 25, 1),
+    (10, 12.5, 1),
+    (4, 50, 1),
+    (3, 100, 1),
+    (5, 20, 4),
+    # Drawdown crosses 100% between safety orders
+    (5, 20, 2),
+    (8, 6.25, 2),
+    # Drawdown ends exactly at 100% after the last safety order
+    (4, 25, 1),
+    (2, 50, 1),
+    # Just under and over the cutoff
+    (4, 24.999999, 1),
+    (4, 25.000001, 1),
+    # No safety orders
+    (0, 50, 1),
+])
+def test_batch_matches_scalar_at_drawdown_cutoff(mstc, sos, ss):
+    bo, so, order_scale = 10.0, 20.0, 1.5
+
+    batch = optimizer.calc_max_funds_per_deal_batch(bo, so, mstc, sos, order_scale, ss)
+    scalar = optimizer.calc_max_funds_per_deal(bo, so, mstc, sos, order_scale, ss)
+
+    assert np.isclose(batch, scalar, rtol=1e-9)
+
+
+def on_grid(volume, step):
+    return Decimal(str(volume)) % Decimal(str(step)) == 0
+
+
+def check_search_settings(settings, allocation, bo, so, mstc, sos, os, ss, min_volume, step,
+                          max_active_deals):
+    '''
+    Asserts the searched settings fit the allocation, the grid and the BO:SO ratio
+    '''
+    valid_bo, valid_so, mad, max_funds = settings
+
+    assert 1 <= mad <= max_active_deals
+    assert max_funds * mad <= allocation
+    assert np.isclose(
+        max_funds,
+        optimizer.calc_max_funds_per_deal(valid_bo, valid_so, mstc, sos, os, ss),
+        rtol=1e-9
+    )
+    assert valid_bo >= min_volume and valid_so >= min_volume
+    assert on_grid(valid_bo, step) and on_grid(valid_so, step)
+
+    # The smaller order is the nearest grid volume to the ratio, topped up by RATIO_TOLERANCE
+    safety_orders = optimizer.calc_safety_orders_within_drawdown(mstc, sos, ss)
+    if bo >= so or safety_orders == 0:
+        primary, secondary, ratio = valid_bo, valid_so, so / bo
+    else:
+        primary, secondary, ratio = valid_so, valid_bo, bo / so
+    exact = primary * ratio
+    assert secondary >= exact - step / 2 - 1e-9
+    assert secondary <= max(exact + step / 2, exact * (1 + optimizer.RATIO_TOLERANCE)) + 1e-9
+
+
+@pytest.mark.parametrize('step', [0.00000001, 0.01, 0.1, 0.25, 1, 5])
+def test_search_settings_fit_allocation_grid_and_ratio(step):
+    rng = np.random.default_rng(7)
+    for _ in range(300):
+        min_volume = float(rng.choice([step, 10 * step, 11, 0.0001]))
+        bo = float(rng.uniform(1, 100))
+        so = bo * float(rng.choice([0.5, 1, 2, 3, rng.uniform(0.2, 5)]))
+        mstc = int(rng.integers(0, 30))
+        sos = float(rng.uniform(0.5, 5))
+        order_scale = float(rng.uniform(1, 2))
+        safety_scale = float(rng.uniform(1, 1.5))
+        allocation = float(rng.uniform(0.5, 5000))
+        max_active_deals = int(rng.integers(1, 10))
+
+        arguments = (
+            allocation, bo, so, mstc, sos, order_scale, safety_scale, min_volume, step,
+            max_active_deals
+        )
+        settings = optimizer.search_bot_settings(*arguments)
+        if settings is not None:
+            check_search_settings(settings, *arguments)
+
+
+def test_search_keeps_ratio_on_coarse_grid():
+    valid_bo, valid_so, mad, _ = optimizer.search_bot_settings(
+        1000, 10, 20, 5, 2, 1.5, 1.2, min_volume=10, volume_step=5, max_active_deals=3
+    )
+
+    assert (valid_bo, valid_so, mad) == (10, 20, 3)
+
+
+def test_search_without_fitting_grid_setting():
+    # A lot step of the base coin used as quote volume step, the minimal deal costs 2.7 BTC
+    assert optimizer.search_bot_settings(
+        0.05, 0.001, 0.002, 5, 2, 1.5, 1.2, min_volume=0.00015, volume_step=0.1,
+        max_active_deals=3
+    ) is None
@@ -0,0 +1,109 @@
+'''
+Checks the deal-closed notification parsing and the debouncer
+'''
+
+import threading
+
+import pytest
+
+import receiver
+
+
+class Clock:
+    '''
+    Replaces time.monotonic in the receiver module
+    '''
+    def __init__(self, now=100.0):
+        self.now = now
+
+    def __call__(self):
+        return self.now
+
+
+@pytest.fixture(name='clock')
+def fixture_clock(monkeypatch):
+    clock = Clock()
+    monkeypatch.setattr(receiver.time, 'monotonic', clock)
+    return clock
+
+
+def test_burst_is_due_once_after_the_quiet_delay(clock):
+    debouncer = receiver.Debouncer(delay=5, max_delay=30)
+    for _ in range(10):
+        debouncer.submit((123, 'USDT'))
+        clock.now += 1
+
+    # Last notification was 1 second ago
+    assert debouncer.wait_due(0) == set()
+    assert debouncer.pending() == 1
+
+    clock.now += 4
+    assert debouncer.wait_due(0) == {(123, 'USDT')}
+    assert debouncer.pending() == 0
+    assert debouncer.wait_due(0) == set()
+
+
+def test_keys_are_due_after_max_delay_while_notifications_keep_coming(clock):
+    debouncer = receiver.Debouncer(delay=5, max_delay=12)
+    due = []
+    for _ in range(20):
+        debouncer.submit((123, 'USDT'))
+        due.append(debouncer.wait_due(0))
+        clock.now += 2
+
+    # Due at 12 seconds after the first notification, then a new window starts
+    assert [index for index, keys in enumerate(due) if keys] == [6, 13]
+
+
+def test_keys_are_debounced_independently(clock):
+    debouncer = receiver.Debouncer(delay=5, max_delay=30)
+    debouncer.submit((1, 'USDT'))
+    clock.now += 3
+    debouncer.submit((2, 'BTC'))
+    clock.now += 2
+
+    assert debouncer.wait_due(0) == {(1, 'USDT')}
+    clock.now += 3
+    assert debouncer.wait_due(0) == {(2, 'BTC')}
+
+
+def test_wait_due_wakes_up_for_a_due_key():
+    debouncer = receiver.Debouncer(delay=0.05, max_delay=1)
+    threading.Timer(0.01, debouncer.submit, args=((1, 'USDT'),)).start()
+
+    assert debouncer.wait_due(timeout=5) == {(1, 'USDT')}
+
+
+def test_wait_due_times_out():
+    assert receiver.Debouncer(delay=1, max_delay=1).wait_due(timeout=0.01) == set()
+
+
+def test_parse_buckets():
+    deal = {
+        'account_id': '123',
+        'pair': 'USDT_BTC',
+        'strategy': 'long',
+        'base_order_volume_type': 'quote_currency',
+        'finished?': True
+    }
+
+    assert receiver.parse_buckets({'account_id': 123, 'currency': 'BTC'}) == [(123, 'BTC')]
+    assert receiver.parse_buckets(deal) == [(123, 'USDT')]
+    assert receiver.parse_buckets([deal, {**deal, 'account_id': 456}]) == [
+        (123, 'USDT'), (456, 'USDT')
+    ]
+    # Deals that did not close yet don't change the balance
+    assert receiver.parse_buckets({**deal, 'finished?': False}) == []
+
+
+@pytest.mark.parametrize('payload, error', [
+    (None, 'account_id'),
+    ([1], 'account_id'),
+    ({'currency': 'USDT'}, 'account_id'),
+    ({'account_id': 'main', 'currency': 'USDT'}, 'account_id needs to be a number'),
+    ({'account_id': 123}, 'needs a currency'),
+    ({'account_id': 123, 'pair': 'USDT_BTC'}, 'needs a currency'),
+])
+def test_invalid_notifications(payload, error):
+    with pytest.raises(ValueError, match=error):
+        receiver.parse_buckets(payload)
@@ -0,0 +1,123 @@
+'''
+Checks the request scheduler retries, Retry-After handling and adaptive concurrency
+'''
+
+import pytest
+
+import scheduler
+
+
+class FakeResponse:
+    def __init__(self, status_code, headers=None):
+        self.status_code = status_code
+        self.headers = headers or {}
+
+
+class FakeSession:
+    def __init__(self):
+        self.hooks = {'response': []}
+
+
+class FakeClient:
+    '''
+    Py3CW stand in, answers with the given (status code, headers) one request at a time
+    '''
+    def __init__(self, responses):
+        self.session = FakeSession()
+        self.responses = list(responses)
+        self.calls = 0
+
+    def request(self, entity, action='', **_kwargs):
+        self.calls += 1
+        status_code, headers = self.responses.pop(0)
+        for hook in self.session.hooks['response']:
+            hook(FakeResponse(status_code, headers))
+        if status_code >= 400:
+            return {'error': True, 'status_code': status_code}, None
+        return {}, {'entity': entity, 'action': action}
+
+
+@pytest.fixture(name='sleeps')
+def fixture_sleeps(monkeypatch):
+    '''
+    Records the retry waits instead of sleeping
+    '''
+    waits = []
+    monkeypatch.setattr(scheduler.time, 'sleep', waits.append)
+    return waits
+
+
+def make_scheduler(client, **kwargs):
+    kwargs.setdefault('requests_per_second', 1000)
+    kwargs.setdefault('burst', 1000)
+    return scheduler.RequestScheduler(lambda: client, **kwargs)
+
+
+def test_parse_retry_after():
+    assert scheduler.parse_retry_after('2.5') == 2.5
+    assert scheduler.parse_retry_after('-1') == 0
+    assert scheduler.parse_retry_after('Thu, 01 Jan 1970 00:00:00 GMT') == 0
+    assert scheduler.parse_retry_after('soon') is None
+    assert scheduler.parse_retry_after(None) is None
+
+
+def test_throttled_request_waits_retry_after(sleeps):
+    client = FakeClient([(429, {'Retry-After': '0'}), (200, {})])
+    request_scheduler = make_scheduler(client)
+
+    error, data = request_scheduler.request(entity='bots', action='')
+
+    assert not error and data == {'entity': 'bots', 'action': ''}
+    assert client.calls == 2
+    assert sleeps == [0]
+    assert request_scheduler.retry_counts['bots'] == 1
+    assert request_scheduler.throttle_counts['bots'] == 1
+
+
+def test_server_errors_back_off_until_max_retries(sleeps):
+    client = FakeClient([(503, {})] * 3)
+    request_scheduler = make_scheduler(client, max_retries=2, backoff_base=1, backoff_max=3)
+
+    error, _ = request_scheduler.request(entity='deals')
+
+    assert error['status_code'] == 503
+    assert client.calls == 3
+    # Full jitter: attempt n waits up to min(backoff_max, backoff_base * 2 ** n)
+    assert len(sleeps) == 2
+    assert 0 <= sleeps[0] <= 1 and 0 <= sleeps[1] <= 2
+
+
+def test_client_errors_are_not_retried(sleeps):
+    client = FakeClient([(404, {})])
+
+    error, _ = make_scheduler(client).request(entity='bots', action='update')
+
+    assert error['status_code'] == 404
+    assert client.calls == 1
+    assert not sleeps
+
+
+def test_throttling_halves_concurrency_and_successes_raise_it(sleeps):
+    client = FakeClient([(429, {'Retry-After': '0'})] * 2 + [(200, {})] * 20)
+    request_scheduler = make_scheduler(client, max_concurrency=8, min_concurrency=1, max_retries=5)
+
+    request_scheduler.request(entity='bots')
+    # Two 429s: 8 -> 4 -> 2
+    assert request_scheduler._concurrency == 2  # pylint: disable=protected-access
+
+    # Additive increase after a full window (the current concurrency) of successes,
+    # the retried request was the first success: 2 successes -> 3, 3 more -> 4
+    for _ in range(4):
+        request_scheduler.request(entity='bots')
+    assert request_scheduler._concurrency == 4  # pylint: disable=protected-access
+    assert len(sleeps) == 2
+
+
+def test_concurrency_never_drops_below_minimum(sleeps):
+    client = FakeClient([(429, {'Retry-After': '0'})] * 6 + [(200, {})])
+    request_scheduler = make_scheduler(client, max_concurrency=4, min_concurrency=2, max_retries=6)
+
+    request_scheduler.request(entity='bots')
+
+    assert request_scheduler._concurrency == 2  # pylint: disable=protected-access
+    assert len(sleeps) == 6
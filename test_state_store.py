@@ -0,0 +1,111 @@
+'''
+Checks which bots the compounding state skips, and the snapshots it keeps
+'''
+
+from types import SimpleNamespace
+
+import pytest
+
+import state_store
+
+
+def make_bot(**settings):
+    bot = {
+        'type': 'Bot::MultiBot', 'pairs': ['USDT_BTC'], 'mstc': 5, 'sos': 2.0, 'os': 1.5,
+        'ss': 1.2, 'bo': 10.0, 'so': 20.0, 'mad': 3, 'adosp': 1
+    }
+    bot.update(settings)
+    return SimpleNamespace(**bot)
+
+
+def make_inputs(balance=1000.0, allocation=0.5, **settings):
+    return state_store.bot_inputs(
+        balance=balance,
+        allocation=allocation,
+        max_active_deals=3,
+        bot_same_pair_multiple=False,
+        bot=make_bot(**settings),
+        optimizer_mode='ratio'
+    )
+
+
+def recorded_store(inputs, balance_tolerance=0.01, path=None):
+    '''
+    :return: store that recorded the inputs of bot 1 in its previous run
+    '''
+    store = state_store.StateStore(path=path, balance_tolerance=balance_tolerance)
+    store.load()
+    store.record(1, inputs)
+    store.save()
+    store.load()
+    return store
+
+
+@pytest.mark.parametrize('balance, unchanged', [
+    (1000.0, True),
+    (1009.9, True),
+    (990.1, True),
+    (1010.2, False),
+    (989.0, False),
+])
+def test_skip_within_balance_tolerance(balance, unchanged):
+    store = recorded_store(make_inputs(balance=1000.0))
+
+    assert store.is_unchanged(1, make_inputs(balance=balance)) is unchanged
+
+
+@pytest.mark.parametrize('changed_inputs', [
+    {'allocation': 0.6},
+    {'mstc': 6},
+    {'pairs': ['USDT_ETH']},
+    # Settings changed on 3c since they were written
+    {'bo': 11.0},
+    {'mad': 4},
+])
+def test_changed_inputs_are_recomputed(changed_inputs):
+    store = recorded_store(make_inputs())
+
+    assert not store.is_unchanged(1, make_inputs(**changed_inputs))
+    assert not store.is_unchanged(2, make_inputs())
+
+
+def test_applied_settings_are_compared_after_an_update():
+    inputs = make_inputs()
+    new_settings = {'bo': 12.0, 'so': 24.0, 'mad': 3, 'adosp': 1}
+    store = recorded_store(state_store.with_applied(inputs, new_settings))
+
+    assert store.is_unchanged(1, make_inputs(bo=12.0, so=24.0))
+    assert not store.is_unchanged(1, inputs)
+
+
+def test_kept_snapshots_do_not_drift_past_the_tolerance(tmp_path):
+    path = str(tmp_path / 'state.json')
+    store = recorded_store(make_inputs(balance=1000.0), path=path)
+
+    # Every run grows 0.6%, each step is within 1% but the total is not
+    for balance in (1006.0, 1012.0):
+        if store.is_unchanged(1, make_inputs(balance=balance)):
+            store.keep(1)
+        store.save()
+        store.load()
+
+    assert not store.is_unchanged(1, make_inputs(balance=1012.0))
+
+
+def test_partial_runs_keep_the_other_snapshots(tmp_path):
+    path = str(tmp_path / 'state.json')
+    store = recorded_store(make_inputs(), path=path)
+
+    store.load(partial=True)
+    store.record(2, make_inputs())
+    store.save()
+    store.load()
+    assert store.is_unchanged(1, make_inputs())
+    assert store.is_unchanged(2, make_inputs())
+
+    # A full run only keeps the bots it saw
+    store.load()
+    store.record(2, make_inputs())
+    store.save()
+    store.load()
+    assert not store.is_unchanged(1, make_inputs())
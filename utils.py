@@ -1,8 +1,8 @@
 '''
 Some utils
 '''
-# AWS
-import boto3
+
+from typing import Any
 
 def parameter_dict_getter(_secret_parameters_result):
     '''
@@ -16,11 +16,26 @@ def parameter_dict_getter(_secret_parameters_result):
         constructed_secrets_dict[value_key] = params["Value"]
     return constructed_secrets_dict
 
+# service name: boto client
+_boto_clients: dict[str, Any] = {}
+
+def get_boto_client(service):
+    '''
+    Boto clients are created once and reused by warm lambda invocations
+    :param service: aws service name, i.e. s3
+    '''
+    if service not in _boto_clients:
+        # AWS, only imported when needed to keep imports fast
+        import boto3  # pylint: disable=import-outside-toplevel
+
+        _boto_clients[service] = boto3.client(service)
+    return _boto_clients[service]
+
 def get_param_dict_from_ssm(parameters):
     '''
     Connects to ssm given the parameters to get
     '''
-    boto_client = boto3.client("ssm")
+    boto_client = get_boto_client("ssm")
 
     secret_parameters_result = boto_client.get_parameters(
         Names=parameters,
@@ -28,3 +43,27 @@ def get_param_dict_from_ssm(parameters):
     )
     secret_dict = parameter_dict_getter(secret_parameters_result)
     return secret_dict
+
+def get_s3_object_if_changed(bucket, key, etag=None):
+    '''
+    Conditional s3 get, only returns the body when the object does not match the etag
+    :param bucket: s3 bucket name
+    :param key: s3 object key
+    :param etag: etag of the copy we already have, None to always download
+    :return: tuple with (etag, body bytes), body is None if the object did not change
+    '''
+    # AWS, only imported when needed to keep imports fast
+    from botocore.exceptions import ClientError  # pylint: disable=import-outside-toplevel
+
+    request = {'Bucket': bucket, 'Key': key}
+    if etag:
+        request['IfNoneMatch'] = etag
+
+    try:
+        response = get_boto_client('s3').get_object(**request)
+    except ClientError as error:
+        if error.response['Error']['Code'] in ('304', 'NotModified'):
+            return etag, None
+        raise
+
+    return response['ETag'], response['Body'].read()
@@ -2,27 +2,34 @@
 Handle discord webhooks
 """
 
+import atexit
 import configparser
+import queue
+import threading
+import time
 
+from typing import Optional
 from genericpath import exists
-import requests
+import bootstrap
+import http_session
 import logger
-import utils
 
 
 LOCAL = exists('config.ini')
 
+config: Optional[configparser.ConfigParser] = None
 if LOCAL:
     # Parse/Read config.ini we're locally running this
     config = configparser.ConfigParser()
     config.read('config.ini')
-    webhook_url = config.get('discord', 'webhook_url')
-else:
-    # Get parameter from AWS parameter store
-    secret_parameters = [
-        "/3commas-compounder/webhook_url",
-    ]
-    webhook_url = utils.get_param_dict_from_ssm(secret_parameters)['webhook_url']
+
+
+def get_webhook_url():
+    '''
+    Webhook url from config.ini locally or the parameter store in lambda,
+    fetched with the other secrets on first use
+    '''
+    return bootstrap.get_secrets(config)['webhook_url']
 
 
 MESSAGE_TYPE_EMOJI = {
@@ -43,10 +50,152 @@ TEST_MODE_MESSAGE_DICT = {
 }
 
 
+# Discord webhook limits
+MAX_EMBEDS_PER_MESSAGE = 10
+MAX_EMBED_CHARACTERS_PER_MESSAGE = 6000
+MAX_EMBED_DESCRIPTION_CHARACTERS = 4096
+# Seconds the notifier waits for more messages to pack into one post
+BATCH_LINGER = 1.0
+
+_embed_queue: queue.Queue[dict] = queue.Queue()
+_flush_requested = threading.Event()
+_worker = None
+_worker_lock = threading.Lock()
+
+
+def _embed_size(embed: dict) -> int:
+    return len(embed['title']) + len(embed['description'])
+
+
+def _post(discord_message: dict):
+    '''
+    Posts to the webhook, waits out discord rate limits
+    :param discord_message: webhook payload
+    :return: http status code of the post, None if there is no webhook
+    '''
+    url = get_webhook_url()
+    if not url:
+        # Notifications are optional
+        return None
+
+    while True:
+        resp = http_session.get_session().post(url, json=discord_message, timeout=10)
+        logger.log(resp, "INFO")
+
+        if resp.status_code == 429:
+            # Rate limited, retry_after is in seconds
+            try:
+                retry_after = float(resp.json().get('retry_after', 1))
+            except ValueError:
+                retry_after = float(resp.headers.get('Retry-After', 1))
+            time.sleep(retry_after)
+            continue
+
+        # Bucket exhausted, wait for the reset before the next post
+        if resp.headers.get('X-RateLimit-Remaining') == '0':
+            time.sleep(float(resp.headers.get('X-RateLimit-Reset-After', 0)))
+        return resp.status_code
+
+
+def _send(embeds: list):
+    '''
+    Posts the embeds, discord rejects the whole post for a single bad embed,
+    so a rejected post is split until only the bad embeds are left out
+    :param embeds: embeds to post
+    '''
+    if _post({'embeds': embeds}) != 400:
+        return
+
+    if len(embeds) == 1:
+        logger.log('Discord rejected notification: %s', "ERROR", embeds[0]['description'])
+        return
+
+    middle = len(embeds) // 2
+    _send(embeds[:middle])
+    _send(embeds[middle:])
+
+
+def _next_batch(carry):
+    '''
+    Blocks for the first embed, then packs as many queued embeds as discord allows
+    :param carry: embed that didn't fit in the previous post, None if there is none
+    :return: tuple with (embeds to post, embed that didn't fit or None)
+    '''
+    embeds = [carry if carry is not None else _embed_queue.get()]
+    size = _embed_size(embeds[0])
+    linger_until = time.monotonic() + BATCH_LINGER
+
+    while len(embeds) < MAX_EMBEDS_PER_MESSAGE:
+        timeout = 0 if _flush_requested.is_set() else linger_until - time.monotonic()
+        try:
+            embed = _embed_queue.get(timeout=timeout) if timeout > 0 else _embed_queue.get_nowait()
+        except queue.Empty:
+            break
+
+        if size + _embed_size(embed) > MAX_EMBED_CHARACTERS_PER_MESSAGE:
+            # Doesn't fit, goes first in the next post
+            return embeds, embed
+        embeds.append(embed)
+        size += _embed_size(embed)
+
+    return embeds, None
+
+
+def _send_batches():
+    '''
+    Notifier worker, sends queued embeds in the background
+    '''
+    carry = None
+    while True:
+        embeds, carry = _next_batch(carry)
+        try:
+            _send(embeds)
+        except Exception as error:  # pylint: disable=broad-except
+            # Notifications should never break the compounder
+            logger.log('Could not send webhook: %s', "ERROR", error)
+        finally:
+            for _ in embeds:
+                _embed_queue.task_done()
+
+
+def _ensure_worker():
+    global _worker  # pylint: disable=global-statement
+    with _worker_lock:
+        if _worker is None or not _worker.is_alive():
+            _worker = threading.Thread(target=_send_batches, name='webhook-notifier', daemon=True)
+            _worker.start()
+
+
+def flush(timeout: float = 30):
+    '''
+    Waits until every queued notification has been sent
+    :param timeout: max seconds to wait
+    :return: True if everything got sent
+    '''
+    _flush_requested.set()
+    deadline = time.monotonic() + timeout
+    try:
+        with _embed_queue.all_tasks_done:
+            while _embed_queue.unfinished_tasks:
+                remaining = deadline - time.monotonic()
+                if remaining <= 0:
+                    logger.log('Timed out sending webhook notifications', "WARNING")
+                    return False
+                _embed_queue.all_tasks_done.wait(remaining)
+        return True
+    finally:
+        _flush_requested.clear()
+
+
+# Local runs exit without calling flush on errors
+atexit.register(flush)
+
+
 def notify_webhook(message: str, message_type: str):
     '''
-    Helper function to send error messages to telegram
-    :param message: message to send to webhook
+    Helper function to send error messages to telegram.
+    The message is queued and sent in the background, call flush at the end of a run.
+    :param message: message to send to webhook, anything else than a string is sent as str()
     :param message_type: INFO, WARNING, ERROR
     :param real_signal: boolean
     :return:
@@ -55,18 +204,17 @@ def notify_webhook(message: str, message_type: str):
     # log a message based on warning level
     logger.log(message=message, message_type=message_type)
 
-    discord_message = {
-        'embeds': [
-            {
-                "title": (
-                    f'{MESSAGE_TYPE_EMOJI[message_type]} Compounder '
-                    f'{message_type}{TEST_MODE_MESSAGE_DICT[str(LOCAL)]}'
-                ),
-                "color": MESSAGE_TYPE_COLOR[message_type],
-                "description": message
-            }
-        ]
-    }
-
-    resp = requests.post(webhook_url, json=discord_message)
-    logger.log(resp, "INFO")
+    description = str(message)
+    if len(description) > MAX_EMBED_DESCRIPTION_CHARACTERS:
+        # Discord rejects longer descriptions, the full message is in the log
+        description = description[:MAX_EMBED_DESCRIPTION_CHARACTERS - 1] + '…'
+
+    _embed_queue.put({
+        "title": (
+            f'{MESSAGE_TYPE_EMOJI[message_type]} Compounder '
+            f'{message_type}{TEST_MODE_MESSAGE_DICT[str(LOCAL)]}'
+        ),
+        "color": MESSAGE_TYPE_COLOR[message_type],
+        "description": description
+    })
+    _ensure_worker()